@@ -6,6 +6,12 @@ from .models import (
     DeductionType,
     Payslip,
     PayslipItem,
+    ShiftSchedule,
+    ShiftAssignment,
+    AttendanceDevice,
+    AttendanceDeviceEvent,
+    WriteJob,
+    PayrollRun,
 )
 
 
@@ -27,7 +33,7 @@ class PayrollPeriodAdmin(admin.ModelAdmin):
     def generate_payslips_action(self, request, queryset):
         count_periods = 0
         for period in queryset:
-            period.generate_payslips()
+            period.generate_payslips(user=request.user)
             count_periods += 1
 
         self.message_user(
@@ -85,3 +91,76 @@ class PayslipAdmin(admin.ModelAdmin):
             f"คำนวณประกันสังคม + ภาษี ให้ {count} payslip เรียบร้อยแล้ว",
             level=messages.SUCCESS
         )
+
+
+@admin.register(ShiftSchedule)
+class ShiftScheduleAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'start_time', 'end_time', 'late_after_minutes', 'is_overnight')
+    search_fields = ('code', 'name')
+
+
+@admin.register(ShiftAssignment)
+class ShiftAssignmentAdmin(admin.ModelAdmin):
+    list_display = ('shift', 'employee', 'department', 'effective_from', 'effective_to')
+    list_filter = ('shift', 'department')
+    search_fields = ('employee__code', 'employee__first_name', 'department')
+    autocomplete_fields = ('employee',)
+
+
+@admin.register(AttendanceDevice)
+class AttendanceDeviceAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'is_active', 'last_seen_at')
+    list_filter = ('is_active',)
+    search_fields = ('code', 'name')
+    readonly_fields = ('last_seen_at',)
+
+    actions = ['issue_new_token']
+
+    def save_model(self, request, obj, form, change):
+        token = None
+        if not obj.token_hash:
+            token = obj.set_new_token()
+        super().save_model(request, obj, form, change)
+        if token:
+            self.message_user(
+                request,
+                f"token ของเครื่อง {obj.code}: {token} (แสดงครั้งเดียว กรุณาบันทึกไว้)",
+                level=messages.WARNING
+            )
+
+    @admin.action(description="ออก token ใหม่ให้เครื่องที่เลือก (token เดิมใช้ไม่ได้ทันที)")
+    def issue_new_token(self, request, queryset):
+        for device in queryset:
+            token = device.set_new_token()
+            device.save(update_fields=['token_hash'])
+            self.message_user(
+                request,
+                f"token ใหม่ของเครื่อง {device.code}: {token} (แสดงครั้งเดียว กรุณาบันทึกไว้)",
+                level=messages.WARNING
+            )
+
+
+@admin.register(AttendanceDeviceEvent)
+class AttendanceDeviceEventAdmin(admin.ModelAdmin):
+    list_display = ('device', 'event_id', 'employee_code', 'kind', 'occurred_at', 'work_date', 'received_at')
+    list_filter = ('device', 'kind')
+    search_fields = ('event_id', 'employee_code')
+    date_hierarchy = 'work_date'
+
+
+@admin.register(WriteJob)
+class WriteJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'label', 'status', 'requested_by', 'enqueued_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('label',)
+    # payload ของงานนำเข้ามีไฟล์ทั้งไฟล์ ไม่แสดงในฟอร์ม
+    exclude = ('payload',)
+    readonly_fields = ('kind', 'label', 'status', 'result', 'error', 'requested_by',
+                       'enqueued_at', 'started_at', 'finished_at')
+
+
+@admin.register(PayrollRun)
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ('period', 'kind', 'started_at', 'duration_ms', 'employee_count', 'query_count', 'run_by')
+    list_filter = ('kind', 'period')
+    readonly_fields = ('period', 'kind', 'started_at', 'duration_ms', 'employee_count', 'query_count', 'spans', 'run_by')
@@ -0,0 +1,181 @@
+"""
+สถิติการเข้างานเชิงวิเคราะห์ (อันดับมาสาย / ขาดติดต่อกัน / แนวโน้มตรงเวลารายเดือน)
+
+คำนวณใน DB ด้วย window function (SQLite >= 3.25 / PostgreSQL) แล้ว cache ผลไว้
+ต่อ (metric, ช่วงวันที่, แผนก, สถานะของ rollup)
+
+key ของ cache มาจากสถานะใน DB (id ล่าสุด + จำนวนแถวของ AttendanceMonthlySummary ในปีที่ถาม)
+ไม่ใช่ตัวนับใน cache: LocMemCache แยกต่อ process การล้างจาก process ที่เขียนจึงไม่ถึง worker อื่น
+rollup ถูกลบแล้วสร้างใหม่ทุกครั้งที่ข้อมูลเข้างานเปลี่ยน (id ไม่ถูกใช้ซ้ำ) -> key เปลี่ยนเองทุก process
+"""
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Max
+
+from .models import AttendanceRecord, AttendanceMonthlySummary, Employee
+
+
+ANALYTICS_CACHE_TIMEOUT = 60 * 60  # 1 ชั่วโมง
+ANALYTICS_ROW_LIMIT = 50
+
+
+def analytics_data_version(start, end):
+    """
+    ลายเซ็นของข้อมูลเข้างานในปีของช่วงที่ถาม (1 aggregate query บนตาราง rollup)
+    """
+    state = AttendanceMonthlySummary.objects.filter(year__range=(start.year, end.year)).aggregate(
+        last_id=Max('id'), rows=Count('id'),
+    )
+    return f"{state['last_id'] or 0}.{state['rows']}"
+
+
+def _cached(metric, start, end, department, compute):
+    version = analytics_data_version(start, end)
+    key = f"hr_analytics:{version}:{metric}:{start}:{end}:{department or '*'}"
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, ANALYTICS_CACHE_TIMEOUT)
+    return result
+
+
+def _fetch_dicts(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _as_date(value):
+    # SQLite คืนวันที่จาก raw SQL เป็น string
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def _tables():
+    return {
+        'att': connection.ops.quote_name(AttendanceRecord._meta.db_table),
+        'emp': connection.ops.quote_name(Employee._meta.db_table),
+        'summary': connection.ops.quote_name(AttendanceMonthlySummary._meta.db_table),
+    }
+
+
+def lateness_ranking(start, end, department=None, limit=ANALYTICS_ROW_LIMIT):
+    """
+    อันดับพนักงานที่มาสายบ่อยที่สุดในช่วง
+    - overall_rank = อันดับทั้งบริษัท, dept_rank = อันดับในแผนก (RANK() OVER ...)
+    """
+    def compute():
+        dept_sql = "AND e.department = %s" if department else ""
+        sql = """
+            SELECT e.id AS employee_id, e.code, e.first_name, e.last_name, e.department,
+                   COUNT(*) AS late_count,
+                   RANK() OVER (ORDER BY COUNT(*) DESC) AS overall_rank,
+                   RANK() OVER (PARTITION BY e.department ORDER BY COUNT(*) DESC) AS dept_rank
+            FROM {att} a
+            JOIN {emp} e ON e.id = a.employee_id
+            WHERE a.status = 'late' AND a.work_date BETWEEN %s AND %s {dept_sql}
+            GROUP BY e.id, e.code, e.first_name, e.last_name, e.department
+            ORDER BY late_count DESC, e.code
+            LIMIT %s
+        """.format(dept_sql=dept_sql, **_tables())
+        params = [start, end] + ([department] if department else []) + [limit]
+        return _fetch_dicts(sql, params)
+
+    return _cached('lateness', start, end, department, compute)
+
+
+def absence_streaks(start, end, department=None, min_days=2, limit=ANALYTICS_ROW_LIMIT):
+    """
+    ช่วงที่ขาดงานติดต่อกัน (gaps-and-islands)
+    - นับต่อเนื่องตามลำดับ record ของพนักงาน (เสาร์-อาทิตย์ที่ไม่มี record ไม่ตัดช่วง)
+    - grp = ROW_NUMBER ทุกสถานะ - ROW_NUMBER เฉพาะสถานะเดียวกัน -> ค่าเท่ากัน = ช่วงเดียวกัน
+    """
+    def compute():
+        dept_sql = "AND e.department = %s" if department else ""
+        sql = """
+            WITH seq AS (
+                SELECT a.employee_id, a.work_date, a.status,
+                       ROW_NUMBER() OVER (PARTITION BY a.employee_id ORDER BY a.work_date)
+                       - ROW_NUMBER() OVER (PARTITION BY a.employee_id, a.status ORDER BY a.work_date) AS grp
+                FROM {att} a
+                JOIN {emp} e ON e.id = a.employee_id
+                WHERE a.work_date BETWEEN %s AND %s {dept_sql}
+            ),
+            streaks AS (
+                SELECT employee_id, grp,
+                       MIN(work_date) AS start_date,
+                       MAX(work_date) AS end_date,
+                       COUNT(*) AS days
+                FROM seq
+                WHERE status = 'absent'
+                GROUP BY employee_id, grp
+            )
+            SELECT s.employee_id, e.code, e.first_name, e.last_name, e.department,
+                   s.start_date, s.end_date, s.days,
+                   RANK() OVER (ORDER BY s.days DESC) AS streak_rank
+            FROM streaks s
+            JOIN {emp} e ON e.id = s.employee_id
+            WHERE s.days >= %s
+            ORDER BY s.days DESC, e.code, s.start_date
+            LIMIT %s
+        """.format(dept_sql=dept_sql, **_tables())
+        params = [start, end] + ([department] if department else []) + [min_days, limit]
+        rows = _fetch_dicts(sql, params)
+        for row in rows:
+            row['start_date'] = _as_date(row['start_date'])
+            row['end_date'] = _as_date(row['end_date'])
+        return rows
+
+    return _cached(f'streaks:{min_days}', start, end, department, compute)
+
+
+def punctuality_trend(start, end, department=None):
+    """
+    อัตรามาตรงเวลา (present / (present + late)) ต่อแผนก ต่อเดือน
+    เทียบกับเดือนก่อนหน้าด้วย LAG() OVER (PARTITION BY แผนก ORDER BY ปี, เดือน)
+    อ่านจาก rollup AttendanceMonthlySummary (ไม่สแกน AttendanceRecord)
+    """
+    def compute():
+        dept_sql = "AND e.department = %s" if department else ""
+        sql = """
+            WITH monthly AS (
+                SELECT COALESCE(e.department, '') AS department, s.year, s.month,
+                       SUM(CASE WHEN s.status = 'present' THEN s.count ELSE 0 END) AS present,
+                       SUM(CASE WHEN s.status = 'late' THEN s.count ELSE 0 END) AS late
+                FROM {summary} s
+                JOIN {emp} e ON e.id = s.employee_id
+                WHERE (s.year * 100 + s.month) BETWEEN %s AND %s {dept_sql}
+                GROUP BY COALESCE(e.department, ''), s.year, s.month
+            )
+            SELECT department, year, month, present, late,
+                   LAG(present) OVER (PARTITION BY department ORDER BY year, month) AS prev_present,
+                   LAG(late) OVER (PARTITION BY department ORDER BY year, month) AS prev_late
+            FROM monthly
+            ORDER BY department, year, month
+        """.format(dept_sql=dept_sql, **_tables())
+        params = [start.year * 100 + start.month, end.year * 100 + end.month]
+        if department:
+            params.append(department)
+
+        rows = _fetch_dicts(sql, params)
+        for row in rows:
+            row['on_time_rate'] = _rate(row['present'], row['late'])
+            prev_rate = _rate(row['prev_present'], row['prev_late'])
+            row['change'] = (
+                round(row['on_time_rate'] - prev_rate, 1)
+                if row['on_time_rate'] is not None and prev_rate is not None
+                else None
+            )
+        return rows
+
+    return _cached('punctuality', start, end, department, compute)
+
+
+def _rate(present, late):
+    if present is None or late is None or (present + late) == 0:
+        return None
+    return round(100.0 * present / (present + late), 1)
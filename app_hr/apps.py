@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AppHrConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_hr'
+
+    def ready(self):
+        from .db import configure_sqlite_connection
+        from .slowqueries import install_slow_query_log
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='app_hr_sqlite_pragmas')
+        connection_created.connect(install_slow_query_log, dispatch_uid='app_hr_slow_query_log')
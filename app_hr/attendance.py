@@ -0,0 +1,467 @@
+"""
+ฟังก์ชันคำนวณข้อมูลการเข้างานแบบ 'ทีละก้อน' (set-based)
+ใช้จำนวน query คงที่ ไม่ขึ้นกับจำนวนพนักงาน / จำนวนวัน
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from .models import (
+    PayrollPeriod,
+    calculate_attendance_status,
+    Employee,
+    Holiday,
+    LeaveRecord,
+    AttendanceRecord,
+    AttendanceMonthlySummary,
+)
+from .shifts import ShiftLookup
+
+
+STATUS_KEYS = ('present', 'late', 'absent', 'leave', 'holiday')
+
+# จำกัดช่วงวันที่ของกระดานสรุป กันคนเปิดช่วงยาวเกินจน response ใหญ่เกินไป
+MAX_BOARD_DAYS = 31
+
+
+def iter_dates(start, end):
+    """
+    วนวันที่ตั้งแต่ start ถึง end (รวมทั้งสองวัน)
+    """
+    cur = start
+    while cur <= end:
+        yield cur
+        if cur == date.max:  # 9999-12-31 บวกต่อไม่ได้
+            return
+        cur += timedelta(days=1)
+
+
+def get_holiday_dates(start, end):
+    """
+    set ของวันหยุดในช่วง (1 query)
+    """
+    return set(
+        Holiday.objects.filter(date__range=(start, end))
+        .values_list('date', flat=True)
+    )
+
+
+def get_leave_day_set(start, end, employee_ids=None):
+    """
+    set ของ (employee_id, date) ที่มีการลาแบบอนุมัติแล้วครอบอยู่ (1 query)
+    - ตัดช่วงลาให้อยู่ในช่วง start..end ก่อนแตกเป็นรายวัน
+    """
+    leave_qs = LeaveRecord.objects.filter(
+        status='approved',
+        start_date__lte=end,
+        end_date__gte=start,
+    )
+    if employee_ids is not None:
+        leave_qs = leave_qs.filter(employee_id__in=employee_ids)
+
+    leave_days = set()
+    for emp_id, lr_start, lr_end in leave_qs.values_list('employee_id', 'start_date', 'end_date'):
+        for d in iter_dates(max(lr_start, start), min(lr_end, end)):
+            leave_days.add((emp_id, d))
+    return leave_days
+
+
+def build_attendance_board(start, end, department=None):
+    """
+    สร้างกระดานสรุปการเข้างานของพนักงาน active ทุกคน ในช่วง start..end
+
+    ใช้ query คงที่:
+      1) พนักงาน active (กรองแผนกได้)
+      2) AttendanceRecord ทั้งช่วง
+      3) LeaveRecord ที่อนุมัติแล้วและทับช่วง
+      4) Holiday ในช่วง
+
+    คืนค่า (rows, status_counts)
+    - rows เรียงตามวันที่ แล้วตามรหัสพนักงาน
+    - status_counts = {'present': n, 'late': n, ...} นับไปพร้อมกับสร้าง rows
+    """
+    employees = Employee.objects.filter(status='active').order_by('code')
+    if department:
+        employees = employees.filter(department=department)
+    employees = list(employees)
+    emp_ids = [e.id for e in employees]
+
+    attendance_map = {
+        (a.employee_id, a.work_date): a
+        for a in AttendanceRecord.objects.filter(
+            work_date__range=(start, end),
+            employee_id__in=emp_ids,
+        )
+    }
+    leave_days = get_leave_day_set(start, end, employee_ids=emp_ids)
+    holiday_dates = get_holiday_dates(start, end)
+
+    status_counts = {key: 0 for key in STATUS_KEYS}
+    rows = []
+
+    for d in iter_dates(start, end):
+        is_holiday = d in holiday_dates
+        for emp in employees:
+            att = attendance_map.get((emp.id, d))
+
+            # ถ้าไม่มี record ประเมินจากวันหยุด / ลา
+            status = 'absent'
+            check_in = None
+            check_out = None
+            remark = ''
+
+            if is_holiday:
+                status = 'holiday'
+            elif (emp.id, d) in leave_days:
+                status = 'leave'
+
+            if att:
+                # ใช้สถานะจาก AttendanceRecord (ซึ่งคำนวนไว้แล้ว)
+                status = att.status
+                check_in = att.check_in
+                check_out = att.check_out
+                remark = att.remark or ''
+
+            status_counts[status] = status_counts.get(status, 0) + 1
+            rows.append({
+                'date': d,
+                'employee': emp,
+                'status': status,
+                'check_in': check_in,
+                'check_out': check_out,
+                'remark': remark,
+            })
+
+    return rows, status_counts
+
+
+# รหัสสถานะ 1 ตัวอักษร สำหรับเก็บตาราง พนักงาน × วัน แบบประหยัด (1 byte ต่อช่อง)
+STATUS_CODES = {
+    'present': 'P',
+    'late': 'L',
+    'absent': 'A',
+    'leave': 'V',
+    'holiday': 'H',
+}
+CODE_NO_RECORD = '-'
+CODE_LABELS = {
+    'P': 'ปกติ',
+    'L': 'สาย',
+    'A': 'ขาด',
+    'V': 'ลา',
+    'H': 'วันหยุด',
+    CODE_NO_RECORD: 'ไม่มีบันทึก',
+}
+
+
+def build_month_matrix(employee_ids, first_day, last_day):
+    """
+    เติมตาราง พนักงาน × วัน จาก AttendanceRecord ด้วย range query เดียว
+
+    คืน dict {employee_id: bytearray} โดย index ที่ i = วันที่ first_day + i
+    แต่ละช่องเป็นรหัสตาม STATUS_CODES (ไม่มี record = CODE_NO_RECORD)
+    """
+    day_count = (last_day - first_day).days + 1
+    no_record = ord(CODE_NO_RECORD)
+    matrix = {emp_id: bytearray([no_record]) * day_count for emp_id in employee_ids}
+
+    att_rows = AttendanceRecord.objects.filter(
+        employee_id__in=employee_ids,
+        work_date__range=(first_day, last_day),
+    ).values_list('employee_id', 'work_date', 'status')
+
+    for emp_id, work_date, status in att_rows:
+        code = STATUS_CODES.get(status)
+        if code:
+            matrix[emp_id][(work_date - first_day).days] = ord(code)
+
+    return matrix
+
+
+# ===== Rollup: พนักงาน × เดือน × สถานะ =====
+
+ROLLUP_CHUNK_SIZE = 500
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def refresh_attendance_rollup(keys):
+    """
+    คำนวณ AttendanceMonthlySummary ใหม่ เฉพาะ (employee_id, year, month) ที่ส่งมา
+
+    เรียกหลังเขียน AttendanceRecord (import / แก้สถานะ / ปิดวัน)
+    ใช้ 1 GROUP BY query ต่อเดือนต่อก้อนพนักงาน แล้วเขียนแทนที่ทั้งก้อน
+    """
+    by_month = defaultdict(set)
+    for emp_id, year, month in keys:
+        by_month[(year, month)].add(emp_id)
+
+    with transaction.atomic():
+        for (year, month), emp_ids in by_month.items():
+            first_day = date(year, month, 1)
+            last_day = date(year, month, calendar.monthrange(year, month)[1])
+
+            for chunk in _chunks(emp_ids, ROLLUP_CHUNK_SIZE):
+                counts = (
+                    AttendanceRecord.objects
+                    .filter(employee_id__in=chunk, work_date__range=(first_day, last_day))
+                    .values('employee_id', 'status')
+                    .annotate(c=Count('id'))
+                    .order_by()
+                )
+                AttendanceMonthlySummary.objects.filter(
+                    employee_id__in=chunk, year=year, month=month,
+                ).delete()
+                AttendanceMonthlySummary.objects.bulk_create([
+                    AttendanceMonthlySummary(
+                        employee_id=row['employee_id'],
+                        year=year,
+                        month=month,
+                        status=row['status'],
+                        count=row['c'],
+                    )
+                    for row in counts
+                ])
+
+
+def rebuild_attendance_rollup(year=None):
+    """
+    ล้างแล้วสร้าง AttendanceMonthlySummary ใหม่ทั้งหมด (หรือเฉพาะปีที่ระบุ)
+    คืนจำนวนแถว summary ที่สร้าง
+    """
+    att_qs = AttendanceRecord.objects.all()
+    summary_qs = AttendanceMonthlySummary.objects.all()
+    if year:
+        att_qs = att_qs.filter(work_date__year=year)
+        summary_qs = summary_qs.filter(year=year)
+
+    counts = (
+        att_qs
+        .annotate(y=ExtractYear('work_date'), m=ExtractMonth('work_date'))
+        .values('employee_id', 'y', 'm', 'status')
+        .annotate(c=Count('id'))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        summary_qs.delete()
+        objs = [
+            AttendanceMonthlySummary(
+                employee_id=row['employee_id'],
+                year=row['y'],
+                month=row['m'],
+                status=row['status'],
+                count=row['c'],
+            )
+            for row in counts.iterator()
+        ]
+        AttendanceMonthlySummary.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
+
+
+def get_month_status_counts(year, employee=None):
+    """
+    อ่านสรุปรายเดือนจาก rollup (ไม่แตะ AttendanceRecord)
+    คืน {month: {'present': n, 'late': n, ...}} ครบ 12 เดือน
+    - employee=None = รวมทั้งบริษัท
+    """
+    result = {m: {key: 0 for key in STATUS_KEYS} for m in range(1, 13)}
+
+    qs = AttendanceMonthlySummary.objects.filter(year=year)
+    if employee is not None:
+        qs = qs.filter(employee=employee)
+
+    rows = qs.values('month', 'status').annotate(c=Sum('count')).order_by()
+    for row in rows:
+        result[row['month']][row['status']] = row['c'] or 0
+    return result
+
+
+# ===== คำนวณสถานะเข้างานใหม่ทั้งก้อน (หลังแก้ตั้งค่า / วันหยุด) =====
+
+RESTATUS_CHUNK_SIZE = 2000
+
+
+class AttendanceStatusResolver:
+    """
+    preload ทุกอย่างที่ใช้คำนวณสถานะเข้างานในช่วง start..end ครั้งเดียว
+    (ตั้งค่าบริษัท, วันหยุด, การลา, กะการทำงาน) แล้วคำนวณทีละ record ใน memory
+    """
+
+    def __init__(self, start, end, employee_ids=None):
+        self.holiday_dates = get_holiday_dates(start, end)
+        self.leave_days = get_leave_day_set(start, end, employee_ids=employee_ids)
+        self.shifts = ShiftLookup(start, end, employee_ids=employee_ids)
+
+    def status_for(self, employee_id, work_date, check_in):
+        rule = self.shifts.get(employee_id, work_date)
+        return calculate_attendance_status(
+            work_date,
+            check_in,
+            is_holiday=work_date in self.holiday_dates,
+            on_leave=(employee_id, work_date) in self.leave_days,
+            work_start_time=rule.start_time,
+            late_after_minutes=rule.late_after_minutes,
+            work_end_time=rule.end_time,
+        )
+
+
+def recompute_attendance_statuses(start, end, dates=None):
+    """
+    คำนวณ AttendanceRecord.status ใหม่ตามกฎปัจจุบัน ในช่วง start..end
+    - dates = set ของวันที่ (ถ้าส่งมา จะทำเฉพาะวันเหล่านั้น เช่น วันหยุดที่เพิ่ง เพิ่ม/ลบ)
+    - อ่านทีละก้อนตาม id แล้วเขียนด้วย UPDATE ... WHERE id IN (...) แยกตามสถานะใหม่
+    - เขียนเฉพาะ record ที่สถานะเปลี่ยนจริง แล้วอัปเดต rollup ของเดือนที่โดน
+
+    คืน (changed_count, changed_dates)
+    """
+    resolver = AttendanceStatusResolver(start, end)
+
+    att_qs = AttendanceRecord.objects.filter(work_date__range=(start, end))
+    if dates is not None:
+        att_qs = att_qs.filter(work_date__in=dates)
+    att_qs = att_qs.order_by('id').values_list('id', 'employee_id', 'work_date', 'check_in', 'status')
+
+    changed_count = 0
+    changed_dates = set()
+    touched_months = set()
+    last_id = 0
+
+    while True:
+        chunk = list(att_qs.filter(id__gt=last_id)[:RESTATUS_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        ids_by_status = defaultdict(list)
+        for att_id, emp_id, work_date, check_in, old_status in chunk:
+            new_status = resolver.status_for(emp_id, work_date, check_in)
+            if new_status != old_status:
+                ids_by_status[new_status].append(att_id)
+                changed_dates.add(work_date)
+                touched_months.add((emp_id, work_date.year, work_date.month))
+
+        with transaction.atomic():
+            for new_status, ids in ids_by_status.items():
+                changed_count += AttendanceRecord.objects.filter(id__in=ids).update(status=new_status)
+
+    if touched_months:
+        refresh_attendance_rollup(touched_months)
+
+    return changed_count, changed_dates
+
+
+def get_open_period_range():
+    """
+    ช่วงวันที่ครอบงวดเงินเดือนที่ยังไม่ปิดทั้งหมด (start, end) หรือ None ถ้าไม่มีงวดเปิด
+    """
+    open_periods = PayrollPeriod.objects.filter(is_closed=False)
+    bounds = open_periods.aggregate(start=Min('start_date'), end=Max('end_date'))
+    if not bounds['start']:
+        return None
+    return bounds['start'], bounds['end']
+
+
+def get_dirty_periods(changed_dates):
+    """
+    งวดเงินเดือนที่ครอบวันที่ซึ่งสถานะเข้างานเพิ่งเปลี่ยน (ต้องรันเงินเดือนใหม่)
+    """
+    if not changed_dates:
+        return []
+    # ช่วงวันที่ที่เปลี่ยนมักต่อกัน ลดเงื่อนไขให้เหลือแค่ min/max ก่อนกรองละเอียดใน Python
+    candidates = PayrollPeriod.objects.filter(
+        start_date__lte=max(changed_dates),
+        end_date__gte=min(changed_dates),
+    ).order_by('year', 'month')
+    return [
+        p for p in candidates
+        if any(p.start_date <= d <= p.end_date for d in changed_dates)
+    ]
+
+
+# ===== ปิดวัน: สร้าง record absent / leave / holiday ให้คนที่ไม่มีบันทึก =====
+
+CLOSE_DAY_CHUNK_DAYS = 7
+
+
+def close_attendance_days(start, end, chunk_days=CLOSE_DAY_CHUNK_DAYS):
+    """
+    สร้าง AttendanceRecord แบบ explicit ให้พนักงาน active ทุกคนที่ยังไม่มี record
+    ในแต่ละวันทำงาน (จ.-ศ.) ของช่วง start..end
+      - วันหยุด -> holiday
+      - ลาที่อนุมัติแล้ว -> leave
+      - นอกนั้น -> absent
+
+    - ข้ามวันก่อน hire_date ของพนักงาน
+    - ไม่แตะ record ที่มีอยู่แล้ว (รันซ้ำได้ ผลเหมือนเดิม)
+    - ทำทีละ chunk_days วัน ต่อ 1 transaction
+
+    คืนจำนวน record ที่สร้าง
+    """
+    employees = list(
+        Employee.objects.filter(status='active').values_list('id', 'hire_date')
+    )
+    emp_ids = [emp_id for emp_id, _ in employees]
+    created = 0
+
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+
+        existing = set(
+            AttendanceRecord.objects.filter(work_date__range=(chunk_start, chunk_end))
+            .values_list('employee_id', 'work_date')
+        )
+        holiday_dates = get_holiday_dates(chunk_start, chunk_end)
+        leave_days = get_leave_day_set(chunk_start, chunk_end, employee_ids=emp_ids)
+
+        new_records = []
+        touched_months = set()
+        for d in iter_dates(chunk_start, chunk_end):
+            # วันเสาร์-อาทิตย์ไม่ใช่วันทำงาน (เหมือนตอนคำนวณเงินเดือน) ไม่ต้องสร้าง
+            if d.weekday() >= 5:
+                continue
+            for emp_id, hire_date in employees:
+                if (emp_id, d) in existing:
+                    continue
+                if hire_date and d < hire_date:
+                    continue
+
+                if d in holiday_dates:
+                    status = 'holiday'
+                elif (emp_id, d) in leave_days:
+                    status = 'leave'
+                else:
+                    status = 'absent'
+
+                new_records.append(AttendanceRecord(
+                    employee_id=emp_id,
+                    work_date=d,
+                    status=status,
+                    source='system',
+                ))
+                touched_months.add((emp_id, d.year, d.month))
+
+        with transaction.atomic():
+            # ignore_conflicts กันชนกับ record ที่เพิ่งถูกเขียนระหว่างรัน
+            # (แถวที่ชนไม่ถูกสร้าง -> นับจากจำนวนแถวก่อน/หลัง ไม่ใช่ len(new_records))
+            chunk_qs = AttendanceRecord.objects.filter(work_date__range=(chunk_start, chunk_end))
+            before = chunk_qs.count() if new_records else 0
+            AttendanceRecord.objects.bulk_create(
+                new_records, batch_size=1000, ignore_conflicts=True,
+            )
+            if new_records:
+                created += chunk_qs.count() - before
+            refresh_attendance_rollup(touched_months)
+
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return created
@@ -0,0 +1,32 @@
+"""
+ตั้งค่า connection ฐานข้อมูลตอนเปิดใหม่ (ผูกกับ signal connection_created ใน apps.py)
+"""
+from django.conf import settings
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    ตั้ง PRAGMA ตาม settings.HR_SQLITE_PRAGMAS ให้ connection SQLite ที่เพิ่งเปิด
+    - journal_mode=WAL มีเฉพาะเมื่อ HR_SQLITE_WAL=1 (ถูกเก็บไว้ในไฟล์ DB ถาวร ตั้งครั้งเดียวก็พอ)
+    - DB ใน memory (ตอนรัน test) ใช้ WAL ไม่ได้ SQLite จะคงเป็น memory เอง
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'HR_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def get_sqlite_pragmas(connection):
+    """
+    อ่านค่า PRAGMA ปัจจุบันของ connection (ใช้ตรวจว่าตั้งค่าติดจริง)
+    """
+    pragmas = getattr(settings, 'HR_SQLITE_PRAGMAS', {})
+    result = {}
+    with connection.cursor() as cursor:
+        for name in pragmas:
+            cursor.execute(f"PRAGMA {name}")
+            row = cursor.fetchone()
+            result[name] = row[0] if row else None
+    return result
@@ -0,0 +1,288 @@
+"""
+รับ event จากเครื่องลงเวลา (time clock) ทีละ batch
+
+ลำดับงานต่อ 1 request (query คงที่ ไม่ขึ้นกับจำนวน event):
+  1) ตรวจรูปแบบ event + ตัด event ซ้ำใน batch เดียวกัน
+  2) ตัด event ที่เคยรับแล้ว (unique device + event_id)
+  3) บันทึก event ดิบด้วย bulk_create(ignore_conflicts=True)
+  4) รวม punch ต่อ (พนักงาน, วัน) -> เวลาเข้าเร็วสุด / เวลาออกช้าสุด
+     แล้ว upsert AttendanceRecord ด้วย bulk_create / bulk_update + คำนวณสถานะ
+     (record เดิมไม่ถูกเขียนทับ: รวมเวลาแบบ min/max และคง source ของ HR)
+  5) อัปเดต rollup รายเดือนเฉพาะเดือนที่โดน
+
+การรวม punch เป็นแบบ min/max จึงส่ง batch เดิมซ้ำ (หรือสองเครื่องส่งพร้อมกัน) ได้ผลเหมือนเดิม
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .attendance import AttendanceStatusResolver, refresh_attendance_rollup
+from .models import AttendanceDevice, AttendanceDeviceEvent, AttendanceRecord, Employee
+
+
+DEVICE_MAX_EVENTS_PER_REQUEST = 10000
+DEVICE_LOOKUP_CHUNK = 2000
+DEVICE_WRITE_BATCH = 1000
+
+# record ที่ HR นำเข้า / กรอกเอง: punch จากเครื่องรวมเวลาเข้าไปแต่ไม่เปลี่ยน source
+DEVICE_KEEP_SOURCES = ('manual', 'csv')
+
+EVENT_ACCEPTED = 'accepted'
+EVENT_DUPLICATE = 'duplicate'
+EVENT_REJECTED = 'rejected'
+
+
+class DeviceEventError(ValueError):
+    pass
+
+
+def authenticate_device(token):
+    """
+    คืน AttendanceDevice ที่ active ตาม token หรือ None
+    """
+    if not token:
+        return None
+    return (
+        AttendanceDevice.objects
+        .filter(token_hash=AttendanceDevice.hash_token(token), is_active=True)
+        .first()
+    )
+
+
+def _chunked(values, size=DEVICE_LOOKUP_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _parse_event(raw):
+    """
+    event 1 รายการ:
+      {"event_id": "...", "employee_code": "E001", "timestamp": "2025-01-02T08:55:00+07:00",
+       "type": "in" | "out", "work_date": "2025-01-01" (ไม่บังคับ ใช้กับกะข้ามคืน)}
+    คืน (event_id, employee_code, kind, occurred_at, work_date)
+    """
+    if not isinstance(raw, dict):
+        raise DeviceEventError("event ต้องเป็น object")
+
+    # event_id เป็นตัวเลขได้ (0 ก็ใช้ได้) แต่ต้องไม่ใช่ object / list / true-false
+    event_id = raw.get('event_id')
+    if isinstance(event_id, bool) or not isinstance(event_id, (str, int)):
+        raise DeviceEventError("ไม่มี event_id หรือยาวเกิน 100 ตัวอักษร")
+    event_id = str(event_id).strip()
+    if not event_id or len(event_id) > 100:
+        raise DeviceEventError("ไม่มี event_id หรือยาวเกิน 100 ตัวอักษร")
+
+    code = str(raw.get('employee_code') or '').strip()
+    if not code:
+        raise DeviceEventError("ไม่มี employee_code")
+
+    kind = raw.get('type')
+    if not isinstance(kind, str) or kind not in dict(AttendanceDeviceEvent.KIND_CHOICES):
+        raise DeviceEventError("type ต้องเป็น in หรือ out")
+
+    try:
+        occurred_at = datetime.fromisoformat(str(raw.get('timestamp') or ''))
+    except ValueError:
+        raise DeviceEventError("timestamp ไม่ถูกต้อง (ควรเป็น ISO 8601)")
+    if timezone.is_naive(occurred_at):
+        # เครื่องส่งเวลาท้องถิ่นมา -> ถือเป็นเวลาตาม TIME_ZONE ของระบบ
+        occurred_at = timezone.make_aware(occurred_at)
+
+    if raw.get('work_date'):
+        try:
+            work_date = datetime.strptime(str(raw['work_date']), "%Y-%m-%d").date()
+        except ValueError:
+            raise DeviceEventError("work_date ไม่ถูกต้อง (ควรเป็น YYYY-MM-DD)")
+    else:
+        work_date = timezone.localtime(occurred_at).date()
+
+    return event_id, code, kind, occurred_at, work_date
+
+
+def ingest_device_events(device, raw_events):
+    """
+    รับ event จากเครื่อง 1 batch
+    คืน dict: accepted / duplicate / rejected / created / updated / results
+    results เรียงตาม event ที่ส่งมา: {"event_id", "status", ("error")}
+    """
+    results = []
+    parsed = []          # (index, event_id, code, kind, occurred_at, work_date)
+    seen_ids = set()
+
+    # ===== 1) ตรวจรูปแบบ + ตัดซ้ำใน batch =====
+    for index, raw in enumerate(raw_events):
+        try:
+            event = _parse_event(raw)
+        except DeviceEventError as exc:
+            event_id = raw.get('event_id') if isinstance(raw, dict) else None
+            results.append({'event_id': event_id, 'status': EVENT_REJECTED, 'error': str(exc)})
+            continue
+
+        if event[0] in seen_ids:
+            results.append({'event_id': event[0], 'status': EVENT_DUPLICATE})
+            continue
+        seen_ids.add(event[0])
+        results.append({'event_id': event[0], 'status': EVENT_ACCEPTED})
+        parsed.append((index,) + event)
+
+    # ===== 2) ตัด event ที่เคยรับแล้ว + พนักงานที่ไม่มีในระบบ =====
+    known_ids = set()
+    for chunk in _chunked(seen_ids):
+        known_ids.update(
+            AttendanceDeviceEvent.objects
+            .filter(device=device, event_id__in=chunk)
+            .values_list('event_id', flat=True)
+        )
+
+    emp_ids = {}
+    for chunk in _chunked({p[2] for p in parsed}):
+        emp_ids.update(Employee.objects.filter(code__in=chunk).values_list('code', 'id'))
+
+    new_events = []
+    for index, event_id, code, kind, occurred_at, work_date in parsed:
+        if event_id in known_ids:
+            results[index]['status'] = EVENT_DUPLICATE
+        elif code not in emp_ids:
+            results[index].update(status=EVENT_REJECTED, error=f"ไม่พบพนักงาน code={code}")
+        else:
+            new_events.append((event_id, emp_ids[code], code, kind, occurred_at, work_date))
+
+    # ===== 3) รวม punch ต่อ (พนักงาน, วัน) =====
+    punches = {}  # (employee_id, work_date) -> [check_in, check_out]
+    for _, emp_id, _, kind, occurred_at, work_date in new_events:
+        punch_time = timezone.localtime(occurred_at).time().replace(microsecond=0)
+        slot = punches.setdefault((emp_id, work_date), [None, None])
+        if kind == 'in':
+            slot[0] = punch_time if slot[0] is None else min(slot[0], punch_time)
+        else:
+            slot[1] = punch_time if slot[1] is None else max(slot[1], punch_time)
+
+    created = updated = 0
+    with transaction.atomic():
+        AttendanceDeviceEvent.objects.bulk_create(
+            [
+                AttendanceDeviceEvent(
+                    device=device,
+                    event_id=event_id,
+                    employee_code=code,
+                    kind=kind,
+                    occurred_at=occurred_at,
+                    work_date=work_date,
+                )
+                for event_id, _, code, kind, occurred_at, work_date in new_events
+            ],
+            batch_size=DEVICE_WRITE_BATCH,
+            ignore_conflicts=True,
+        )
+
+        if punches:
+            created, updated = _apply_punches(punches)
+
+        AttendanceDevice.objects.filter(pk=device.pk).update(last_seen_at=timezone.now())
+
+    counts = {EVENT_ACCEPTED: 0, EVENT_DUPLICATE: 0, EVENT_REJECTED: 0}
+    for r in results:
+        counts[r['status']] += 1
+
+    return {
+        'accepted': counts[EVENT_ACCEPTED],
+        'duplicate': counts[EVENT_DUPLICATE],
+        'rejected': counts[EVENT_REJECTED],
+        'created': created,
+        'updated': updated,
+        'results': results,
+    }
+
+
+def _load_records(keys, start, end):
+    """
+    AttendanceRecord ที่มีอยู่ของ keys = {(employee_id, work_date)} (ล็อกแถวไว้จนจบ transaction)
+    """
+    records = {}
+    for chunk in _chunked({k[0] for k in keys}):
+        for att in (
+            AttendanceRecord.objects
+            .select_for_update()
+            .filter(employee_id__in=chunk, work_date__range=(start, end))
+            .only('id', 'employee_id', 'work_date', 'check_in', 'check_out', 'status', 'source')
+        ):
+            if (att.employee_id, att.work_date) in keys:
+                records[(att.employee_id, att.work_date)] = att
+    return records
+
+
+def _merge_punch(att, check_in, check_out, resolver):
+    """
+    รวม punch เข้ากับ record เดิม: เวลาเข้า = เร็วสุด, เวลาออก = ช้าสุด
+    record ที่ HR ใส่เอง (DEVICE_KEEP_SOURCES) คง source เดิมไว้
+    คืน True ถ้ามีค่าเปลี่ยน
+    """
+    new_in = min(filter(None, (att.check_in, check_in)), default=None)
+    new_out = max(filter(None, (att.check_out, check_out)), default=None)
+    new_status = resolver.status_for(att.employee_id, att.work_date, new_in)
+    new_source = att.source if att.source in DEVICE_KEEP_SOURCES else 'device'
+    if (new_in, new_out, new_status, new_source) == (att.check_in, att.check_out, att.status, att.source):
+        return False
+    att.check_in = new_in
+    att.check_out = new_out
+    att.status = new_status
+    att.source = new_source
+    return True
+
+
+def _apply_punches(punches):
+    """
+    upsert AttendanceRecord จาก {(employee_id, work_date): [check_in, check_out]}
+    - record เดิม: รวมด้วย _merge_punch (เขียนเฉพาะที่เปลี่ยน)
+    - ยังไม่มี record: สร้างใหม่ (source = device)
+    คืน (created, updated)
+    """
+    dates = [k[1] for k in punches]
+    start, end = min(dates), max(dates)
+
+    resolver = AttendanceStatusResolver(start, end, employee_ids=list({k[0] for k in punches}))
+    existing = _load_records(punches, start, end)
+
+    to_create = []
+    to_update = []
+    for (emp_id, work_date), (check_in, check_out) in punches.items():
+        att = existing.get((emp_id, work_date))
+        if att is None:
+            att = AttendanceRecord(
+                employee_id=emp_id,
+                work_date=work_date,
+                check_in=check_in,
+                check_out=check_out,
+                source='device',
+            )
+            att.status = resolver.status_for(emp_id, work_date, att.check_in)
+            to_create.append(att)
+        elif _merge_punch(att, check_in, check_out, resolver):
+            to_update.append(att)
+
+    # เครื่องอื่น / import อาจสร้าง record วันเดียวกันพร้อมกัน -> insert เฉพาะที่ยังไม่มี
+    # แล้วอ่านกลับมา: แถวที่ไม่ใช่ของเรา (ค่าไม่ตรง) รวม punch เข้าไปแบบเดียวกับ record เดิม
+    AttendanceRecord.objects.bulk_create(to_create, batch_size=DEVICE_WRITE_BATCH, ignore_conflicts=True)
+    created = 0
+    if to_create:
+        stored = _load_records({(att.employee_id, att.work_date) for att in to_create}, start, end)
+        for att in to_create:
+            row = stored[(att.employee_id, att.work_date)]
+            if (row.check_in, row.check_out, row.status, row.source) == (
+                att.check_in, att.check_out, att.status, att.source,
+            ):
+                created += 1
+            elif _merge_punch(row, att.check_in, att.check_out, resolver):
+                to_update.append(row)
+
+    AttendanceRecord.objects.bulk_update(
+        to_update,
+        ['check_in', 'check_out', 'status', 'source'],
+        batch_size=DEVICE_WRITE_BATCH,
+    )
+    refresh_attendance_rollup({
+        (att.employee_id, att.work_date.year, att.work_date.month) for att in to_create + to_update
+    })
+    return created, len(to_update)
@@ -17,10 +17,21 @@ class AttendanceUploadForm(forms.Form):
 class CompanySettingForm(forms.ModelForm):
     class Meta:
         model = CompanySetting
-        fields = ['work_start_time', 'late_after_minutes']
+        fields = [
+            'work_start_time',
+            'late_after_minutes',
+            'work_end_time',
+            'ot_weekday_rate',
+            'ot_weekend_rate',
+            'ot_holiday_rate',
+        ]
         labels = {
             'work_start_time': 'เวลาเริ่มงานปกติ',
             'late_after_minutes': 'ถือว่าสายเมื่อเลย (นาที)',
+            'work_end_time': 'เวลาเลิกงานปกติ',
+            'ot_weekday_rate': 'อัตรา OT วันทำงาน (เท่า)',
+            'ot_weekend_rate': 'อัตรา OT วันเสาร์-อาทิตย์ (เท่า)',
+            'ot_holiday_rate': 'อัตรา OT วันหยุดนักขัตฤกษ์ (เท่า)',
         }
         widgets = {
             'work_start_time': forms.TimeInput(
@@ -29,6 +40,18 @@ class CompanySettingForm(forms.ModelForm):
             'late_after_minutes': forms.NumberInput(
                 attrs={'class': 'form-control form-control-sm', 'min': 0}
             ),
+            'work_end_time': forms.TimeInput(
+                attrs={'type': 'time', 'class': 'form-control form-control-sm'}
+            ),
+            'ot_weekday_rate': forms.NumberInput(
+                attrs={'class': 'form-control form-control-sm', 'step': '0.25', 'min': 0}
+            ),
+            'ot_weekend_rate': forms.NumberInput(
+                attrs={'class': 'form-control form-control-sm', 'step': '0.25', 'min': 0}
+            ),
+            'ot_holiday_rate': forms.NumberInput(
+                attrs={'class': 'form-control form-control-sm', 'step': '0.25', 'min': 0}
+            ),
         }
 
 
@@ -0,0 +1,506 @@
+"""
+ตัวช่วยนำเข้า CSV ซ้ำแบบ idempotent
+
+- checksum ทั้งไฟล์: ไฟล์เดิมที่เคยนำเข้าสำเร็จ (ไม่มี error) -> ข้ามทั้งไฟล์
+- hash ต่อแถว: เทียบกับ hash ของแถวเดียวกันจากการนำเข้าครั้งก่อน
+  -> เขียน DB เฉพาะแถวที่เนื้อหาเปลี่ยนจริง (เวลาที่ใช้ขึ้นกับจำนวนแถวที่แก้ ไม่ใช่ขนาดไฟล์)
+
+hash เก็บ "สิ่งที่ไฟล์เคยส่งมา" ไม่ใช่ค่าปัจจุบันใน DB
+ถ้าข้อมูลถูกแก้ทางอื่น (หน้าแก้ไข / เครื่องสแกน) แถวเดิมในไฟล์จะไม่ทับค่านั้น
+"""
+import csv
+import hashlib
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .attendance import AttendanceStatusResolver, refresh_attendance_rollup
+from .metrics import IMPORT_ERRORS, IMPORT_ROWS, IMPORT_ROWS_PER_SECOND, IMPORT_SECONDS
+from .models import AttendanceRecord, Employee, ImportFile, ImportRowHash
+
+
+IMPORT_KIND_ATTENDANCE = 'attendance'
+IMPORT_KIND_EMPLOYEE = 'employee'
+
+IMPORT_LOOKUP_CHUNK = 2000
+IMPORT_WRITE_BATCH = 1000
+
+
+def file_checksum(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def row_hash(values):
+    """
+    hash ของค่าในแถว (หลัง normalize แล้ว) -> hex 32 ตัว
+    """
+    text = '\x1f'.join('' if v is None else str(v) for v in values)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def is_file_imported(kind, checksum):
+    return ImportFile.objects.filter(kind=kind, checksum=checksum).exists()
+
+
+def record_imported_file(kind, checksum, filename, row_count):
+    ImportFile.objects.get_or_create(
+        kind=kind,
+        checksum=checksum,
+        defaults={'filename': filename[:255], 'row_count': row_count},
+    )
+
+
+def load_row_hashes(kind, keys):
+    """
+    คืน {row_key: row_hash} ของ key ที่เคยนำเข้าแล้ว
+    """
+    keys = list(keys)
+    result = {}
+    for i in range(0, len(keys), IMPORT_LOOKUP_CHUNK):
+        result.update(
+            ImportRowHash.objects
+            .filter(kind=kind, row_key__in=keys[i:i + IMPORT_LOOKUP_CHUNK])
+            .values_list('row_key', 'row_hash')
+        )
+    return result
+
+
+def save_row_hashes(kind, hashes):
+    """
+    upsert {row_key: row_hash} หลังเขียนแถวเหล่านั้นลง DB สำเร็จ
+    """
+    if not hashes:
+        return
+    now = timezone.now()
+    ImportRowHash.objects.bulk_create(
+        [
+            ImportRowHash(kind=kind, row_key=key, row_hash=value, updated_at=now)
+            for key, value in hashes.items()
+        ],
+        batch_size=IMPORT_WRITE_BATCH,
+        update_conflicts=True,
+        unique_fields=['kind', 'row_key'],
+        update_fields=['row_hash', 'updated_at'],
+    )
+
+
+def measured_import(kind):
+    """
+    จับเวลา + นับแถวตาม report ของฟังก์ชันนำเข้า -> hr_import_* metrics
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(data, filename):
+            started = time.perf_counter()
+            report = func(data, filename)
+            seconds = time.perf_counter() - started
+            rows = 0
+            for result in ('created', 'updated', 'unchanged', 'skipped'):
+                if report.get(result):
+                    IMPORT_ROWS.inc(report[result], kind=kind, result=result)
+                    rows += report[result]
+            if report['errors']:
+                IMPORT_ERRORS.inc(len(report['errors']), kind=kind)
+            IMPORT_SECONDS.observe(seconds, kind=kind)
+            if rows and seconds > 0:
+                IMPORT_ROWS_PER_SECOND.set(round(rows / seconds, 2), kind=kind)
+            return report
+        return wrapper
+    return decorate
+
+
+# ===== นำเข้าเวลาเข้า-ออกงาน =====
+
+ATTENDANCE_IMPORT_CHUNK = 500  # แถวต่อ 1 transaction
+
+
+def _parse_time(t_str):
+    if not t_str:
+        return None
+    try:
+        return datetime.strptime(t_str, "%H:%M").time()
+    except ValueError:
+        return None
+
+
+def _existing_attendance_keys(rows):
+    """
+    key "code|date" ของแถว (i, code, work_date, ...) ที่มี AttendanceRecord อยู่จริงใน DB
+    """
+    rows = list(rows)
+    if not rows:
+        return set()
+    codes = sorted({r[1] for r in rows})
+    wanted = {f"{r[1]}|{r[2]}" for r in rows}
+    date_range = (min(r[2] for r in rows), max(r[2] for r in rows))
+    found = set()
+    for i in range(0, len(codes), IMPORT_LOOKUP_CHUNK):
+        found.update(
+            f"{code}|{work_date}"
+            for code, work_date in AttendanceRecord.objects.filter(
+                employee__code__in=codes[i:i + IMPORT_LOOKUP_CHUNK],
+                work_date__range=date_range,
+            ).values_list('employee__code', 'work_date')
+        )
+    return found & wanted
+
+
+@measured_import(IMPORT_KIND_ATTENDANCE)
+def import_attendance_csv(data, filename):
+    """
+    นำเข้า CSV ลงเวลาเข้า-ออกงาน (employee_code, date, check_in, check_out) จาก bytes ของไฟล์
+    - ไฟล์ที่เคยนำเข้าครบแล้ว (checksum เดิม) และทุกแถวยังมี record อยู่ -> ข้ามทั้งไฟล์
+    - แถวที่เนื้อหาเหมือนครั้งก่อน และ record ยังอยู่ -> ข้าม
+    - เขียนทีละก้อน ATTENDANCE_IMPORT_CHUNK แถวต่อ 1 transaction (พร้อม rollup + hash ของก้อนนั้น)
+      ถ้าหยุดกลางทาง อัปโหลดไฟล์เดิมซ้ำจะทำต่อเฉพาะแถวที่ยังไม่ได้เขียน
+
+    คืน report: created / updated / skipped / unchanged / errors / file_unchanged
+    """
+    report = {'created': 0, 'updated': 0, 'skipped': 0, 'unchanged': 0, 'errors': [], 'file_unchanged': False}
+    checksum = file_checksum(data)
+
+    reader = csv.DictReader(data.decode('utf-8-sig').splitlines())
+    errors = report['errors']
+
+    # ===== 1) อ่าน + ตรวจทุกแถวก่อน =====
+    parsed_rows = []
+    for i, row in enumerate(reader, start=2):  # เริ่มนับบรรทัดที่ 2 (ข้าม header)
+        code = (row.get('employee_code') or '').strip()
+        date_str = (row.get('date') or '').strip()
+        ci_str = (row.get('check_in') or '').strip()
+        co_str = (row.get('check_out') or '').strip()
+
+        if not code or not date_str:
+            report['skipped'] += 1
+            errors.append(f"แถว {i}: ไม่มี employee_code หรือ date")
+            continue
+
+        try:
+            work_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        except ValueError:
+            report['skipped'] += 1
+            errors.append(f"แถว {i}: รูปแบบวันที่ไม่ถูกต้อง (ควรเป็น YYYY-MM-DD)")
+            continue
+
+        parsed_rows.append((i, code, work_date, _parse_time(ci_str), _parse_time(co_str)))
+
+    row_count = len(parsed_rows)
+
+    # ===== 1.1) ตัดแถวที่เนื้อหาเหมือนการนำเข้าครั้งก่อน =====
+    # key ซ้ำในไฟล์เดียวกัน -> แถวหลังสุดชนะ (เหมือนเขียนทับตามลำดับ)
+    row_hashes = {}
+    latest_rows = {}
+    for r in parsed_rows:
+        key = f"{r[1]}|{r[2]}"
+        row_hashes[key] = row_hash(r[1:])
+        latest_rows[key] = r
+
+    # hash บอกแค่ว่าไฟล์เคยส่งแถวนี้มา -> ข้ามได้เฉพาะแถวที่ record ยังอยู่
+    # (ถูกลบทีหลัง เช่นลบพนักงานแล้ว cascade -> ต้องสร้างใหม่)
+    existing_keys = _existing_attendance_keys(latest_rows.values())
+    if len(existing_keys) == len(latest_rows) and is_file_imported(IMPORT_KIND_ATTENDANCE, checksum):
+        report['file_unchanged'] = True
+        return report
+
+    previous_hashes = load_row_hashes(IMPORT_KIND_ATTENDANCE, row_hashes)
+    parsed_rows = []
+    for key, r in latest_rows.items():
+        if key in existing_keys and previous_hashes.get(key) == row_hashes[key]:
+            report['unchanged'] += 1
+        else:
+            parsed_rows.append(r)
+
+    # ===== 2) preload พนักงาน + กฎคำนวณสถานะ (วันหยุด/ลา/กะ) ทั้งช่วงในไฟล์ =====
+    emp_map = {
+        e.code: e
+        for e in Employee.objects.filter(code__in={r[1] for r in parsed_rows})
+    }
+    resolver = None
+    if parsed_rows:
+        resolver = AttendanceStatusResolver(
+            min(r[2] for r in parsed_rows),
+            max(r[2] for r in parsed_rows),
+            employee_ids=[e.id for e in emp_map.values()],
+        )
+
+    # ===== 3) เขียนลง DB ทีละก้อน =====
+    for start in range(0, len(parsed_rows), ATTENDANCE_IMPORT_CHUNK):
+        written_hashes = {}
+        touched_months = set()  # (employee_id, year, month) ที่มีการเขียน -> refresh rollup ตอนจบก้อน
+        with transaction.atomic():
+            for i, code, work_date, ci, co in parsed_rows[start:start + ATTENDANCE_IMPORT_CHUNK]:
+                emp = emp_map.get(code)
+                if emp is None:
+                    report['skipped'] += 1
+                    errors.append(f"แถว {i}: ไม่พบพนักงาน code={code}")
+                    continue
+
+                att, is_created = AttendanceRecord.objects.get_or_create(
+                    employee=emp,
+                    work_date=work_date,
+                    defaults={
+                        'check_in': ci,
+                        'check_out': co,
+                        'source': 'csv',
+                    }
+                )
+                if not is_created:
+                    att.check_in = ci
+                    att.check_out = co
+                    att.source = 'csv'
+                    report['updated'] += 1
+                else:
+                    report['created'] += 1
+
+                # คำนวณสถานะจากกฎ (preload ไว้แล้ว ไม่ query ต่อแถว)
+                att.status = resolver.status_for(emp.id, work_date, ci)
+                att.save()
+                touched_months.add((emp.id, work_date.year, work_date.month))
+                key = f"{code}|{work_date}"
+                written_hashes[key] = row_hashes[key]
+
+            refresh_attendance_rollup(touched_months)
+            save_row_hashes(IMPORT_KIND_ATTENDANCE, written_hashes)
+
+    # จำไฟล์ไว้เฉพาะตอนนำเข้าได้ครบ (มี error = ต้องให้อัปโหลดซ้ำหลังแก้ได้)
+    if not errors:
+        record_imported_file(IMPORT_KIND_ATTENDANCE, checksum, filename, row_count)
+    return report
+
+
+# ===== นำเข้าพนักงาน (preload + diff + bulk_create / bulk_update) =====
+
+EMPLOYEE_IMPORT_REQUIRED = ('code', 'first_name', 'last_name')
+EMPLOYEE_IMPORT_FIELDS = (
+    'first_name', 'last_name', 'position', 'department', 'phone_number', 'address',
+    'citizen_id', 'bank_name', 'bank_account_no', 'status', 'hire_date', 'base_salary',
+)
+EMPLOYEE_IMPORT_CHUNK = 1000
+IMPORT_ERROR_REPORT_LIMIT = 10000
+
+
+def parse_employee_row(row):
+    """
+    แปลงแถว CSV เป็น dict ค่าของ Employee (code + EMPLOYEE_IMPORT_FIELDS)
+    คอลัมน์ที่ไม่มี/ว่าง = None (status ว่าง = active, base_salary ว่าง = 0)
+    ข้อมูลไม่ถูกต้อง -> ValueError
+    """
+    values = {}
+    for name in ('code', 'first_name', 'last_name', 'position', 'department', 'phone_number',
+                 'address', 'citizen_id', 'bank_name', 'bank_account_no'):
+        values[name] = (row.get(name) or '').strip() or None
+
+    if not values['code'] or not values['first_name'] or not values['last_name']:
+        raise ValueError("ต้องมี code, first_name, last_name ครบ")
+
+    for name, value in values.items():
+        max_length = Employee._meta.get_field(name).max_length
+        if value and max_length and len(value) > max_length:
+            raise ValueError(f"{name} ยาวเกิน {max_length} ตัวอักษร")
+
+    # status (active / inactive)
+    status_val = (row.get('status') or '').strip().lower()
+    if status_val not in ['active', 'inactive', '']:
+        raise ValueError("status ต้องเป็น active หรือ inactive หรือเว้นว่าง")
+    values['status'] = status_val or 'active'
+
+    # hire_date รูปแบบ YYYY-MM-DD
+    hire_date_raw = (row.get('hire_date') or '').strip()
+    values['hire_date'] = None
+    if hire_date_raw:
+        try:
+            values['hire_date'] = datetime.strptime(hire_date_raw, "%Y-%m-%d").date()
+        except ValueError:
+            raise ValueError("รูปแบบวันที่ hire_date ต้องเป็น YYYY-MM-DD")
+
+    # base_salary
+    base_salary_raw = (row.get('base_salary') or '').replace(',', '').strip()
+    values['base_salary'] = Decimal('0.00')
+    if base_salary_raw:
+        try:
+            values['base_salary'] = Decimal(base_salary_raw).quantize(Decimal('0.01'))
+        except (InvalidOperation, ValueError):
+            raise ValueError("base_salary ต้องเป็นตัวเลข เช่น 35000 หรือ 35000.00")
+        if abs(values['base_salary']) >= Decimal('100000000'):
+            raise ValueError("base_salary มากเกินไป")
+
+    return values
+
+
+class EmployeeImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []  # [(row_number, raw_row, message), ...]
+
+    def add_error(self, row_number, raw_row, message):
+        self.errors.append((row_number, raw_row, message))
+
+
+def import_employee_rows(rows, previous_hashes=None):
+    """
+    นำเข้าพนักงานจาก list ของ dict (csv.DictReader) ทีละก้อน EMPLOYEE_IMPORT_CHUNK แถว
+
+    ต่อก้อน:
+      - preload พนักงานเดิมด้วย code ครั้งเดียว
+      - เทียบทีละ field -> เขียนเฉพาะแถวที่มีค่าต่างจริง
+      - bulk_create แถวใหม่ + bulk_update แถวที่เปลี่ยน ใน transaction ของก้อนนั้น
+      - ถ้าก้อนเขียนไม่ผ่าน (เช่นชน constraint) ถอยไปเขียนทีละแถว เพื่อระบุแถวที่มีปัญหา
+
+    previous_hashes = {code: row_hash} จากการนำเข้าครั้งก่อน
+      (hash เท่าเดิมและพนักงานยังอยู่ -> ข้ามไม่ต้องเทียบ field ; ถูกลบไปแล้ว -> สร้างใหม่)
+    คืน (EmployeeImportResult, {code: row_hash ของแถวที่เขียน/ตรงกับ DB แล้ว})
+    """
+    previous_hashes = previous_hashes or {}
+    result = EmployeeImportResult()
+    written_hashes = {}
+
+    # ===== 1) parse (code ซ้ำในไฟล์ -> แถวหลังสุดชนะ) =====
+    parsed = {}
+    for row_number, row in enumerate(rows, start=2):  # บรรทัดที่ 1 = header
+        try:
+            values = parse_employee_row(row)
+        except ValueError as exc:
+            result.add_error(row_number, row, str(exc))
+            continue
+        content_hash = row_hash([values['code']] + [values[f] for f in EMPLOYEE_IMPORT_FIELDS])
+        parsed[values['code']] = (row_number, row, values, content_hash)
+
+    items = list(parsed.values())
+
+    # ===== 2) diff + เขียนทีละก้อน =====
+    for i in range(0, len(items), EMPLOYEE_IMPORT_CHUNK):
+        chunk = items[i:i + EMPLOYEE_IMPORT_CHUNK]
+        existing = Employee.objects.in_bulk([item[2]['code'] for item in chunk], field_name='code')
+
+        to_create = []
+        to_update = []
+        changed_fields = set()
+        for row_number, row, values, content_hash in chunk:
+            emp = existing.get(values['code'])
+            if emp is None:
+                to_create.append((row_number, row, Employee(**values), content_hash))
+                continue
+            if previous_hashes.get(emp.code) == content_hash:
+                result.unchanged += 1
+                continue
+
+            diff = [f for f in EMPLOYEE_IMPORT_FIELDS if getattr(emp, f) != values[f]]
+            if not diff:
+                result.unchanged += 1
+                written_hashes[emp.code] = content_hash
+                continue
+            for f in diff:
+                setattr(emp, f, values[f])
+            changed_fields.update(diff)
+            to_update.append((row_number, row, emp, content_hash))
+
+        try:
+            with transaction.atomic():
+                Employee.objects.bulk_create([item[2] for item in to_create])
+                if to_update:
+                    Employee.objects.bulk_update([item[2] for item in to_update], sorted(changed_fields))
+        except DatabaseError:
+            _write_employees_one_by_one(to_create, to_update, result, written_hashes)
+            continue
+
+        result.created += len(to_create)
+        result.updated += len(to_update)
+        for _, _, emp, content_hash in to_create + to_update:
+            written_hashes[emp.code] = content_hash
+
+    return result, written_hashes
+
+
+def _write_employees_one_by_one(to_create, to_update, result, written_hashes):
+    for items, is_create in ((to_create, True), (to_update, False)):
+        for row_number, row, emp, content_hash in items:
+            if is_create:
+                emp.pk = None  # bulk_create ที่ rollback ไปแล้วอาจเติม pk ไว้
+            try:
+                with transaction.atomic():
+                    emp.save(force_insert=is_create)
+            except DatabaseError as exc:
+                result.add_error(row_number, row, f"บันทึกไม่ได้: {exc}")
+                continue
+            if is_create:
+                result.created += 1
+            else:
+                result.updated += 1
+            written_hashes[emp.code] = content_hash
+
+
+def write_import_error_report(output, fieldnames, errors):
+    """
+    เขียน CSV รายงานแถวที่มีปัญหา: row_number + error + คอลัมน์เดิมในไฟล์ (แก้แล้วอัปโหลดซ้ำได้เลย)
+    errors = [(row_number, raw_row, message), ...]
+    """
+    writer = csv.writer(output)
+    writer.writerow(['row_number', 'error'] + list(fieldnames))
+    for row_number, raw_row, message in errors:
+        writer.writerow([row_number, message] + [raw_row.get(name, '') for name in fieldnames])
+
+
+def _count_existing_employees(codes):
+    codes = sorted(codes)
+    return sum(
+        Employee.objects.filter(code__in=codes[i:i + IMPORT_LOOKUP_CHUNK]).count()
+        for i in range(0, len(codes), IMPORT_LOOKUP_CHUNK)
+    )
+
+
+@measured_import(IMPORT_KIND_EMPLOYEE)
+def import_employee_csv(data, filename):
+    """
+    นำเข้าพนักงานจาก bytes ของไฟล์ CSV (matching ด้วย code)
+    คืน dict:
+      file_unchanged / missing_cols  -> ไม่ได้นำเข้า
+      created / updated / unchanged / fieldnames / errors [(row_number, raw_row, message), ...]
+    """
+    report = {
+        'created': 0, 'updated': 0, 'unchanged': 0, 'errors': [],
+        'fieldnames': [], 'missing_cols': [], 'file_unchanged': False,
+    }
+    checksum = file_checksum(data)
+
+    try:
+        # รองรับไฟล์ที่ save จาก Excel เป็น UTF-8 (มี BOM)
+        decoded = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        decoded = data.decode("utf-8", errors="ignore")
+
+    reader = csv.DictReader(decoded.splitlines())
+    report['fieldnames'] = list(reader.fieldnames or [])
+
+    # คอลัมน์ที่รองรับ (ไม่ต้องมีครบทุกคอลัมน์ก็ได้ แต่ต้องมีอย่างน้อย code, first_name, last_name)
+    report['missing_cols'] = [c for c in EMPLOYEE_IMPORT_REQUIRED if c not in report['fieldnames']]
+    if report['missing_cols']:
+        return report
+
+    rows = list(reader)
+    codes = {(row.get("code") or "").strip() for row in rows}
+
+    # ไฟล์เดิมข้ามได้เฉพาะเมื่อพนักงานทุกคนในไฟล์ยังอยู่ (ถูกลบไปแล้ว -> นำเข้าใหม่)
+    if is_file_imported(IMPORT_KIND_EMPLOYEE, checksum) and _count_existing_employees(codes) == len(codes):
+        report['file_unchanged'] = True
+        return report
+
+    # แถวที่เนื้อหาเหมือนการนำเข้าครั้งก่อน -> ข้ามการเทียบ field / เขียน
+    previous_hashes = load_row_hashes(IMPORT_KIND_EMPLOYEE, codes)
+    result, written_hashes = import_employee_rows(rows, previous_hashes)
+    save_row_hashes(IMPORT_KIND_EMPLOYEE, written_hashes)
+    if not result.errors:
+        record_imported_file(IMPORT_KIND_EMPLOYEE, checksum, filename, len(rows))
+
+    report.update(
+        created=result.created,
+        updated=result.updated,
+        unchanged=result.unchanged,
+        errors=result.errors,
+    )
+    return report
@@ -0,0 +1,161 @@
+"""
+วัดเวลา + จำนวน query ต่อ request (เปิดด้วย HR_REQUEST_METRICS=1)
+
+- QueryMetricsMiddleware ครอบทุก request:
+    จำนวน query, เวลา DB รวม, query ที่ช้าที่สุด N ตัว, เวลาทั้ง request
+  แล้วเก็บลง ring buffer ใน memory (ต่อ process, เก็บล่าสุด HR_REQUEST_METRICS_BUFFER รายการ)
+- ใส่ header Server-Timing (db / app / total) ให้ดูใน DevTools ของ browser ได้ทันที
+- ปิดอยู่ = middleware ถอดตัวเองออกตั้งแต่เริ่ม server (MiddlewareNotUsed) ไม่มี overhead
+
+หน้าสรุป endpoint ที่ช้า/query เยอะ: app_hr:request_metrics
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+
+REQUEST_METRICS_BUFFER = 500
+REQUEST_METRICS_SLOWEST = 5
+REQUEST_METRICS_SQL_LENGTH = 500  # ตัด SQL ยาว ๆ ก่อนเก็บ
+
+_buffer = deque(maxlen=getattr(settings, 'HR_REQUEST_METRICS_BUFFER', REQUEST_METRICS_BUFFER))
+_buffer_lock = threading.Lock()
+
+
+def request_metrics_enabled():
+    return getattr(settings, 'HR_REQUEST_METRICS', False)
+
+
+class QueryRecorder:
+    """
+    execute_wrapper ของ connection: นับ query + เวลา + เก็บ query ที่ช้าที่สุด N ตัว (min-heap)
+    """
+
+    def __init__(self, slowest=REQUEST_METRICS_SLOWEST):
+        self.count = 0
+        self.total = 0.0
+        self.slowest_limit = slowest
+        self._slowest = []  # [(duration, seq, sql)]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.total += duration
+            item = (duration, self.count, sql[:REQUEST_METRICS_SQL_LENGTH])
+            if len(self._slowest) < self.slowest_limit:
+                heapq.heappush(self._slowest, item)
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    @property
+    def slowest(self):
+        """
+        [(ms, sql)] เรียงจากช้าสุด
+        """
+        return [(round(d * 1000, 2), sql) for d, _, sql in sorted(self._slowest, reverse=True)]
+
+
+def record_request(sample):
+    with _buffer_lock:
+        _buffer.append(sample)
+
+
+def recent_requests():
+    with _buffer_lock:
+        return list(_buffer)
+
+
+def clear_request_metrics():
+    with _buffer_lock:
+        _buffer.clear()
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def endpoint_summary(samples=None, order_by='p95_ms'):
+    """
+    รวม sample ใน buffer ตาม endpoint (ชื่อ view)
+    คืน list ของ dict เรียงจากแย่สุด (order_by = p95_ms / max_queries / total_ms ...)
+    worst = sample ที่ช้าสุดของ endpoint นั้น (มี slowest query ให้ดูต่อ)
+    """
+    groups = defaultdict(list)
+    for sample in recent_requests() if samples is None else samples:
+        groups[sample['endpoint']].append(sample)
+
+    rows = []
+    for endpoint, items in groups.items():
+        walls = [s['wall_ms'] for s in items]
+        queries = [s['queries'] for s in items]
+        db_times = [s['db_ms'] for s in items]
+        rows.append({
+            'endpoint': endpoint,
+            'hits': len(items),
+            'avg_ms': round(sum(walls) / len(walls), 2),
+            'p95_ms': round(_percentile(walls, 95), 2),
+            'max_ms': round(max(walls), 2),
+            'total_ms': round(sum(walls), 2),
+            'avg_queries': round(sum(queries) / len(queries), 1),
+            'max_queries': max(queries),
+            'avg_db_ms': round(sum(db_times) / len(db_times), 2),
+            'worst': max(items, key=lambda s: s['wall_ms']),
+        })
+    rows.sort(key=lambda row: row[order_by], reverse=True)
+    return rows
+
+
+class QueryMetricsMiddleware:
+    """
+    ใส่ไว้ใน MIDDLEWARE เสมอได้ ทำงานจริงเฉพาะตอน settings.HR_REQUEST_METRICS เปิด
+    """
+
+    def __init__(self, get_response):
+        if not request_metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slowest = getattr(settings, 'HR_REQUEST_METRICS_SLOWEST', REQUEST_METRICS_SLOWEST)
+
+    def __call__(self, request):
+        recorder = QueryRecorder(self.slowest)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall = time.perf_counter() - started
+
+        match = request.resolver_match
+        endpoint = match.view_name if match else request.path
+        record_request({
+            'at': timezone.now(),
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.get_full_path()[:300],
+            'status': response.status_code,
+            'wall_ms': round(wall * 1000, 2),
+            'db_ms': round(recorder.total * 1000, 2),
+            'queries': recorder.count,
+            'slowest': recorder.slowest,
+        })
+
+        # StreamingHttpResponse: เวลานี้คือเวลาจนถึงเริ่มส่ง body (query ระหว่างส่งไม่ถูกนับ)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={recorder.total * 1000:.2f};desc="{recorder.count} queries"',
+            f'app;dur={max(0.0, wall - recorder.total) * 1000:.2f}',
+            f'total;dur={wall * 1000:.2f}',
+        ])
+        return response
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app_hr.attendance import CLOSE_DAY_CHUNK_DAYS, close_attendance_days
+
+
+class Command(BaseCommand):
+    help = (
+        "ปิดวัน: สร้าง AttendanceRecord (absent / leave / holiday) ให้พนักงาน active "
+        "ที่ไม่มีบันทึกเข้างาน (ค่าเริ่มต้น = เมื่อวาน) รันซ้ำได้"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="ปิดวันเดียว YYYY-MM-DD")
+        parser.add_argument("--start", help="backfill ตั้งแต่วันที่ YYYY-MM-DD")
+        parser.add_argument("--end", help="backfill ถึงวันที่ YYYY-MM-DD")
+        parser.add_argument(
+            "--chunk-days",
+            type=int,
+            default=CLOSE_DAY_CHUNK_DAYS,
+            help=f"จำนวนวันต่อ 1 transaction (ค่าเริ่มต้น {CLOSE_DAY_CHUNK_DAYS})",
+        )
+
+    def _parse(self, value):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError(f"รูปแบบวันที่ไม่ถูกต้อง: {value} (ต้องเป็น YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+
+        if options.get("date"):
+            start = end = self._parse(options["date"])
+        elif options.get("start"):
+            start = self._parse(options["start"])
+            end = self._parse(options["end"]) if options.get("end") else today - timedelta(days=1)
+        else:
+            start = end = today - timedelta(days=1)
+
+        if end > today:
+            raise CommandError("ปิดวันล่วงหน้าไม่ได้ (end ต้องไม่เกินวันนี้)")
+        if start > end:
+            raise CommandError("start ต้องไม่เกิน end")
+
+        created = close_attendance_days(start, end, chunk_days=max(1, options["chunk_days"]))
+        self.stdout.write(self.style.SUCCESS(
+            f"ปิดวัน {start} ถึง {end} เรียบร้อย: สร้าง {created} record"
+        ))
@@ -0,0 +1,91 @@
+import json
+import random
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_hr.models import Employee
+
+
+class Command(BaseCommand):
+    help = (
+        "จำลองเครื่องลงเวลา: สร้าง event เข้า/ออกงานของพนักงาน แล้ว POST ไปที่ "
+        "API device-push เป็น batch (ใช้ทดสอบกับ server ที่รันอยู่ในเครื่อง)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/hr/api/attendance/device-push/")
+        parser.add_argument("--token", required=True, help="token ของเครื่อง (ได้จากหน้า admin)")
+        parser.add_argument("--device", default="FAKE", help="prefix ของ event_id")
+        parser.add_argument("--start", required=True, help="วันแรก YYYY-MM-DD")
+        parser.add_argument("--days", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--ndjson", action="store_true", help="ส่งเป็น NDJSON แทน JSON array")
+        parser.add_argument("--seed", type=int, default=0, help="seed เดิม = event_id เดิม (ทดสอบส่งซ้ำ)")
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options["start"], "%Y-%m-%d")
+        except ValueError:
+            raise CommandError("รูปแบบวันที่ไม่ถูกต้อง (ต้องเป็น YYYY-MM-DD)")
+
+        rng = random.Random(options["seed"])
+        codes = list(Employee.objects.filter(status="active").order_by("code").values_list("code", flat=True))
+        if not codes:
+            raise CommandError("ไม่มีพนักงาน active")
+
+        events = []
+        for day in range(options["days"]):
+            day_start = start + timedelta(days=day)
+            if day_start.weekday() >= 5:
+                continue
+            for code in codes:
+                check_in = day_start.replace(hour=8, minute=30) + timedelta(minutes=rng.randint(0, 60))
+                check_out = day_start.replace(hour=17, minute=30) + timedelta(minutes=rng.randint(0, 120))
+                for kind, ts in (("in", check_in), ("out", check_out)):
+                    events.append({
+                        "event_id": f"{options['device']}-{code}-{ts:%Y%m%d}-{kind}",
+                        "employee_code": code,
+                        "timestamp": ts.isoformat(),
+                        "type": kind,
+                    })
+
+        totals = {"accepted": 0, "duplicate": 0, "rejected": 0}
+        batch_size = max(1, options["batch_size"])
+        for i in range(0, len(events), batch_size):
+            batch = events[i:i + batch_size]
+            if options["ndjson"]:
+                body = "\n".join(json.dumps(e) for e in batch).encode("utf-8")
+                content_type = "application/x-ndjson"
+            else:
+                body = json.dumps({"events": batch}).encode("utf-8")
+                content_type = "application/json"
+
+            request = urllib.request.Request(
+                options["url"],
+                data=body,
+                headers={"Content-Type": content_type, "Authorization": f"Bearer {options['token']}"},
+                method="POST",
+            )
+            started = datetime.now()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    result = json.loads(response.read())
+            except urllib.error.HTTPError as exc:
+                raise CommandError(f"batch {i // batch_size + 1}: HTTP {exc.code} {exc.read()[:200]!r}")
+            elapsed = (datetime.now() - started).total_seconds()
+
+            for key in totals:
+                totals[key] += result[key]
+            self.stdout.write(
+                f"batch {i // batch_size + 1}: {len(batch)} event "
+                f"(accepted {result['accepted']}, duplicate {result['duplicate']}, "
+                f"rejected {result['rejected']}) {elapsed:.2f}s"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"ส่งครบ {len(events)} event: accepted {totals['accepted']}, "
+            f"duplicate {totals['duplicate']}, rejected {totals['rejected']}"
+        ))
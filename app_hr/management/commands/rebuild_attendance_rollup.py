@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app_hr.attendance import rebuild_attendance_rollup
+
+
+class Command(BaseCommand):
+    help = "สร้างตารางสรุปการเข้างานรายเดือน (AttendanceMonthlySummary) ใหม่จาก AttendanceRecord"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--year",
+            type=int,
+            help="สร้างใหม่เฉพาะปีนี้ (ไม่ระบุ = ทุกปี)",
+        )
+
+    def handle(self, *args, **options):
+        year = options.get("year")
+        count = rebuild_attendance_rollup(year=year)
+        scope = f"ปี {year}" if year else "ทุกปี"
+        self.stdout.write(self.style.SUCCESS(f"สร้าง rollup {scope} เรียบร้อย: {count} แถว"))
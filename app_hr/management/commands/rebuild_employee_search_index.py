@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from app_hr.search import install_employee_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "สร้างดัชนีค้นหาพนักงาน (FTS5) + trigger ใหม่ แล้ว rebuild จากข้อมูลปัจจุบัน "
+        "(ใช้หลัง migration ที่สร้างตาราง Employee ใหม่ หรือถ้าผลค้นหาไม่ตรง)"
+    )
+
+    def handle(self, *args, **options):
+        if install_employee_search_index():
+            self.stdout.write(self.style.SUCCESS("rebuild ดัชนีค้นหาพนักงานเรียบร้อย"))
+        else:
+            self.stdout.write(self.style.WARNING("DB นี้ไม่รองรับ FTS5 trigram ค้นหาด้วย icontains แทน"))
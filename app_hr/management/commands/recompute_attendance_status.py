@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_hr.attendance import (
+    get_dirty_periods,
+    get_open_period_range,
+    recompute_attendance_statuses,
+)
+
+
+class Command(BaseCommand):
+    help = "คำนวณสถานะ AttendanceRecord ใหม่ตามตั้งค่า/วันหยุดปัจจุบัน (ค่าเริ่มต้น = งวดที่ยังไม่ปิด)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="วันเริ่ม YYYY-MM-DD")
+        parser.add_argument("--end", help="วันสิ้นสุด YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        if options.get("start") and options.get("end"):
+            try:
+                start = datetime.strptime(options["start"], "%Y-%m-%d").date()
+                end = datetime.strptime(options["end"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("รูปแบบวันที่ต้องเป็น YYYY-MM-DD")
+        else:
+            open_range = get_open_period_range()
+            if not open_range:
+                self.stdout.write("ไม่มีงวดเงินเดือนที่ยังไม่ปิด")
+                return
+            start, end = open_range
+
+        changed_count, changed_dates = recompute_attendance_statuses(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"{start} ถึง {end}: เปลี่ยนสถานะ {changed_count} record"
+        ))
+        for period in get_dirty_periods(changed_dates):
+            self.stdout.write(f"  งวดที่ควรรันเงินเดือนใหม่: {period}")
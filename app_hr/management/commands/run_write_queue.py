@@ -0,0 +1,43 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from app_hr.writequeue import (
+    WRITE_QUEUE_POLL_SECONDS,
+    process_write_queue,
+    recover_interrupted_jobs,
+    run_writer,
+    write_queue_metrics,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "writer process ของคิวงานเขียน (HR_WRITE_QUEUE=1): ทำงานในคิวทีละงานตามลำดับ "
+        "ให้รันไว้เพียงตัวเดียว"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="ทำงานที่ค้างในคิวจนหมดแล้วจบ")
+        parser.add_argument("--poll", type=float, default=WRITE_QUEUE_POLL_SECONDS,
+                            help="วินาทีที่รอก่อนเช็คคิวใหม่เมื่อคิวว่าง")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            recover_interrupted_jobs()
+            done = process_write_queue()
+            self.stdout.write(self.style.SUCCESS(f"ทำงานในคิว {done} งาน"))
+            return
+
+        stopping = []
+
+        def request_stop(signum, frame):
+            # ทำงานที่กำลังทำให้จบก่อน แล้วค่อยหยุด
+            stopping.append(signum)
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        self.stdout.write(f"writer เริ่มทำงาน (คิวรอ {write_queue_metrics()['depth']} งาน)")
+        run_writer(poll_seconds=options["poll"], stop=lambda: bool(stopping))
+        self.stdout.write("writer หยุดทำงาน")
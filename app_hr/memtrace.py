@@ -0,0 +1,191 @@
+"""
+วัด memory สูงสุด (peak) ของงานก้อนใหญ่ด้วย tracemalloc (เปิดด้วย HR_MEMTRACE=1)
+
+    @memory_traced('attendance_upload')
+    def attendance_upload_view(request): ...
+
+- เริ่ม tracemalloc ตอนมีงานที่ถูกวัดทำงานอยู่เท่านั้น (งานสุดท้ายจบ = หยุด trace)
+  ปิดอยู่ = decorator เรียกฟังก์ชันตรง ๆ ไม่มี overhead
+- ต่อ 1 งานเก็บ: peak ระหว่างทำงาน, memory ที่ยังค้างตอนจบ,
+  และบรรทัดที่จองไว้มากสุด HR_MEMTRACE_TOP_SITES อันดับ
+  (เทียบ snapshot ตอนจบกับตอนเริ่ม = ของที่ยังถูกถืออยู่ตอนจบ เช่น body ของ response,
+   ของชั่วคราวที่คืนไปก่อนจบงานจะไม่อยู่ในรายการแม้ดัน peak ขึ้น)
+- peak เกิน budget (HR_MEMORY_BUDGETS_MB ต่องาน / HR_MEMORY_BUDGET_MB ค่าเริ่มต้น)
+  -> logger.warning พร้อมบรรทัดที่จองมากสุด
+- ผลล่าสุดเก็บใน ring buffer ของ process (หน้า app_hr:memory_traces) + gauge hr_memory_peak_bytes
+
+tracemalloc นับทั้ง process: ถ้ามีงานอื่นถูกวัดพร้อมกันใน thread อื่น peak จะรวมของกันและกัน
+(ผลนั้นถูกติด shared=True) ; tracemalloc ทำให้งานช้าลงราว 2-4 เท่าระหว่างวัด เปิดเฉพาะตอนไล่ปัญหา
+"""
+import logging
+import os
+import sysconfig
+import threading
+import tracemalloc
+from collections import deque
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import gauge
+
+
+logger = logging.getLogger(__name__)
+
+MEMTRACE_BUFFER = 200
+MEMTRACE_TOP_SITES = 10
+MEMTRACE_FRAMES = 1          # เก็บ traceback กี่ชั้นต่อการจอง (1 = บรรทัดที่จองอย่างเดียว)
+MEMORY_BUDGET_MB = 256
+
+# ไฟล์ของ tracemalloc / import เอง ไม่ใช่ต้นเหตุ
+_IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>')
+
+MEMORY_PEAK_BYTES = gauge(
+    'hr_memory_peak_bytes', 'memory สูงสุดระหว่างงานครั้งล่าสุด (tracemalloc)', ('operation',),
+)
+
+_buffer = deque(maxlen=getattr(settings, 'HR_MEMTRACE_BUFFER', MEMTRACE_BUFFER))
+_lock = threading.Lock()
+_active = 0          # จำนวนงานที่ถูกวัดอยู่ตอนนี้ (ทุก thread)
+_started_here = False  # False = มีคนเปิด tracemalloc ไว้ก่อน (เช่น PYTHONTRACEMALLOC) ห้ามปิดให้
+_local = threading.local()
+
+
+def memtrace_enabled():
+    return getattr(settings, 'HR_MEMTRACE', False)
+
+
+def memory_budget_bytes(operation):
+    budgets = getattr(settings, 'HR_MEMORY_BUDGETS_MB', {})
+    mb = budgets.get(operation, getattr(settings, 'HR_MEMORY_BUDGET_MB', MEMORY_BUDGET_MB))
+    return int(mb * 1024 * 1024) if mb else None
+
+
+def _begin():
+    global _active, _started_here
+    with _lock:
+        shared = _active > 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(getattr(settings, 'HR_MEMTRACE_FRAMES', MEMTRACE_FRAMES))
+            _started_here = True
+        elif not shared:
+            tracemalloc.reset_peak()
+        _active += 1
+        baseline = tracemalloc.get_traced_memory()[0]
+    return baseline, shared
+
+
+def _end():
+    global _active, _started_here
+    with _lock:
+        current, peak = tracemalloc.get_traced_memory()
+        shared = _active > 1
+        snapshot = tracemalloc.take_snapshot()
+        _active -= 1
+        if _active == 0 and _started_here:
+            tracemalloc.stop()
+            _started_here = False
+    return current, peak, shared, snapshot
+
+
+def top_allocation_sites(snapshot, before=None, limit=MEMTRACE_TOP_SITES):
+    """
+    [(ไฟล์:บรรทัด, ขนาด bytes, จำนวนก้อน)] ที่จองไว้มากสุด (ถ้ามี before = เฉพาะส่วนที่เพิ่มขึ้น)
+    """
+    filters = [tracemalloc.Filter(False, name) for name in _IGNORED_FILES]
+    snapshot = snapshot.filter_traces(filters)
+    if before is not None:
+        stats = snapshot.compare_to(before.filter_traces(filters), 'lineno')
+        stats = [(s.traceback[0], s.size_diff, s.count_diff) for s in stats if s.size_diff > 0]
+    else:
+        stats = [(s.traceback[0], s.size, s.count) for s in snapshot.statistics('lineno')]
+    stats.sort(key=lambda item: item[1], reverse=True)
+    return [
+        (f"{_short_path(frame.filename)}:{frame.lineno}", size, count)
+        for frame, size, count in stats[:limit]
+    ]
+
+
+def _short_path(filename):
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        return os.path.relpath(filename, base)
+    # site-packages/django/db/... -> django/db/...
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    stdlib = sysconfig.get_paths()['stdlib']
+    return os.path.relpath(filename, stdlib) if filename.startswith(stdlib) else filename
+
+
+def record_trace(sample):
+    with _lock:
+        _buffer.append(sample)
+
+
+def recent_traces():
+    with _lock:
+        return list(_buffer)
+
+
+def clear_traces():
+    with _lock:
+        _buffer.clear()
+
+
+def memory_traced(operation):
+    """
+    decorator วัด memory ของฟังก์ชัน (view / งานเงินเดือน / งานในคิว)
+    เรียกซ้อนกันใน thread เดียว (เช่น view -> run_payroll) วัดเฉพาะชั้นนอกสุด
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not memtrace_enabled() or getattr(_local, 'depth', 0):
+                return func(*args, **kwargs)
+
+            _local.depth = 1
+            try:
+                baseline, shared_start = _begin()
+                before = tracemalloc.take_snapshot()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    current, peak, shared_end, snapshot = _end()
+                    _report(operation, baseline, current, peak, before, snapshot, shared_start or shared_end)
+            finally:
+                _local.depth = 0
+        return wrapper
+    return decorate
+
+
+def _report(operation, baseline, current, peak, before, snapshot, shared):
+    budget = memory_budget_bytes(operation)
+    sample = {
+        'at': timezone.now(),
+        'operation': operation,
+        'peak_bytes': max(0, peak - baseline),
+        'retained_bytes': max(0, current - baseline),
+        'budget_bytes': budget,
+        'over_budget': bool(budget) and peak - baseline > budget,
+        'shared': shared,
+        'top_sites': top_allocation_sites(
+            snapshot, before, getattr(settings, 'HR_MEMTRACE_TOP_SITES', MEMTRACE_TOP_SITES),
+        ),
+    }
+    record_trace(sample)
+    MEMORY_PEAK_BYTES.set(sample['peak_bytes'], operation=operation)
+
+    if sample['over_budget']:
+        logger.warning(
+            "memory ของ %s สูงสุด %.1f MB เกิน budget %.1f MB%s; บรรทัดที่จองมากสุด: %s",
+            operation,
+            sample['peak_bytes'] / 1048576,
+            budget / 1048576,
+            " (มีงานอื่นถูกวัดพร้อมกัน)" if shared else "",
+            "; ".join(f"{site} {size / 1048576:.1f} MB" for site, size, _ in sample['top_sites'][:3]) or "-",
+        )
+    else:
+        logger.debug("memory ของ %s สูงสุด %d bytes", operation, sample['peak_bytes'])
+    return sample
@@ -0,0 +1,462 @@
+"""
+metrics แบบ Prometheus (counter / gauge / histogram) สำหรับงานหลักของระบบ HR
+
+- เปิดด้วย HR_METRICS=1 (ปิด = inc/observe คืนทันที, MetricsMiddleware ถอดตัวเองออก)
+- เก็บค่าใน memory ของแต่ละ process แล้วเขียนลงไฟล์ของ process นั้นใน HR_METRICS_DIR
+  (<pid>-<เวลาเริ่ม>.json, เขียนไฟล์ใหม่แล้ว rename ทับ) อย่างช้าทุก HR_METRICS_FLUSH_SECONDS
+  -> ไม่มี lock ข้าม process ตอนเก็บค่า
+- ตอน scrape (app_hr:metrics) รวมไฟล์ของทุก process:
+    counter / histogram = บวกกัน, gauge = ค่าที่ตั้งล่าสุด
+  ไฟล์ของ process ที่ตายแล้ว (เช่น gunicorn worker ที่ถูก restart) ถูกรวมเข้า archive.json
+  ค่า counter จึงไม่หายและจำนวนไฟล์ไม่โตเรื่อย ๆ
+- worker ที่ fork จาก master (gunicorn --preload) เริ่มนับใหม่ของตัวเอง ไม่ลากค่าของ master มา
+
+ประกาศ metric ใหม่: ใช้ counter() / gauge() / histogram() ระดับ module (ชื่อห้ามซ้ำ)
+ค่าที่คำนวณตอน scrape (เช่นความยาวคิว): register_collector()
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+try:
+    import fcntl
+except ImportError:  # Windows: ไม่รวมไฟล์ของ process ที่ตายแล้ว (ใช้ตอน dev เท่านั้น)
+    fcntl = None
+
+
+METRICS_FLUSH_SECONDS = 1.0
+METRICS_ARCHIVE_FILE = 'archive.json'
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# เวลา request หน้าเว็บ (วินาที)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# งานก้อนใหญ่: รันเงินเดือน / นำเข้า / ส่งออก
+JOB_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+METRICS = {}      # name -> Metric (ตามลำดับที่ประกาศ)
+COLLECTORS = []   # callable() -> [(name, type, help, [(labels dict, value)])]
+
+
+def metrics_enabled():
+    return getattr(settings, 'HR_METRICS', False)
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'HR_METRICS_DIR', settings.BASE_DIR / 'var' / 'metrics'))
+
+
+# ===== ค่าของ process นี้ =====
+
+class _ProcessValues:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count ต่อ bucket (รวม +Inf), sum]
+        self.gauges = {}      # (name, labels) -> (value, เวลาที่ตั้ง)
+        self.timer = None
+
+    @property
+    def filename(self):
+        return f"{self.pid}-{int(self.started * 1000)}.json"
+
+    def snapshot(self):
+        return {
+            'pid': self.pid,
+            'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+            'histograms': [
+                [name, list(labels), buckets[:-1], buckets[-1]]
+                for (name, labels), buckets in self.histograms.items()
+            ],
+            'gauges': [[name, list(labels), value, ts] for (name, labels), (value, ts) in self.gauges.items()],
+        }
+
+
+_lock = threading.Lock()
+_values = _ProcessValues()
+
+
+def _current():
+    """
+    ค่าของ process ปัจจุบัน (ต้องถือ _lock) ; หลัง fork เริ่มชุดใหม่
+    """
+    global _values
+    if _values.pid != os.getpid():
+        _values = _ProcessValues()
+    return _values
+
+
+def _schedule_flush(values):
+    # ต้องถือ _lock ; ตั้ง timer ครั้งเดียวต่อรอบ ค่าที่เปลี่ยนระหว่างรอจะถูกเขียนไปพร้อมกัน
+    if values.timer is None:
+        values.timer = threading.Timer(
+            getattr(settings, 'HR_METRICS_FLUSH_SECONDS', METRICS_FLUSH_SECONDS), flush_metrics,
+        )
+        values.timer.daemon = True
+        values.timer.start()
+
+
+def _write_json(path, data):
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def flush_metrics():
+    """
+    เขียนค่าของ process นี้ลงไฟล์ (แทนที่ไฟล์เดิมทั้งไฟล์)
+    """
+    with _lock:
+        values = _current()
+        values.timer = None
+        if not (values.counters or values.histograms or values.gauges):
+            return
+        data = values.snapshot()
+        filename = values.filename
+    directory = metrics_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    _write_json(directory / filename, data)
+
+
+atexit.register(lambda: metrics_enabled() and flush_metrics())
+
+
+# ===== ชนิดของ metric =====
+
+class Metric:
+    type = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not metrics_enabled():
+            return
+        key = (self.name, self._labels(labels))
+        with _lock:
+            values = _current()
+            values.counters[key] = values.counters.get(key, 0) + amount
+            _schedule_flush(values)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        if not metrics_enabled():
+            return
+        key = (self.name, self._labels(labels))
+        with _lock:
+            values = _current()
+            values.gauges[key] = (value, time.time())
+            _schedule_flush(values)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not metrics_enabled():
+            return
+        key = (self.name, self._labels(labels))
+        index = len(self.buckets)  # +Inf
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with _lock:
+            values = _current()
+            counts = values.histograms.get(key)
+            if counts is None:
+                counts = values.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+            _schedule_flush(values)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def _register(metric):
+    if metric.name in METRICS:
+        raise ValueError(f"metric {metric.name} ถูกประกาศไปแล้ว")
+    METRICS[metric.name] = metric
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def register_collector(func):
+    COLLECTORS.append(func)
+    return func
+
+
+# ===== metric ของระบบ =====
+
+REQUEST_LATENCY = histogram(
+    'hr_http_request_duration_seconds', 'เวลาตอบ request แยกตาม view',
+    ('view', 'method', 'status'),
+)
+PAYROLL_RUN_SECONDS = histogram(
+    'hr_payroll_run_duration_seconds', 'เวลารันเงินเดือนทั้งงวด', ('kind',), buckets=JOB_BUCKETS,
+)
+PAYROLL_EMPLOYEES = counter(
+    'hr_payroll_employees_total', 'จำนวนพนักงานที่ถูกคำนวณเงินเดือน (รวมทุกครั้งที่รัน)', ('kind',),
+)
+PAYROLL_EMPLOYEES_PER_SECOND = gauge(
+    'hr_payroll_employees_per_second', 'ความเร็วของการรันเงินเดือนครั้งล่าสุด (คน/วินาที)', ('kind',),
+)
+IMPORT_SECONDS = histogram(
+    'hr_import_duration_seconds', 'เวลานำเข้าไฟล์ CSV ทั้งไฟล์', ('kind',), buckets=JOB_BUCKETS,
+)
+IMPORT_ROWS = counter(
+    'hr_import_rows_total', 'จำนวนแถวที่นำเข้า แยกตามผล', ('kind', 'result'),
+)
+IMPORT_ERRORS = counter(
+    'hr_import_errors_total', 'จำนวนแถวที่นำเข้าไม่ได้', ('kind',),
+)
+IMPORT_ROWS_PER_SECOND = gauge(
+    'hr_import_rows_per_second', 'ความเร็วของการนำเข้าครั้งล่าสุด (แถว/วินาที)', ('kind',),
+)
+EXPORT_SECONDS = histogram(
+    'hr_export_duration_seconds', 'เวลาสร้างไฟล์ส่งออก', ('kind',), buckets=JOB_BUCKETS,
+)
+EXPORT_ROWS = counter(
+    'hr_export_rows_total', 'จำนวนแถวที่ส่งออก', ('kind',),
+)
+PDF_RENDER_SECONDS = histogram(
+    'hr_pdf_render_duration_seconds', 'เวลาสร้างเอกสาร PDF / หน้าพิมพ์ (output = pdf / html / error)',
+    ('document', 'output'), buckets=REQUEST_BUCKETS,
+)
+
+
+# ===== รวมค่าจากทุก process =====
+
+def _empty_merged():
+    return {'counters': {}, 'histograms': {}, 'gauges': {}}
+
+
+def _merge(merged, data):
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(labels))
+        merged['counters'][key] = merged['counters'].get(key, 0) + value
+    for name, labels, counts, total in data.get('histograms', []):
+        key = (name, tuple(labels))
+        current = merged['histograms'].get(key)
+        if current is None:
+            merged['histograms'][key] = [list(counts), total]
+        elif len(current[0]) == len(counts):  # bucket เปลี่ยนระหว่าง deploy -> ข้ามของเก่า
+            current[0] = [a + b for a, b in zip(current[0], counts)]
+            current[1] += total
+    for name, labels, value, ts in data.get('gauges', []):
+        key = (name, tuple(labels))
+        if key not in merged['gauges'] or merged['gauges'][key][1] <= ts:
+            merged['gauges'][key] = (value, ts)
+
+
+def _as_data(merged):
+    return {
+        'counters': [[n, list(l), v] for (n, l), v in merged['counters'].items()],
+        'histograms': [[n, list(l), c, s] for (n, l), (c, s) in merged['histograms'].items()],
+        'gauges': [[n, list(l), v, ts] for (n, l), (v, ts) in merged['gauges'].items()],
+    }
+
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def compact_dead_processes():
+    """
+    รวมไฟล์ของ process ที่ไม่อยู่แล้วเข้า archive.json แล้วลบทิ้ง คืนจำนวนไฟล์ที่รวม
+    ถือ flock ของโฟลเดอร์ไว้ กันสอง scrape รวมไฟล์เดียวกันซ้ำ
+    """
+    directory = metrics_dir()
+    if fcntl is None or not directory.exists():
+        return 0
+    with _lock:
+        own = _current().filename
+    with open(directory / '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        archive_path = directory / METRICS_ARCHIVE_FILE
+        dead = []
+        for path in directory.glob('*-*.json'):
+            if path.name == own:
+                continue
+            try:
+                pid = int(path.name.split('-', 1)[0])
+            except ValueError:
+                continue
+            if not _pid_alive(pid):
+                dead.append(path)
+        if not dead:
+            return 0
+
+        merged = _empty_merged()
+        _merge(merged, _read_json(archive_path) or {})
+        for path in dead:
+            _merge(merged, _read_json(path) or {})
+        _write_json(archive_path, _as_data(merged))
+        for path in dead:
+            path.unlink()
+        return len(dead)
+
+
+def collect_metrics():
+    """
+    ค่าของทุก process รวมกัน (flush ของ process นี้ก่อนอ่าน)
+    """
+    flush_metrics()
+    compact_dead_processes()
+    merged = _empty_merged()
+    directory = metrics_dir()
+    if directory.exists():
+        for path in directory.glob('*.json'):
+            data = _read_json(path)
+            if data:
+                _merge(merged, data)
+    return merged
+
+
+# ===== Prometheus text format =====
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if math.isnan(value):
+            return 'NaN'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_bound(bound):
+    return '+Inf' if math.isinf(bound) else repr(float(bound))
+
+
+def render_prometheus(merged=None):
+    merged = collect_metrics() if merged is None else merged
+    lines = []
+
+    for metric in METRICS.values():
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+
+        if metric.type == 'histogram':
+            bounds = list(metric.buckets) + [math.inf]
+            series = sorted((k, v) for k, v in merged['histograms'].items() if k[0] == metric.name)
+            for (_, labels), (counts, total) in series:
+                if len(counts) != len(bounds):
+                    continue
+                pairs = list(zip(metric.labelnames, labels))
+                cumulative = 0
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    lines.append(
+                        f"{metric.name}_bucket{_format_labels(pairs + [('le', _format_bound(bound))])} {cumulative}"
+                    )
+                lines.append(f"{metric.name}_sum{_format_labels(pairs)} {_format_value(float(total))}")
+                lines.append(f"{metric.name}_count{_format_labels(pairs)} {cumulative}")
+            continue
+
+        source = merged['counters'] if metric.type == 'counter' else merged['gauges']
+        for (_, labels), value in sorted((k, v) for k, v in source.items() if k[0] == metric.name):
+            if metric.type == 'gauge':
+                value = value[0]
+            suffix = '_total' if metric.type == 'counter' and not metric.name.endswith('_total') else ''
+            lines.append(
+                f"{metric.name}{suffix}{_format_labels(list(zip(metric.labelnames, labels)))} {_format_value(value)}"
+            )
+
+    for collector in COLLECTORS:
+        for name, metric_type, documentation, samples in collector():
+            lines.append(f"# HELP {name} {_escape(documentation)}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+# ===== middleware =====
+
+class MetricsMiddleware:
+    """
+    เวลาตอบของทุก request -> hr_http_request_duration_seconds (label = ชื่อ view ไม่ใช่ path
+    กันจำนวน series บวมตาม pk) ; StreamingHttpResponse นับถึงตอนเริ่มส่ง body
+    """
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+        return response
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 22:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0005_employeetaxprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceMonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('status', models.CharField(choices=[('present', 'มาทำงาน'), ('late', 'มาสาย'), ('absent', 'ขาด'), ('leave', 'ลา'), ('holiday', 'วันหยุด')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_summaries', to='app_hr.employee')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['year', 'month'], name='att_summary_year_month_idx')],
+                'unique_together': {('employee', 'year', 'month', 'status')},
+            },
+        ),
+    ]
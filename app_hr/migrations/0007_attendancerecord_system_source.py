@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0006_attendancemonthlysummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendancerecord',
+            name='source',
+            field=models.CharField(choices=[('csv', 'นำเข้าจาก CSV'), ('manual', 'กรอกด้วยมือ'), ('system', 'ระบบปิดวัน (ไม่มีบันทึกเข้างาน)')], default='manual', max_length=20),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.26 on 2026-10-18 22:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0007_attendancerecord_system_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True, verbose_name='รหัสกะ')),
+                ('name', models.CharField(max_length=100, verbose_name='ชื่อกะ')),
+                ('start_time', models.TimeField(verbose_name='เวลาเริ่มกะ')),
+                ('end_time', models.TimeField(verbose_name='เวลาเลิกกะ')),
+                ('late_after_minutes', models.PositiveIntegerField(default=15, verbose_name='มาสายเกิน (นาที)')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShiftAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(blank=True, max_length=100, null=True, verbose_name='แผนก')),
+                ('effective_from', models.DateField(verbose_name='มีผลตั้งแต่')),
+                ('effective_to', models.DateField(blank=True, null=True, verbose_name='มีผลถึง')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='shift_assignments', to='app_hr.employee')),
+                ('shift', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='app_hr.shiftschedule')),
+            ],
+            options={
+                'ordering': ['-effective_from'],
+            },
+        ),
+    ]
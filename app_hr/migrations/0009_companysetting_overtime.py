@@ -0,0 +1,35 @@
+# Generated by Django 4.2.26 on 2026-10-18 22:56
+
+import datetime
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0008_shiftschedule_shiftassignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companysetting',
+            name='ot_holiday_rate',
+            field=models.DecimalField(decimal_places=2, default=Decimal('3.00'), max_digits=4, verbose_name='อัตรา OT วันหยุดนักขัตฤกษ์ (เท่า)'),
+        ),
+        migrations.AddField(
+            model_name='companysetting',
+            name='ot_weekday_rate',
+            field=models.DecimalField(decimal_places=2, default=Decimal('1.50'), max_digits=4, verbose_name='อัตรา OT วันทำงาน (เท่า)'),
+        ),
+        migrations.AddField(
+            model_name='companysetting',
+            name='ot_weekend_rate',
+            field=models.DecimalField(decimal_places=2, default=Decimal('2.00'), max_digits=4, verbose_name='อัตรา OT วันเสาร์-อาทิตย์ (เท่า)'),
+        ),
+        migrations.AddField(
+            model_name='companysetting',
+            name='work_end_time',
+            field=models.TimeField(default=datetime.time(18, 0), verbose_name='เวลาเลิกงานปกติ'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0009_companysetting_overtime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payslip',
+            name='day_breakdown',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.26 on 2026-10-18 23:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0010_payslip_day_breakdown'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('token_hash', models.CharField(editable=False, max_length=64, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='attendancerecord',
+            name='source',
+            field=models.CharField(choices=[('csv', 'นำเข้าจาก CSV'), ('manual', 'กรอกด้วยมือ'), ('system', 'ระบบปิดวัน (ไม่มีบันทึกเข้างาน)'), ('device', 'เครื่องสแกน (ส่งเข้ามาอัตโนมัติ)')], default='manual', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='AttendanceDeviceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=100)),
+                ('employee_code', models.CharField(max_length=20)),
+                ('kind', models.CharField(choices=[('in', 'เข้างาน'), ('out', 'ออกงาน')], max_length=10)),
+                ('occurred_at', models.DateTimeField()),
+                ('work_date', models.DateField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='app_hr.attendancedevice')),
+            ],
+            options={
+                'unique_together': {('device', 'event_id')},
+            },
+        ),
+    ]
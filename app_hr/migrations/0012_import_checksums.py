@@ -0,0 +1,41 @@
+# Generated by Django 4.2.26 on 2026-10-18 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0011_attendance_device'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRowHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('attendance', 'การเข้างาน'), ('employee', 'พนักงาน')], max_length=20)),
+                ('row_key', models.CharField(max_length=100)),
+                ('row_hash', models.CharField(max_length=32)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'row_key')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('attendance', 'การเข้างาน'), ('employee', 'พนักงาน')], max_length=20)),
+                ('checksum', models.CharField(max_length=64)),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-imported_at'],
+                'unique_together': {('kind', 'checksum')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.26 on 2026-10-18 23:08
+
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from app_hr.search import install_employee_search_index
+    install_employee_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from app_hr.search import uninstall_employee_search_index
+    uninstall_employee_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0012_import_checksums'),
+    ]
+
+    operations = [
+        # SQLite เท่านั้น (FTS5 trigram) ; DB อื่นไม่ทำอะไร ค้นด้วย icontains ตามเดิม
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.26 on 2026-10-18 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0013_employee_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['work_date', 'employee'], name='att_date_emp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['status', 'work_date'], name='att_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['code'], name='emp_active_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['department', 'code'], name='emp_dept_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverecord',
+            index=models.Index(fields=['employee', 'status', 'start_date', 'end_date'], name='leave_emp_status_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverecord',
+            index=models.Index(fields=['status', 'start_date', 'end_date'], name='leave_status_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payslip',
+            index=models.Index(fields=['period', 'employee'], name='payslip_period_emp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payslipitem',
+            index=models.Index(fields=['payslip', 'item_type', 'deduction_type'], name='payslipitem_type_idx'),
+        ),
+    ]
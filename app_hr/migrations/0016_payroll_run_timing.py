@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-18 23:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app_hr', '0015_write_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('run', 'หน้าสร้างสลิปเงินเดือน'), ('generate', 'generate_payslips (admin)')], default='run', max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('duration_ms', models.FloatField(default=0)),
+                ('employee_count', models.PositiveIntegerField(default=0)),
+                ('query_count', models.PositiveIntegerField(default=0)),
+                ('spans', models.JSONField(blank=True, default=list)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='app_hr.payrollperiod')),
+                ('run_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-started_at', '-id'],
+            },
+        ),
+    ]
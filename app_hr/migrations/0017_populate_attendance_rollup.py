@@ -0,0 +1,47 @@
+# Generated by Django 4.2.26 on 2026-10-19 09:12
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def populate(apps, schema_editor):
+    """
+    สร้าง rollup จาก AttendanceRecord ที่มีอยู่ก่อนตาราง summary ถูกสร้าง
+    (0006 สร้างตารางเปล่า ; หลังจากนี้ rollup ตามการเขียนเอง)
+    """
+    AttendanceRecord = apps.get_model('app_hr', 'AttendanceRecord')
+    AttendanceMonthlySummary = apps.get_model('app_hr', 'AttendanceMonthlySummary')
+
+    counts = (
+        AttendanceRecord.objects
+        .annotate(y=ExtractYear('work_date'), m=ExtractMonth('work_date'))
+        .values('employee_id', 'y', 'm', 'status')
+        .annotate(c=Count('id'))
+        .order_by()
+    )
+    AttendanceMonthlySummary.objects.all().delete()
+    AttendanceMonthlySummary.objects.bulk_create(
+        [
+            AttendanceMonthlySummary(
+                employee_id=row['employee_id'],
+                year=row['y'],
+                month=row['m'],
+                status=row['status'],
+                count=row['c'],
+            )
+            for row in counts.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0016_payroll_run_timing'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.26 on 2026-10-19 10:05
+
+from django.db import migrations
+from django.db.models import Q
+
+
+# label ของ OT ที่การรันเงินเดือนเคยสร้างไว้ใต้ EarningType 'OT' (payroll.OT_KINDS)
+GENERATED_OT_LABELS = (
+    'ค่าล่วงเวลา (OT) วันทำงาน',
+    'ค่าล่วงเวลา (OT) เสาร์-อาทิตย์',
+    'ค่าล่วงเวลา (OT) วันหยุดนักขัตฤกษ์',
+)
+
+
+def move_generated_overtime(apps, schema_editor):
+    """
+    ย้าย PayslipItem OT ที่การรันเงินเดือนสร้างไว้ (ใต้ 'OT') ไปอยู่ใต้ 'OT_ATTENDANCE'
+    เพื่อให้การรันครั้งต่อไปลบ/สร้างใหม่ได้ตาม EarningType โดยไม่แตะ OT ที่ HR คีย์เอง
+    """
+    EarningType = apps.get_model('app_hr', 'EarningType')
+    PayslipItem = apps.get_model('app_hr', 'PayslipItem')
+
+    manual = EarningType.objects.filter(code='OT').first()
+    if manual is None:
+        return
+
+    generated = Q()
+    for label in GENERATED_OT_LABELS:
+        generated |= Q(name__startswith=f'{label} ')
+    items = PayslipItem.objects.filter(generated, earning_type=manual)
+    if not items.exists():
+        return
+
+    ot_type, _ = EarningType.objects.get_or_create(
+        code='OT_ATTENDANCE',
+        defaults={
+            'name': 'ค่าล่วงเวลา (OT) จากเวลาเข้า-ออก',
+            'is_taxable': manual.is_taxable,
+            'is_ssf': manual.is_ssf,
+        }
+    )
+    items.update(earning_type=ot_type)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_hr', '0017_populate_attendance_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_generated_overtime, migrations.RunPython.noop),
+    ]
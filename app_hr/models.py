@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.db import models
 from datetime import time, date
 from django.db import models
@@ -5,6 +8,10 @@ from django.contrib.auth.models import User
 from decimal import Decimal
 from django.db.models import Sum, Q
 
+from .memtrace import memory_traced
+from .metrics import PAYROLL_EMPLOYEES, PAYROLL_EMPLOYEES_PER_SECOND, PAYROLL_RUN_SECONDS
+from .timing import SpanRecorder
+
 
 class Employee(models.Model):
     STATUS_CHOICES = (
@@ -51,6 +58,14 @@ class Employee(models.Model):
 
     citizen_id = models.CharField(max_length=20, blank=True, null=True, verbose_name="เลขบัตรประชาชน")
 
+    class Meta:
+        indexes = [
+            # รายการพนักงาน active เรียงตามรหัส (รันเงินเดือน / ปิดวัน / สรุปการลา)
+            models.Index(fields=['code'], condition=Q(status='active'), name='emp_active_code_idx'),
+            # กรองตามแผนก + เรียงตามรหัส (ตารางเข้างาน / สลิป / export)
+            models.Index(fields=['department', 'code'], name='emp_dept_code_idx'),
+        ]
+
     def __str__(self):
         return f"{self.code} - {self.first_name} {self.last_name}"
     
@@ -191,42 +206,51 @@ class PayrollPeriod(models.Model):
     def __str__(self):
         return f"งวดเงินเดือน {self.month:02d}/{self.year}"
 
-    def generate_payslips(self):
+    @memory_traced('payroll_generate')
+    def generate_payslips(self, user=None):
         """
         สร้าง payslip ให้พนักงานทุกคนที่ active
         + เติมรายการฐานเงินเดือนอัตโนมัติ
+        จับเวลาแต่ละขั้นตอนแล้วบันทึกเป็น PayrollRun (kind = generate)
         """
         from .models import Employee, Payslip, PayslipItem, EarningType  # import วนในฟังก์ชันกัน circular
 
-        base_type, _ = EarningType.objects.get_or_create(
-            code='BASE_SALARY',
-            defaults={
-                'name': 'เงินเดือนพื้นฐาน',
-                'is_taxable': True,
-                'is_ssf': True,
-            }
-        )
-
-        active_emps = Employee.objects.filter(status='active')
-
-        for emp in active_emps:
-            payslip, created = Payslip.objects.get_or_create(
-                employee=emp,
-                period=self,
+        spans = SpanRecorder()
+        with spans.span('prepare_types'):
+            base_type, _ = EarningType.objects.get_or_create(
+                code='BASE_SALARY',
+                defaults={
+                    'name': 'เงินเดือนพื้นฐาน',
+                    'is_taxable': True,
+                    'is_ssf': True,
+                }
             )
 
-            # ถ้าเพิ่งสร้าง payslip ใหม่ ให้เติมฐานเงินเดือนเข้าไป
-            if created:
-                PayslipItem.objects.create(
-                    payslip=payslip,
-                    item_type='earning',
-                    earning_type=base_type,
-                    name='ฐานเงินเดือน',
-                    amount=emp.base_salary,
+        with spans.span('load_employees') as span:
+            active_emps = list(Employee.objects.filter(status='active'))
+            span['rows'] = len(active_emps)
+
+        with spans.span('generate_payslips', rows=len(active_emps)):
+            for emp in active_emps:
+                payslip, created = Payslip.objects.get_or_create(
+                    employee=emp,
+                    period=self,
                 )
 
-            # คำนวณยอดรวมอัพเดต
-            payslip.recalc_totals()
+                # ถ้าเพิ่งสร้าง payslip ใหม่ ให้เติมฐานเงินเดือนเข้าไป
+                if created:
+                    PayslipItem.objects.create(
+                        payslip=payslip,
+                        item_type='earning',
+                        earning_type=base_type,
+                        name='ฐานเงินเดือน',
+                        amount=emp.base_salary,
+                    )
+
+                # คำนวณยอดรวมอัพเดต
+                payslip.recalc_totals()
+
+        return PayrollRun.record(self, spans, kind='generate', employee_count=len(active_emps), user=user)
 
 class EarningType(models.Model):
     """ประเภทรายรับ เช่น เงินเดือน, OT, ค่าคอม"""
@@ -258,10 +282,17 @@ class Payslip(models.Model):
     total_deduction = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="รายหักรวม")
     net_income = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="รับสุทธิ")
 
+    # รายละเอียดวันทำงาน/วันไม่จ่ายรายวัน ณ ตอนรันเงินเดือน (1 byte ต่อวัน ดู payroll.encode_day_breakdown)
+    day_breakdown = models.BinaryField(blank=True, null=True, editable=False)
+
     generated_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('employee', 'period')
+        indexes = [
+            # สลิปทั้งงวด join พนักงาน (รันเงินเดือน / export / รายการสลิปตามงวด)
+            models.Index(fields=['period', 'employee'], name='payslip_period_emp_idx'),
+        ]
 
     def __str__(self):
         return f"Payslip {self.employee} - {self.period}"
@@ -430,6 +461,12 @@ class PayslipItem(models.Model):
     name = models.CharField(max_length=100, verbose_name="ชื่อรายการ")
     amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="จำนวนเงิน")
 
+    class Meta:
+        indexes = [
+            # ยอดรวมรายรับ/รายหักต่อสลิป และหา item ประกันสังคม/ภาษีของสลิป
+            models.Index(fields=['payslip', 'item_type', 'deduction_type'], name='payslipitem_type_idx'),
+        ]
+
     def __str__(self):
         direction = "+" if self.item_type == 'earning' else "-"
         return f"{direction}{self.amount} {self.name}"
@@ -439,10 +476,25 @@ class CompanySetting(models.Model):
     ตั้งค่าทั่วไปของบริษัท (ใช้ 1 record)
     - เวลาเริ่มงานปกติ
     - กี่นาทีหลังจากนั้นถือว่าสาย
+    - เวลาเลิกงาน + อัตรา OT (เท่าของค่าจ้างรายชั่วโมง)
     """
     name = models.CharField(max_length=100, default="default", unique=True)
     work_start_time = models.TimeField(default=time(9, 0), verbose_name="เวลาเริ่มงานปกติ")
     late_after_minutes = models.PositiveIntegerField(default=15, verbose_name="มาสายเกิน (นาที)")
+    work_end_time = models.TimeField(default=time(18, 0), verbose_name="เวลาเลิกงานปกติ")
+
+    ot_weekday_rate = models.DecimalField(
+        max_digits=4, decimal_places=2, default=Decimal("1.50"),
+        verbose_name="อัตรา OT วันทำงาน (เท่า)"
+    )
+    ot_weekend_rate = models.DecimalField(
+        max_digits=4, decimal_places=2, default=Decimal("2.00"),
+        verbose_name="อัตรา OT วันเสาร์-อาทิตย์ (เท่า)"
+    )
+    ot_holiday_rate = models.DecimalField(
+        max_digits=4, decimal_places=2, default=Decimal("3.00"),
+        verbose_name="อัตรา OT วันหยุดนักขัตฤกษ์ (เท่า)"
+    )
 
     def __str__(self):
         return "Company Settings"
@@ -510,6 +562,15 @@ class LeaveRecord(models.Model):
 
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # หาการลาที่ทับช่วงวันที่ของพนักงานกลุ่มหนึ่ง (วันไม่จ่าย / สถานะเข้างาน)
+            models.Index(
+                fields=['employee', 'status', 'start_date', 'end_date'],
+                name='leave_emp_status_range_idx',
+            ),
+            # การลาที่อนุมัติแล้วทับช่วงวันที่ ทั้งบริษัท / สรุปการลารายปี
+            models.Index(fields=['status', 'start_date', 'end_date'], name='leave_status_range_idx'),
+        ]
 
     def __str__(self):
         return f"{self.employee} - {self.leave_type} ({self.start_date} - {self.end_date})"
@@ -535,6 +596,8 @@ class AttendanceRecord(models.Model):
     SOURCE_CHOICES = (
         ('csv', 'นำเข้าจาก CSV'),
         ('manual', 'กรอกด้วยมือ'),
+        ('system', 'ระบบปิดวัน (ไม่มีบันทึกเข้างาน)'),
+        ('device', 'เครื่องสแกน (ส่งเข้ามาอัตโนมัติ)'),
     )
 
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendances')
@@ -550,46 +613,331 @@ class AttendanceRecord(models.Model):
     class Meta:
         unique_together = ('employee', 'work_date')
         ordering = ['-work_date', 'employee__code']
+        indexes = [
+            # ช่วงวันที่ทุกพนักงาน (ตารางรายวัน / matrix / ปิดวัน / คำนวณสถานะใหม่ / export)
+            models.Index(fields=['work_date', 'employee'], name='att_date_emp_idx'),
+            # สถานะเดียวในช่วงวันที่ (อันดับมาสาย / export ตามสถานะ)
+            models.Index(fields=['status', 'work_date'], name='att_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.work_date} - {self.employee.code} ({self.status})"
 
     def auto_calculate_status(self):
         """
-        ใช้กฎจาก CompanySetting + Holiday + LeaveRecord
+        ใช้กฎจาก CompanySetting / กะการทำงาน + Holiday + LeaveRecord
         เพื่อหาว่าวันนี้ควรเป็นสถานะอะไร
         """
-        settings = CompanySetting.get_solo()
-
-        # 1) ถ้าเป็นวันหยุด
-        if Holiday.objects.filter(date=self.work_date).exists():
-            self.status = 'holiday'
-            return
-
-        # 2) ถ้ามีการลาที่อนุมัติ
-        leave_qs = LeaveRecord.objects.filter(
-            employee=self.employee,
-            status='approved',
-            start_date__lte=self.work_date,
-            end_date__gte=self.work_date,
+        from .attendance import AttendanceStatusResolver  # กัน circular import
+
+        resolver = AttendanceStatusResolver(
+            self.work_date,
+            self.work_date,
+            employee_ids=[self.employee_id],
         )
-        if leave_qs.exists():
-            self.status = 'leave'
-            return
+        self.status = resolver.status_for(self.employee_id, self.work_date, self.check_in)
 
-        # 3) ถ้าไม่มีเวลาเข้าเลย -> ขาด
-        if not self.check_in:
-            self.status = 'absent'
-            return
 
-        # 4) ตรวจสายจากเวลาเข้าเทียบกับ work_start_time + late_after_minutes
-        from datetime import datetime, timedelta
+def calculate_attendance_status(work_date, check_in, is_holiday, on_leave,
+                                work_start_time, late_after_minutes, work_end_time=None):
+    """
+    กฎคำนวณสถานะเข้างาน (ไม่แตะ DB) ใช้ร่วมกันทั้งตอน import และตอนคำนวณใหม่ทั้งก้อน
+    1) วันหยุด -> holiday
+    2) มีการลาที่อนุมัติ -> leave
+    3) ไม่มีเวลาเข้า -> absent
+    4) เข้าหลัง work_start_time + late_after_minutes -> late ไม่งั้น present
+
+    กะข้ามคืน (work_end_time <= work_start_time เช่น 22:00-06:00):
+    เวลาเข้าที่น้อยกว่า work_end_time ถือว่าเป็นเช้าของวันถัดไป
+    """
+    from datetime import datetime, timedelta
 
-        wst = settings.work_start_time
-        late_threshold = (datetime.combine(self.work_date, wst)
-                          + timedelta(minutes=settings.late_after_minutes)).time()
+    if is_holiday:
+        return 'holiday'
+    if on_leave:
+        return 'leave'
+    if not check_in:
+        return 'absent'
 
-        if self.check_in > late_threshold:
-            self.status = 'late'
-        else:
-            self.status = 'present'
+    late_threshold = (datetime.combine(work_date, work_start_time)
+                      + timedelta(minutes=late_after_minutes))
+    check_in_at = datetime.combine(work_date, check_in)
+
+    overnight = work_end_time is not None and work_end_time <= work_start_time
+    if overnight and check_in < work_end_time:
+        check_in_at += timedelta(days=1)
+
+    if check_in_at > late_threshold:
+        return 'late'
+    return 'present'
+
+
+class ShiftSchedule(models.Model):
+    """
+    กะการทำงาน เช่น กะเช้า 08:00-17:00, กะดึก 22:00-06:00
+    ถ้า end_time <= start_time ถือว่าเป็นกะข้ามคืน
+    """
+    code = models.CharField(max_length=50, unique=True, verbose_name="รหัสกะ")
+    name = models.CharField(max_length=100, verbose_name="ชื่อกะ")
+    start_time = models.TimeField(verbose_name="เวลาเริ่มกะ")
+    end_time = models.TimeField(verbose_name="เวลาเลิกกะ")
+    late_after_minutes = models.PositiveIntegerField(default=15, verbose_name="มาสายเกิน (นาที)")
+
+    def __str__(self):
+        return f"{self.name} ({self.start_time:%H:%M}-{self.end_time:%H:%M})"
+
+    @property
+    def is_overnight(self):
+        return self.end_time <= self.start_time
+
+
+class ShiftAssignment(models.Model):
+    """
+    กำหนดกะให้พนักงานรายคน หรือทั้งแผนก แบบมีวันที่มีผล (effective-dated)
+    - ระบุ employee = ใช้กับคนนั้น (มีสิทธิ์เหนือกว่าแบบแผนก)
+    - ระบุ department = ใช้กับทุกคนในแผนกนั้น
+    - effective_to ว่าง = ใช้ไปเรื่อย ๆ
+    """
+    shift = models.ForeignKey(ShiftSchedule, on_delete=models.CASCADE, related_name='assignments')
+    employee = models.ForeignKey(
+        Employee,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='shift_assignments',
+    )
+    department = models.CharField(max_length=100, blank=True, null=True, verbose_name="แผนก")
+    effective_from = models.DateField(verbose_name="มีผลตั้งแต่")
+    effective_to = models.DateField(blank=True, null=True, verbose_name="มีผลถึง")
+
+    class Meta:
+        ordering = ['-effective_from']
+
+    def __str__(self):
+        target = self.employee or self.department or '-'
+        return f"{target}: {self.shift} ({self.effective_from} - {self.effective_to or '...'})"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+
+        if not self.employee_id and not self.department:
+            raise ValidationError("ต้องระบุพนักงาน หรือ แผนก อย่างใดอย่างหนึ่ง")
+        if self.effective_to and self.effective_to < self.effective_from:
+            raise ValidationError("วันสิ้นสุดต้องไม่น้อยกว่าวันเริ่มมีผล")
+
+
+class AttendanceMonthlySummary(models.Model):
+    """
+    ตารางสรุป (rollup) จำนวนวันตามสถานะ ต่อพนักงาน ต่อเดือน
+    - อัปเดตแบบเฉพาะเดือนที่มีการเขียน AttendanceRecord (ดู attendance.refresh_attendance_rollup)
+      โค้ดที่เขียน AttendanceRecord (import, รับจากเครื่องสแกน, ปิดวัน, คำนวณสถานะใหม่)
+      ต้องเรียก refresh_attendance_rollup เองหลังเขียน (ไม่ใช้ signal)
+    - สร้างใหม่ทั้งหมดได้ด้วย manage.py rebuild_attendance_rollup
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_summaries')
+    year = models.IntegerField()
+    month = models.IntegerField()  # 1-12
+    status = models.CharField(max_length=20, choices=AttendanceRecord.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('employee', 'year', 'month', 'status')
+        indexes = [
+            models.Index(fields=['year', 'month'], name='att_summary_year_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} {self.month:02d}/{self.year} {self.status}={self.count}"
+
+
+class AttendanceDevice(models.Model):
+    """
+    เครื่องลงเวลา (time clock) ที่ส่ง event เข้ามาทาง API
+    - เก็บเฉพาะ hash ของ token (token จริงแสดงครั้งเดียวตอนสร้าง)
+    """
+    code = models.CharField(max_length=50, unique=True)
+    name = models.CharField(max_length=100, blank=True)
+    token_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['code']
+
+    def __str__(self):
+        return f"{self.code} - {self.name}" if self.name else self.code
+
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def set_new_token(self):
+        """
+        สุ่ม token ใหม่ เก็บเฉพาะ hash แล้วคืน token จริง (ยังไม่ save)
+        """
+        token = secrets.token_urlsafe(32)
+        self.token_hash = self.hash_token(token)
+        return token
+
+
+class AttendanceDeviceEvent(models.Model):
+    """
+    event ดิบจากเครื่องลงเวลา (1 ครั้งที่สแกน)
+    unique (device, event_id) -> เครื่องส่งซ้ำ (retry) ไม่ถูกนับซ้ำ
+    """
+    KIND_CHOICES = (
+        ('in', 'เข้างาน'),
+        ('out', 'ออกงาน'),
+    )
+
+    device = models.ForeignKey(AttendanceDevice, on_delete=models.CASCADE, related_name='events')
+    event_id = models.CharField(max_length=100)
+    employee_code = models.CharField(max_length=20)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    occurred_at = models.DateTimeField()
+    work_date = models.DateField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('device', 'event_id')
+
+    def __str__(self):
+        return f"{self.device_id}:{self.event_id} {self.employee_code} {self.kind}"
+
+
+class ImportFile(models.Model):
+    """
+    ไฟล์ CSV ที่นำเข้าสำเร็จแล้ว (เก็บ checksum ไว้ ถ้าอัปโหลดไฟล์เดิมซ้ำจะข้ามทันที)
+    """
+    KIND_CHOICES = (
+        ('attendance', 'การเข้างาน'),
+        ('employee', 'พนักงาน'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    checksum = models.CharField(max_length=64)  # sha256 ของเนื้อไฟล์
+    filename = models.CharField(max_length=255, blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('kind', 'checksum')
+        ordering = ['-imported_at']
+
+    def __str__(self):
+        return f"{self.kind}: {self.filename} ({self.checksum[:12]})"
+
+
+class ImportRowHash(models.Model):
+    """
+    hash ของเนื้อหาแถวล่าสุดที่นำเข้าจากไฟล์ ต่อ key ของแถว
+    (attendance: "รหัสพนักงาน|วันที่", employee: รหัสพนักงาน)
+    แถวที่ hash เท่าเดิม = ไม่ได้แก้ -> ไม่ต้องเขียน DB ซ้ำ
+    """
+    kind = models.CharField(max_length=20, choices=ImportFile.KIND_CHOICES)
+    row_key = models.CharField(max_length=100)
+    row_hash = models.CharField(max_length=32)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'row_key')
+
+    def __str__(self):
+        return f"{self.kind}:{self.row_key}"
+
+
+class WriteJob(models.Model):
+    """
+    งานเขียนข้อมูลก้อนใหญ่ที่ส่งเข้าคิว ให้ writer process ตัวเดียวทำทีละงาน
+    (รันเงินเดือน / นำเข้า CSV / คำนวณสถานะเข้างานใหม่) ดู app_hr.writequeue
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'รอคิว'),
+        (STATUS_RUNNING, 'กำลังทำ'),
+        (STATUS_DONE, 'เสร็จแล้ว'),
+        (STATUS_FAILED, 'ล้มเหลว'),
+    )
+
+    kind = models.CharField(max_length=50)
+    label = models.CharField(max_length=200, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-enqueued_at', '-id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='writejob_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    @property
+    def wait_seconds(self):
+        if self.started_at is None:
+            return None
+        return (self.started_at - self.enqueued_at).total_seconds()
+
+    @property
+    def run_seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+
+class PayrollRun(models.Model):
+    """
+    บันทึกการรันเงินเดือน 1 ครั้ง + เวลาแต่ละขั้นตอน (ใช้เทียบความเร็วระหว่างรอบ)
+    spans = [{'name', 'duration_ms', 'rows', 'queries'}, ...] จาก timing.SpanRecorder
+    """
+    KIND_CHOICES = (
+        ('run', 'หน้าสร้างสลิปเงินเดือน'),
+        ('generate', 'generate_payslips (admin)'),
+    )
+
+    period = models.ForeignKey(PayrollPeriod, on_delete=models.CASCADE, related_name='runs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='run')
+    started_at = models.DateTimeField()
+    duration_ms = models.FloatField(default=0)
+    employee_count = models.PositiveIntegerField(default=0)
+    query_count = models.PositiveIntegerField(default=0)
+    spans = models.JSONField(default=list, blank=True)
+    run_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at', '-id']
+
+    def __str__(self):
+        return f"{self.period} ({self.started_at:%Y-%m-%d %H:%M}, {self.duration_ms:.0f} ms)"
+
+    @classmethod
+    def record(cls, period, spans, kind='run', employee_count=0, user=None):
+        seconds = spans.total_ms / 1000
+        PAYROLL_RUN_SECONDS.observe(seconds, kind=kind)
+        PAYROLL_EMPLOYEES.inc(employee_count, kind=kind)
+        if seconds > 0:
+            PAYROLL_EMPLOYEES_PER_SECOND.set(round(employee_count / seconds, 2), kind=kind)
+        return cls.objects.create(
+            period=period,
+            kind=kind,
+            started_at=spans.started_at,
+            duration_ms=spans.total_ms,
+            employee_count=employee_count,
+            query_count=spans.total_queries,
+            spans=spans.as_list(),
+            run_by=user if user is not None and user.is_authenticated else None,
+        )
@@ -0,0 +1,209 @@
+"""
+แบ่งหน้าแบบ keyset (seek) สำหรับรายการยาว ๆ (พนักงาน / สลิปเงินเดือน)
+
+- เรียงด้วย key ที่ไม่ซ้ำกันแน่นอน เช่น (employee__code, id)
+- หน้าถัดไป = WHERE (key) > (ค่าของแถวสุดท้าย) ... LIMIT n
+  -> หน้าลึกแค่ไหนก็ใช้ index เดียวกับหน้าแรก ไม่มี OFFSET
+- cursor = ค่า key ของแถวขอบหน้า เข้ารหัส base64 (ใช้ได้ทั้ง query string ของ HTML และ JSON)
+- จำนวนทั้งหมดนับแบบมีเพดาน (APPROX_COUNT_CAP) ไม่ COUNT(*) ทั้งตาราง
+"""
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+APPROX_COUNT_CAP = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction='next'):
+    payload = json.dumps({'k': [_to_json(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    คืน (values, direction) ; cursor เสีย -> InvalidCursor
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values, direction = payload['k'], payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+def _to_json(value):
+    if isinstance(value, (date, Decimal)):
+        return str(value)
+    return value
+
+
+def get_page_size(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def approximate_count(qs, cap=APPROX_COUNT_CAP):
+    """
+    นับแบบมีเพดาน: คืน (จำนวน, เกินเพดานหรือไม่)
+    SELECT COUNT(*) FROM (... LIMIT cap+1) หยุดนับเมื่อถึงเพดาน
+    """
+    count = qs.order_by()[:cap + 1].count()
+    return min(count, cap), count > cap
+
+
+def _key_value(obj, key):
+    for part in key.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _key_field(model, key):
+    """
+    field ของ key (ตาม relation เช่น 'employee__code' -> Employee.code)
+    """
+    field = None
+    for part in key.split('__'):
+        field = model._meta.get_field(part)
+        if field.is_relation:
+            model = field.related_model
+    return field
+
+
+def clean_cursor_values(model, keys, values):
+    """
+    แปลงค่าใน cursor เป็นชนิดของ field แต่ละ key
+    cursor ถูกแก้มา (ชนิดไม่ตรง / None / object) -> InvalidCursor แทนที่จะไปพังตอน query
+    """
+    if len(values) != len(keys):
+        raise InvalidCursor(values)
+    cleaned = []
+    for key, value in zip(keys, values):
+        if value is None or isinstance(value, (dict, list)):
+            raise InvalidCursor(values)
+        try:
+            cleaned.append(_key_field(model, key).to_python(value))
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor(values)
+    return cleaned
+
+
+def _seek_q(keys, values, op):
+    """
+    (k1, k2, ...) > (v1, v2, ...) แบบที่ทุก DB เข้าใจ:
+    k1 >= v1 AND (k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...)
+    เงื่อนไข k1 >= v1 นำหน้าไว้ให้ DB seek ใน index ได้ (OR อย่างเดียวจะสแกนจากต้น index)
+    """
+    cond = Q()
+    for i, key in enumerate(keys):
+        part = Q(**{f'{key}__{op}': values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            part &= Q(**{prev_key: prev_value})
+        cond |= part
+    return Q(**{f'{keys[0]}__{op}e': values[0]}) & cond
+
+
+class KeysetPage:
+    """
+    ผล 1 หน้า: items + cursor ไปหน้าถัดไป / ก่อนหน้า (None = ไม่มี)
+    """
+
+    def __init__(self, items, page_size, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.page_size = page_size
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(qs, keys, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    ดึง 1 หน้าจาก qs เรียงตาม keys (จากน้อยไปมาก ต้องไม่ซ้ำกันรวมกันทุก key)
+    cursor ไม่ถูกต้อง -> เริ่มหน้าแรก
+    """
+    keys = list(keys)
+    values, direction = None, 'next'
+    if cursor:
+        try:
+            values, direction = decode_cursor(cursor)
+            values = clean_cursor_values(qs.model, keys, values)
+        except InvalidCursor:
+            values, direction = None, 'next'
+
+    if values is None or direction == 'next':
+        if values is not None:
+            qs = qs.filter(_seek_q(keys, values, 'gt'))
+        rows = list(qs.order_by(*keys)[:page_size + 1])
+        more_after = len(rows) > page_size
+        more_before = values is not None
+        rows = rows[:page_size]
+    else:
+        # ย้อนหน้า: เรียงกลับด้าน ดึง n+1 แถวก่อน cursor แล้วกลับลำดับคืน
+        rows = list(
+            qs.filter(_seek_q(keys, values, 'lt')).order_by(*[f'-{k}' for k in keys])[:page_size + 1]
+        )
+        more_before = len(rows) > page_size
+        more_after = True
+        rows = rows[:page_size][::-1]
+
+    next_cursor = prev_cursor = None
+    if rows and more_after:
+        next_cursor = encode_cursor([_key_value(rows[-1], k) for k in keys], 'next')
+    if rows and more_before:
+        prev_cursor = encode_cursor([_key_value(rows[0], k) for k in keys], 'prev')
+    return KeysetPage(rows, page_size, next_cursor, prev_cursor)
+
+
+def list_paginate(items, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    cursor แบบเดียวกันสำหรับผลที่เรียงใน memory แล้ว (เช่นผลค้นหาตามความเกี่ยวข้อง ซึ่งมีเพดานอยู่แล้ว)
+    key = ตำแหน่งในลำดับ
+    """
+    position, direction = -1, 'next'
+    if cursor:
+        try:
+            values, direction = decode_cursor(cursor)
+            position = int(values[0])
+        except (InvalidCursor, IndexError, TypeError, ValueError):
+            position, direction = -1, 'next'
+
+    if direction == 'next':
+        start = max(0, position + 1)
+        end = start + page_size
+    else:
+        end = max(0, position)
+        start = max(0, end - page_size)
+
+    rows = items[start:end]
+    next_cursor = encode_cursor([end - 1], 'next') if rows and end < len(items) else None
+    prev_cursor = encode_cursor([start], 'prev') if rows and start > 0 else None
+    return KeysetPage(rows, page_size, next_cursor, prev_cursor)
@@ -0,0 +1,504 @@
+"""
+ตัวคำนวณที่ใช้ตอนรันเงินเดือน (ทำทีละงวด ทั้งบริษัทในครั้งเดียว)
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import (
+    AttendanceRecord,
+    CompanySetting,
+    DeductionType,
+    EarningType,
+    Employee,
+    LeaveRecord,
+    PayrollRun,
+    Payslip,
+    PayslipItem,
+)
+from .attendance import get_holiday_dates, iter_dates
+from .memtrace import memory_traced
+from .shifts import ShiftLookup
+from .timing import SpanRecorder
+
+
+# ===== วันทำงาน / วันไม่จ่าย =====
+
+UNPAID_REASON_LEAVE = 'unpaid_leave'
+UNPAID_REASON_NO_RECORD = 'no_record'
+UNPAID_REASON_ABSENT = 'absent'
+
+UNPAID_REASON_LABELS = {
+    UNPAID_REASON_LEAVE: 'ลา (ไม่จ่ายเงิน)',
+    UNPAID_REASON_NO_RECORD: 'ไม่มีบันทึกเข้างาน (ขาด)',
+    UNPAID_REASON_ABSENT: 'ขาดงาน',
+}
+
+
+class UnpaidDaySummary:
+    """
+    ผลวันไม่จ่ายของพนักงาน 1 คนในงวด
+    - unpaid_dates = [(date, reason), ...] เรียงตามวันที่ (reason = UNPAID_REASON_*)
+    """
+
+    def __init__(self, working_days):
+        self.working_days = working_days
+        self.unpaid_dates = []
+
+    @property
+    def working_day_count(self):
+        return len(self.working_days)
+
+    @property
+    def unpaid_leave_days(self):
+        return sum(1 for _, reason in self.unpaid_dates if reason == UNPAID_REASON_LEAVE)
+
+    @property
+    def absent_days(self):
+        return len(self.unpaid_dates) - self.unpaid_leave_days
+
+    @property
+    def unpaid_days(self):
+        return len(self.unpaid_dates)
+
+
+def get_working_days(start, end, holiday_dates=None):
+    """
+    list วันทำงานในช่วง = จันทร์–ศุกร์ ที่ไม่ใช่วันหยุด (Holiday)
+    """
+    if holiday_dates is None:
+        holiday_dates = get_holiday_dates(start, end)
+    return [
+        d for d in iter_dates(start, end)
+        if d.weekday() < 5 and d not in holiday_dates
+    ]
+
+
+def compute_unpaid_days(period, employee_ids):
+    """
+    คำนวณวันทำงาน + วันไม่จ่ายของพนักงานทุกคนในงวดด้วย query คงที่ 3 ครั้ง
+    (Holiday, LeaveRecord ที่อนุมัติ, AttendanceRecord) แล้วเทียบกันด้วย set ใน memory
+
+    กฎ (ต่อวันทำงาน):
+      1) ลาแบบไม่จ่ายที่อนุมัติแล้ว -> ไม่จ่าย (unpaid_leave)
+      2) ลาแบบจ่ายที่อนุมัติแล้ว -> จ่าย
+      3) ไม่มี AttendanceRecord -> ไม่จ่าย (no_record)
+      4) AttendanceRecord.status == 'absent' -> ไม่จ่าย (absent)
+      5) นอกนั้น (present / late / leave / holiday) -> จ่าย
+
+    คืน (working_days, {employee_id: UnpaidDaySummary})
+    """
+    start, end = period.start_date, period.end_date
+    employee_ids = list(employee_ids)
+
+    working_days = get_working_days(start, end)
+    working_day_set = set(working_days)
+
+    paid_leave = set()
+    unpaid_leave = set()
+    leave_rows = LeaveRecord.objects.filter(
+        status='approved',
+        employee_id__in=employee_ids,
+        start_date__lte=end,
+        end_date__gte=start,
+    ).values_list('employee_id', 'start_date', 'end_date', 'leave_type__is_paid')
+    for emp_id, lr_start, lr_end, is_paid in leave_rows:
+        target = paid_leave if is_paid else unpaid_leave
+        for d in iter_dates(max(lr_start, start), min(lr_end, end)):
+            if d in working_day_set:
+                target.add((emp_id, d))
+
+    att_status = dict(
+        ((emp_id, work_date), status)
+        for emp_id, work_date, status in AttendanceRecord.objects.filter(
+            employee_id__in=employee_ids,
+            work_date__range=(start, end),
+        ).values_list('employee_id', 'work_date', 'status')
+    )
+
+    result = {}
+    for emp_id in employee_ids:
+        summary = UnpaidDaySummary(working_days)
+        for d in working_days:
+            key = (emp_id, d)
+            if key in unpaid_leave:
+                summary.unpaid_dates.append((d, UNPAID_REASON_LEAVE))
+            elif key in paid_leave:
+                continue
+            elif key not in att_status:
+                summary.unpaid_dates.append((d, UNPAID_REASON_NO_RECORD))
+            elif att_status[key] == 'absent':
+                summary.unpaid_dates.append((d, UNPAID_REASON_ABSENT))
+        result[emp_id] = summary
+
+    return working_days, result
+
+
+# ===== เก็บรายละเอียดรายวันไว้กับ Payslip (1 byte ต่อวันในงวด) =====
+
+DAY_NON_WORKING = 0   # เสาร์-อาทิตย์ / วันหยุด
+DAY_PAID = 1          # วันทำงานที่ได้เงิน
+DAY_CODE_BY_REASON = {
+    UNPAID_REASON_LEAVE: 2,
+    UNPAID_REASON_NO_RECORD: 3,
+    UNPAID_REASON_ABSENT: 4,
+}
+DAY_REASON_BY_CODE = {code: reason for reason, code in DAY_CODE_BY_REASON.items()}
+
+
+def encode_day_breakdown(start, end, summary):
+    """
+    แปลง UnpaidDaySummary เป็น bytes ยาวเท่าจำนวนวันในงวด (index 0 = start)
+    ค่าแต่ละ byte = DAY_NON_WORKING / DAY_PAID / DAY_CODE_BY_REASON[...]
+    """
+    day_count = (end - start).days + 1
+    data = bytearray([DAY_NON_WORKING]) * day_count
+    for d in summary.working_days:
+        data[(d - start).days] = DAY_PAID
+    for d, reason in summary.unpaid_dates:
+        data[(d - start).days] = DAY_CODE_BY_REASON[reason]
+    return bytes(data)
+
+
+def decode_day_breakdown(start, end, data):
+    """
+    อ่าน bytes จาก encode_day_breakdown กลับมา (ไม่แตะ DB)
+    คืน (working_day_count, [(date, reason), ...]) หรือ None ถ้าไม่มีข้อมูล / ความยาวไม่ตรงกับงวด
+    """
+    if not data:
+        return None
+    data = bytes(data)
+    if len(data) != (end - start).days + 1:
+        return None
+
+    working_day_count = 0
+    unpaid_dates = []
+    for offset, code in enumerate(data):
+        if code == DAY_NON_WORKING:
+            continue
+        working_day_count += 1
+        if code in DAY_REASON_BY_CODE:
+            unpaid_dates.append((start + timedelta(days=offset), DAY_REASON_BY_CODE[code]))
+    return working_day_count, unpaid_dates
+
+
+# ===== OT (ค่าล่วงเวลา) =====
+
+# ค่าจ้างรายชั่วโมง = เงินเดือน / 30 วัน / 8 ชั่วโมง
+OT_DAYS_PER_MONTH = Decimal("30")
+OT_HOURS_PER_DAY = Decimal("8")
+
+# OT วันทำงานที่น้อยกว่านี้ (นาที) ไม่นับ กันเศษจากการสแกนออกช้าไม่กี่นาที
+OT_MIN_MINUTES = 30
+
+OT_KINDS = (
+    ('weekday', 'ค่าล่วงเวลา (OT) วันทำงาน'),
+    ('weekend', 'ค่าล่วงเวลา (OT) เสาร์-อาทิตย์'),
+    ('holiday', 'ค่าล่วงเวลา (OT) วันหยุดนักขัตฤกษ์'),
+)
+
+
+# EarningType ของ OT ที่การรันเงินเดือนคำนวณจากเวลาเข้า-ออกเอง
+# แยกจาก 'OT' ที่ HR คีย์เอง -> ลบ/สร้างใหม่ได้โดยไม่แตะรายการที่คีย์ไว้
+OT_ATTENDANCE_CODE = 'OT_ATTENDANCE'
+
+
+def get_overtime_earning_type():
+    """
+    EarningType สำหรับ OT ที่คำนวณจากเวลาเข้า-ออก (code = OT_ATTENDANCE) ถ้าไม่มีก็สร้างให้
+    """
+    ot_type, _ = EarningType.objects.get_or_create(
+        code=OT_ATTENDANCE_CODE,
+        defaults={
+            'name': 'ค่าล่วงเวลา (OT) จากเวลาเข้า-ออก',
+            'is_taxable': True,
+            'is_ssf': True,
+        }
+    )
+    return ot_type
+
+
+def _minutes_between(start_dt, end_dt):
+    return max(0, int((end_dt - start_dt).total_seconds() // 60))
+
+
+def compute_overtime(period, employees):
+    """
+    สแกน AttendanceRecord ทั้งงวดของพนักงานทุกคนรอบเดียว แล้วคิดชั่วโมง OT ตามประเภทวัน
+      - วันทำงาน (จ.-ศ.): เวลาที่ออกหลังเวลาเลิกกะ (ขั้นต่ำ OT_MIN_MINUTES นาที)
+      - เสาร์-อาทิตย์ / วันหยุดนักขัตฤกษ์: ชั่วโมงที่ทำงานทั้งหมด (check_in -> check_out)
+      - check_out น้อยกว่า check_in = ออกเช้าวันถัดไป (กะข้ามคืน)
+
+    ใช้ query คงที่ (CompanySetting, Holiday, ShiftLookup, AttendanceRecord)
+    คืน {employee_id: {'weekday': (hours, amount), 'weekend': ..., 'holiday': ...}}
+    เฉพาะพนักงานที่มี OT
+    """
+    settings = CompanySetting.get_solo()
+    rates = {
+        'weekday': settings.ot_weekday_rate,
+        'weekend': settings.ot_weekend_rate,
+        'holiday': settings.ot_holiday_rate,
+    }
+
+    salary_map = {e.id: Decimal(e.base_salary or 0) for e in employees}
+    holiday_dates = get_holiday_dates(period.start_date, period.end_date)
+    shifts = ShiftLookup(period.start_date, period.end_date, employee_ids=list(salary_map), settings=settings)
+
+    att_rows = (
+        AttendanceRecord.objects
+        .filter(
+            work_date__range=(period.start_date, period.end_date),
+            employee_id__in=list(salary_map),
+            check_in__isnull=False,
+            check_out__isnull=False,
+        )
+        .values_list('employee_id', 'work_date', 'check_in', 'check_out')
+        .iterator(chunk_size=2000)
+    )
+
+    minutes = {}  # (employee_id, kind) -> นาที
+    for emp_id, work_date, check_in, check_out in att_rows:
+        in_at = datetime.combine(work_date, check_in)
+        out_at = datetime.combine(work_date, check_out)
+        if out_at <= in_at:
+            out_at += timedelta(days=1)
+
+        if work_date in holiday_dates:
+            kind = 'holiday'
+            ot_minutes = _minutes_between(in_at, out_at)
+        elif work_date.weekday() >= 5:
+            kind = 'weekend'
+            ot_minutes = _minutes_between(in_at, out_at)
+        else:
+            kind = 'weekday'
+            rule = shifts.get(emp_id, work_date)
+            end_at = datetime.combine(work_date, rule.end_time or settings.work_end_time)
+            if rule.end_time and rule.end_time <= rule.start_time:
+                end_at += timedelta(days=1)
+            ot_minutes = _minutes_between(end_at, out_at)
+            if ot_minutes < OT_MIN_MINUTES:
+                continue
+
+        if ot_minutes:
+            minutes[(emp_id, kind)] = minutes.get((emp_id, kind), 0) + ot_minutes
+
+    result = {}
+    for (emp_id, kind), total_minutes in minutes.items():
+        hourly = salary_map[emp_id] / OT_DAYS_PER_MONTH / OT_HOURS_PER_DAY
+        hours = (Decimal(total_minutes) / Decimal(60)).quantize(Decimal("0.01"))
+        amount = (hourly * hours * rates[kind]).quantize(Decimal("0.01"))
+        result.setdefault(emp_id, {})[kind] = (hours, amount)
+    return result
+
+
+def build_overtime_items(payslip_map, overtime, ot_type):
+    """
+    แปลงผล compute_overtime เป็น PayslipItem (ยังไม่ save) สำหรับ bulk_create
+    payslip_map = {employee_id: payslip}
+    """
+    items = []
+    for emp_id, by_kind in overtime.items():
+        payslip = payslip_map.get(emp_id)
+        if payslip is None:
+            continue
+        for kind, label in OT_KINDS:
+            if kind not in by_kind:
+                continue
+            hours, amount = by_kind[kind]
+            if amount <= 0:
+                continue
+            items.append(PayslipItem(
+                payslip=payslip,
+                item_type='earning',
+                earning_type=ot_type,
+                name=f'{label} {hours} ชม.',
+                amount=amount,
+            ))
+    return items
+
+
+# ===== รันเงินเดือนทั้งงวด =====
+
+# จำนวนพนักงานต่อ 1 transaction ตอนเขียนสลิป
+# (transaction สั้น ๆ หลายก้อน แทนการเขียนทีละแถวแบบ autocommit -> คืน lock ให้ผู้ใช้อื่นเป็นระยะ)
+PAYROLL_WRITE_CHUNK = 200
+
+
+# ขั้นตอนของการรันเงินเดือน (ชื่อ span -> คำอธิบายบนหน้าเว็บ)
+PAYROLL_STAGE_LABELS = {
+    'prepare_types': 'เตรียมประเภทรายรับ/รายหัก',
+    'load_employees': 'โหลดพนักงาน active',
+    'unpaid_days': 'วันทำงาน + วันไม่จ่าย (preload เข้างาน/ลา)',
+    'payslip_writes': 'สร้าง/อัปเดตสลิป + รายการฐานเงินเดือน/หักวันไม่จ่าย',
+    'day_breakdown': 'บันทึกรายละเอียดรายวัน',
+    'overtime': 'คำนวณ + เขียน OT',
+    'social_security_tax': 'ประกันสังคม + ภาษีหัก ณ ที่จ่าย',
+    'generate_payslips': 'สร้างสลิป + ฐานเงินเดือน (generate_payslips)',
+}
+
+
+@memory_traced('payroll_run')
+def run_payroll(period, user=None):
+    """
+    สร้าง/อัปเดต Payslip ให้พนักงาน active ทุกคนในงวด
+    + หักวันไม่จ่ายจาก Attendance & Leave
+    + OT จาก AttendanceRecord
+    + ประกันสังคม + ภาษีหัก ณ ที่จ่าย จากยอดรายได้รวม (gross_income)
+
+    จับเวลาแต่ละขั้นตอน (PAYROLL_STAGE_LABELS) แล้วบันทึกเป็น PayrollRun
+    คืน dict ผลการรัน (created / updated / skipped / employee_count / working_days / OT / spans / run_id)
+    """
+    spans = SpanRecorder()
+
+    # ===== 1) ประเภท BASE / UNPAID =====
+    with spans.span('prepare_types'):
+        base_type, _ = EarningType.objects.get_or_create(
+            code='BASE_SALARY',
+            defaults={
+                'name': 'เงินเดือนพื้นฐาน',
+                'is_taxable': True,
+                'is_ssf': True,
+            }
+        )
+        unpaid_type, _ = DeductionType.objects.get_or_create(
+            code='UNPAID',
+            defaults={
+                'name': 'หักวันไม่จ่าย',
+                'is_tax': False,
+                'is_ssf': False,
+            }
+        )
+        ot_type = get_overtime_earning_type()
+
+    with spans.span('load_employees') as span:
+        employee_list = list(Employee.objects.filter(status='active').order_by('code'))
+        span['rows'] = len(employee_list)
+
+    # ===== 2) วันทำงาน + วันไม่จ่ายของทุกคน (query คงที่ ไม่วนทีละวัน) =====
+    with spans.span('unpaid_days', rows=len(employee_list)):
+        working_days, unpaid_map = compute_unpaid_days(
+            period, [emp.id for emp in employee_list]
+        )
+    working_day_count = len(working_days) or 1  # กันหาร 0
+
+    created = 0
+    updated = 0
+    skipped = 0
+    payslip_map = {}  # employee_id -> payslip ที่สร้าง/อัปเดตในรอบนี้
+
+    # ===== 3) ทีละพนักงาน (เขียนเป็นก้อนละ PAYROLL_WRITE_CHUNK คน ต่อ 1 transaction) =====
+    with spans.span('payslip_writes') as span:
+        for i in range(0, len(employee_list), PAYROLL_WRITE_CHUNK):
+            with transaction.atomic():
+                for emp in employee_list[i:i + PAYROLL_WRITE_CHUNK]:
+                    if not emp.base_salary:
+                        skipped += 1
+                        continue
+
+                    base_salary = Decimal(emp.base_salary)
+
+                    # --- 3.1 จำนวน "unpaid days" (ลาไม่จ่าย + ขาด) ---
+                    unpaid_days = unpaid_map[emp.id].unpaid_days
+
+                    # --- 3.2 คำนวณเงินหักจากวันไม่จ่าย ---
+                    daily_rate = (base_salary / Decimal(working_day_count)).quantize(Decimal("0.01"))
+                    unpaid_deduction = (daily_rate * Decimal(unpaid_days)).quantize(Decimal("0.01"))
+
+                    # ===== 4) สร้าง/อัปเดต Payslip =====
+                    payslip, is_created = Payslip.objects.get_or_create(
+                        employee=emp,
+                        period=period,
+                    )
+
+                    # 4.1 รายรับ: ฐานเงินเดือน
+                    base_item, base_created = PayslipItem.objects.get_or_create(
+                        payslip=payslip,
+                        item_type='earning',
+                        earning_type=base_type,
+                        deduction_type=None,
+                        defaults={
+                            'name': 'ฐานเงินเดือน',
+                            'amount': base_salary,
+                        },
+                    )
+                    if not base_created:
+                        base_item.name = 'ฐานเงินเดือน'
+                        base_item.amount = base_salary
+                        base_item.earning_type = base_type
+                        base_item.deduction_type = None
+                        base_item.save(update_fields=['name', 'amount', 'earning_type', 'deduction_type'])
+
+                    # 4.2 รายหัก: หักวันไม่จ่าย
+                    unpaid_item, unpaid_created = PayslipItem.objects.get_or_create(
+                        payslip=payslip,
+                        item_type='deduction',
+                        earning_type=None,
+                        deduction_type=unpaid_type,
+                        defaults={
+                            'name': f'หักวันไม่จ่าย {unpaid_days} วัน',
+                            'amount': unpaid_deduction,
+                        },
+                    )
+                    if not unpaid_created:
+                        unpaid_item.name = f'หักวันไม่จ่าย {unpaid_days} วัน'
+                        unpaid_item.amount = unpaid_deduction
+                        unpaid_item.deduction_type = unpaid_type
+                        unpaid_item.earning_type = None
+                        unpaid_item.save(update_fields=['name', 'amount', 'deduction_type', 'earning_type'])
+
+                    payslip.day_breakdown = encode_day_breakdown(
+                        period.start_date, period.end_date, unpaid_map[emp.id]
+                    )
+                    payslip_map[emp.id] = payslip
+
+                    if is_created:
+                        created += 1
+                    else:
+                        updated += 1
+        span['rows'] = created + updated
+
+    # บันทึกรายละเอียดรายวันของทุกสลิปในครั้งเดียว
+    with spans.span('day_breakdown', rows=len(payslip_map)):
+        Payslip.objects.bulk_update(payslip_map.values(), ['day_breakdown'], batch_size=500)
+
+    # ===== 5) OT จาก AttendanceRecord (สแกนรอบเดียวทั้งงวด + เขียนแบบ bulk) =====
+    with spans.span('overtime') as span:
+        overtime = compute_overtime(period, employee_list)
+        ot_items = build_overtime_items(payslip_map, overtime, ot_type)
+        with transaction.atomic():
+            # ลบเฉพาะ OT ที่การรันสร้างเอง ของสลิปในรอบนี้ (OT ที่ HR คีย์เองเป็นคนละ EarningType)
+            PayslipItem.objects.filter(
+                payslip__in=[p.pk for p in payslip_map.values()],
+                earning_type=ot_type,
+            ).delete()
+            PayslipItem.objects.bulk_create(ot_items, batch_size=1000)
+        span['rows'] = len(ot_items)
+
+    # ===== 6) คำนวณประกันสังคม + ภาษีหัก ณ ที่จ่าย =====
+    # เมธอดนี้จะ:
+    #   - recalc_totals() เพื่อให้ gross_income เป็นยอดรายรับล่าสุด (รวม OT แล้ว)
+    #   - สร้าง/อัปเดต PayslipItem สำหรับ SOCIAL_SEC และ WHT
+    #   - recalc_totals() อีกครั้งเพื่ออัปเดต net_income
+    payslips = list(payslip_map.values())
+    with spans.span('social_security_tax', rows=len(payslips)):
+        for i in range(0, len(payslips), PAYROLL_WRITE_CHUNK):
+            with transaction.atomic():
+                for payslip in payslips[i:i + PAYROLL_WRITE_CHUNK]:
+                    payslip.update_social_security_and_tax()
+
+    run = PayrollRun.record(period, spans, kind='run', employee_count=len(employee_list), user=user)
+
+    return {
+        'created': created,
+        'updated': updated,
+        'skipped': skipped,
+        'period': period,
+        'employee_count': len(employee_list),
+        'working_days': working_day_count,
+        'ot_employee_count': len({item.payslip.employee_id for item in ot_items}),
+        'ot_total': sum(item.amount for item in ot_items),
+        'run_id': run.pk,
+        'duration_ms': run.duration_ms,
+        'spans': run.spans,
+    }
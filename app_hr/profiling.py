@@ -0,0 +1,230 @@
+"""
+profile หน้าเว็บจริงบน production ด้วย cProfile (เฉพาะ staff ที่ขอเอง)
+
+- เปิดความสามารถด้วย HR_PROFILING=1 (ปิด = ProfilingMiddleware ถอดตัวเองออก ไม่มี overhead)
+- staff ขอ profile ได้ 2 แบบ
+    ?_profile=1                 -> profile request นี้ request เดียว
+    cookie hr_profile=1         -> profile ทุกหน้าจนกว่าจะปิด (ตั้ง/ปิดจากหน้า app_hr:profiles)
+  request ที่ไม่ได้ขอ: เช็ค flag แล้วผ่านไปทันที
+- ผลเก็บลง HR_PROFILE_DIR ต่อ 1 request: <id>.prof (เปิดด้วย snakeviz / pstats ได้)
+  + <id>.txt (call tree + ตาราง cumulative) + <id>.json (path, ผู้ใช้, เวลา)
+  จำกัดจำนวนไฟล์ / ขนาดรวม ลบของเก่าสุดทิ้งเมื่อเกิน
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+
+PROFILE_QUERY_FLAG = '_profile'
+PROFILE_COOKIE = 'hr_profile'
+PROFILE_MAX_FILES = 50
+PROFILE_MAX_BYTES = 200 * 1024 * 1024
+PROFILE_TREE_MIN_FRACTION = 0.01   # ไม่แสดง call ที่ใช้เวลาน้อยกว่า 1% ของทั้ง view
+PROFILE_TREE_MAX_DEPTH = 25
+PROFILE_TOP_FUNCTIONS = 40
+
+_PROFILE_ID_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]{6}-[a-z0-9_.-]+$')
+
+
+def profiling_enabled():
+    return getattr(settings, 'HR_PROFILING', False)
+
+
+def profile_dir():
+    return Path(getattr(settings, 'HR_PROFILE_DIR', settings.BASE_DIR / 'var' / 'profiles'))
+
+
+def wants_profile(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        return False
+    return request.GET.get(PROFILE_QUERY_FLAG) == '1' or request.COOKIES.get(PROFILE_COOKIE) == '1'
+
+
+# ===== สรุปผล =====
+
+def _func_label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # built-in เช่น <method 'execute' of 'sqlite3.Cursor' objects>
+    return f"{name}  ({os.path.basename(filename)}:{line})"
+
+
+def render_call_tree(stats, root, min_fraction=PROFILE_TREE_MIN_FRACTION, max_depth=PROFILE_TREE_MAX_DEPTH):
+    """
+    call tree จาก root ลงไปตาม callee
+    pstats เก็บเวลาแยกตามคู่ (ผู้เรียก, ผู้ถูกเรียก) ไม่ใช่ตาม path ทั้งเส้น
+    -> function ที่ถูกเรียกจากหลายที่ จะเฉลี่ยเวลาลงลูกตามสัดส่วนที่ path นี้ใช้ (เหมือน gprof)
+    ตัด call ที่น้อยกว่า min_fraction ของเวลา root และไม่วนซ้ำใน path เดียวกัน (recursion)
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, caller_stats in callers.items():
+            children.setdefault(caller, []).append((caller_stats[3], func))
+
+    total = stats.stats[root][3]
+    threshold = total * min_fraction
+    lines = [f"{total * 1000:9.1f} ms  {_func_label(root)}"]
+
+    def walk(func, depth, path, share):
+        if depth > max_depth:
+            return
+        for cumulative, child in sorted(children.get(func, []), reverse=True):
+            spent = cumulative * share
+            if spent < threshold or child in path:
+                continue
+            lines.append(f"{spent * 1000:9.1f} ms  {'  ' * depth}{_func_label(child)}")
+            child_total = stats.stats[child][3]
+            walk(child, depth + 1, path | {child}, min(1.0, spent / child_total) if child_total else 0.0)
+
+    walk(root, 1, {root}, 1.0)
+    return "\n".join(lines)
+
+
+def render_profile_summary(profiler, root_code=None):
+    stats = pstats.Stats(profiler)
+    root = None
+    if root_code is not None:
+        root = (root_code.co_filename, root_code.co_firstlineno, root_code.co_name)
+    if root not in stats.stats:
+        # view ที่ถูกห่อด้วย decorator -> ใช้ function ที่ cumulative สูงสุดแทน
+        root = max(stats.stats, key=lambda f: stats.stats[f][3])
+
+    out = io.StringIO()
+    out.write("== call tree ==\n")
+    out.write(render_call_tree(stats, root))
+    out.write("\n\n== top functions (cumulative) ==\n")
+    stats.stream = out
+    stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    return out.getvalue()
+
+
+# ===== ที่เก็บบนดิสก์ =====
+
+def _slug(path):
+    slug = re.sub(r'[^a-z0-9]+', '_', path.lower()).strip('_')
+    return (slug or 'root')[:60]
+
+
+def save_profile(request, profiler, view_func, response, wall_seconds):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    now = timezone.now()
+    profile_id = f"{now:%Y%m%d-%H%M%S-%f}-{_slug(request.path)}"
+    root_code = getattr(getattr(view_func, '__wrapped__', view_func), '__code__', None)
+
+    profiler.dump_stats(directory / f"{profile_id}.prof")
+    (directory / f"{profile_id}.txt").write_text(render_profile_summary(profiler, root_code), encoding='utf-8')
+    meta = {
+        'id': profile_id,
+        'created_at': now.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path()[:300],
+        'view': request.resolver_match.view_name if request.resolver_match else '',
+        'user': request.user.get_username(),
+        'status': response.status_code,
+        'wall_ms': round(wall_seconds * 1000, 2),
+    }
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+
+    prune_profiles()
+    return profile_id
+
+
+def _profile_files(profile_id):
+    directory = profile_dir()
+    return [directory / f"{profile_id}{ext}" for ext in ('.prof', '.txt', '.json')]
+
+
+def list_profiles():
+    """
+    metadata ของ profile ทั้งหมด ใหม่สุดก่อน
+    """
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    profiles = []
+    for meta_path in directory.glob('*.json'):
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        meta['size'] = sum(p.stat().st_size for p in _profile_files(meta_path.stem) if p.exists())
+        profiles.append(meta)
+    profiles.sort(key=lambda m: m['id'], reverse=True)
+    return profiles
+
+
+def prune_profiles(max_files=None, max_bytes=None):
+    """
+    ลบ profile เก่าสุดจนเหลือไม่เกิน max_files ชุด และขนาดรวมไม่เกิน max_bytes
+    """
+    max_files = max_files or getattr(settings, 'HR_PROFILE_MAX_FILES', PROFILE_MAX_FILES)
+    max_bytes = max_bytes or getattr(settings, 'HR_PROFILE_MAX_BYTES', PROFILE_MAX_BYTES)
+    profiles = list_profiles()
+    total = sum(p['size'] for p in profiles)
+    removed = 0
+    while profiles and (len(profiles) > max_files or total > max_bytes):
+        oldest = profiles.pop()
+        delete_profile(oldest['id'])
+        total -= oldest['size']
+        removed += 1
+    return removed
+
+
+def profile_path(profile_id, ext):
+    """
+    path ของไฟล์ profile (None ถ้า id ไม่ถูกรูปแบบ / ไม่มีไฟล์) กัน path traversal
+    """
+    if not _PROFILE_ID_RE.match(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}{ext}"
+    return path if path.exists() else None
+
+
+def delete_profile(profile_id):
+    if not _PROFILE_ID_RE.match(profile_id):
+        return
+    for path in _profile_files(profile_id):
+        if path.exists():
+            path.unlink()
+
+
+# ===== middleware =====
+
+class ProfilingMiddleware:
+    """
+    ต้องอยู่หลัง AuthenticationMiddleware (ใช้ request.user ตรวจ staff)
+    profile เฉพาะตัว view (ไม่รวม middleware อื่น)
+    """
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not wants_profile(request):
+            return None
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(view_func, request, *view_args, **view_kwargs)
+        wall = time.perf_counter() - started
+
+        profile_id = save_profile(request, profiler, view_func, response, wall)
+        response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,150 @@
+"""
+ดัชนีค้นหาพนักงานแบบ full-text (SQLite FTS5 + trigram tokenizer)
+
+- trigram ตัดคำเป็นชุดละ 3 ตัวอักษร จึงค้นหาภาษาไทย (ไม่มีเว้นวรรค) แบบ substring ได้
+  และไม่สนตัวพิมพ์เล็ก/ใหญ่ เหมือน icontains แต่ใช้ index แทนการสแกนทั้งตาราง
+- ตาราง FTS เป็นแบบ external content (ชี้ไปที่ app_hr_employee, rowid = Employee.id)
+  sync ด้วย trigger ใน DB -> ครอบคลุมทั้ง save(), bulk_create, bulk_update, queryset.update()
+- คำค้นที่สั้นกว่า 3 ตัวอักษร หรือ DB ที่ไม่ใช่ SQLite (>= 3.34) -> กลับไปใช้ icontains
+- คำค้นแยกตามช่องว่าง ทุกคำต้องเจอ (AND) แต่ละคำเจอใน field ไหนก็ได้
+  เช่น "สมชาย IT" = ชื่อมี "สมชาย" และ (field ใดก็ได้) มี "IT"
+  (ต่างจากเดิมที่ค้นทั้งข้อความเป็นก้อนเดียว: "สมชาย ใจดี" ซึ่งเป็นชื่อ + นามสกุล ตอนนี้เจอได้)
+
+ถ้า migration ในอนาคตสร้างตาราง Employee ใหม่ (SQLite remake table) trigger จะหาย
+ให้รัน manage.py rebuild_employee_search_index
+"""
+import sqlite3
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Employee
+
+
+EMPLOYEE_FTS_TABLE = 'app_hr_employee_fts'
+EMPLOYEE_FTS_COLUMNS = ('code', 'first_name', 'last_name', 'department')
+EMPLOYEE_SEARCH_LIMIT = 1000
+FTS_MIN_TERM_LENGTH = 3  # trigram ต้องมีอย่างน้อย 3 ตัวอักษร
+
+
+def fts_supported(conn=None):
+    conn = conn or connection
+    # trigram tokenizer มีตั้งแต่ SQLite 3.34
+    return conn.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 34, 0)
+
+
+def _install_sql():
+    table = Employee._meta.db_table
+    cols = ', '.join(EMPLOYEE_FTS_COLUMNS)
+    new_cols = ', '.join(f'new.{c}' for c in EMPLOYEE_FTS_COLUMNS)
+    old_cols = ', '.join(f'old.{c}' for c in EMPLOYEE_FTS_COLUMNS)
+    fts = EMPLOYEE_FTS_TABLE
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols}, content='{table}', content_rowid='id', tokenize='trigram'
+            )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END""",
+    ]
+
+
+def install_employee_search_index(conn=None):
+    """
+    สร้างตาราง FTS + trigger (ถ้ายังไม่มี) แล้ว rebuild ดัชนีจากข้อมูลปัจจุบัน
+    คืน False ถ้า DB ไม่รองรับ
+    """
+    conn = conn or connection
+    if not fts_supported(conn):
+        return False
+    with conn.cursor() as cursor:
+        for sql in _install_sql():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {EMPLOYEE_FTS_TABLE}({EMPLOYEE_FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall_employee_search_index(conn=None):
+    conn = conn or connection
+    if not fts_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {EMPLOYEE_FTS_TABLE}_{suffix}")
+        cursor.execute(f"DROP TABLE IF EXISTS {EMPLOYEE_FTS_TABLE}")
+
+
+def _split_query(q):
+    """
+    แยกคำค้น -> (FTS5 MATCH expression หรือ None, คำสั้นที่ต้องใช้ icontains)
+    คำยาวพอใส่ "..." (phrase) ทุกคำ = AND กัน และกันอักขระพิเศษของ FTS5
+    """
+    long_terms = []
+    short_terms = []
+    for term in q.split():
+        if len(term) >= FTS_MIN_TERM_LENGTH:
+            long_terms.append('"' + term.replace('"', '""') + '"')
+        else:
+            short_terms.append(term)
+    return (' '.join(long_terms) or None), short_terms
+
+
+def _icontains_q(term, prefix):
+    cond = Q()
+    for field in EMPLOYEE_FTS_COLUMNS:
+        cond |= Q(**{f'{prefix}{field}__icontains': term})
+    return cond
+
+
+def filter_by_employee_search(qs, q, prefix=''):
+    """
+    กรอง queryset ด้วยคำค้นพนักงาน (รหัส / ชื่อ / นามสกุล / แผนก)
+    prefix = path ไปหา Employee เช่น 'employee__' สำหรับ Payslip
+    คำยาว >= 3 ตัวอักษรใช้ดัชนี FTS, คำสั้นใช้ icontains (ทุกคำต้องเจอ = AND ดูหัวไฟล์)
+    """
+    match, short_terms = _split_query(q)
+    if match and fts_supported():
+        qs = qs.filter(**{
+            f'{prefix}id__in': RawSQL(
+                f"SELECT rowid FROM {EMPLOYEE_FTS_TABLE} WHERE {EMPLOYEE_FTS_TABLE} MATCH %s",
+                [match],
+            )
+        })
+    elif match:
+        short_terms = q.split()
+    for term in short_terms:
+        qs = qs.filter(_icontains_q(term, prefix))
+    return qs
+
+
+def search_employees(qs, q, limit=EMPLOYEE_SEARCH_LIMIT):
+    """
+    ค้นหาพนักงานพร้อมลำดับความเกี่ยวข้อง (bm25) สำหรับหน้ารายการพนักงาน
+    คืน (queryset, {employee_id: ลำดับ}) ; ลำดับ = None ถ้าใช้ดัชนีไม่ได้ (กรองด้วย icontains แทน)
+    จำกัด limit คนที่เกี่ยวข้องที่สุด หลังกรองตามเงื่อนไขของ qs (สถานะ / แผนก) แล้ว
+    """
+    match, short_terms = _split_query(q)
+    if not match or not fts_supported():
+        return filter_by_employee_search(qs, q), None
+
+    for term in short_terms:
+        qs = qs.filter(_icontains_q(term, ''))
+
+    candidates_sql, candidates_params = qs.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {EMPLOYEE_FTS_TABLE} WHERE {EMPLOYEE_FTS_TABLE} MATCH %s "
+            f"AND +rowid IN ({candidates_sql}) ORDER BY rank LIMIT %s",
+            [match, *candidates_params, limit],
+        )
+        ranked_ids = [row[0] for row in cursor.fetchall()]
+
+    return qs.filter(id__in=ranked_ids), {pk: i for i, pk in enumerate(ranked_ids)}
@@ -0,0 +1,72 @@
+"""
+lookup กะการทำงานรายคน (compile ครั้งเดียวตอนโหลด แล้วถามซ้ำได้โดยไม่ query)
+"""
+from collections import namedtuple, defaultdict
+
+from django.db.models import Q
+
+from .models import CompanySetting, Employee, ShiftAssignment
+
+
+ShiftRule = namedtuple('ShiftRule', ['start_time', 'late_after_minutes', 'end_time'])
+
+
+class ShiftLookup:
+    """
+    compile การกำหนดกะที่ทับช่วง start..end ให้เป็น list ต่อพนักงาน
+    เรียง: กำหนดรายคนก่อน -> กำหนดตามแผนก -> (ภายในกลุ่ม) effective_from ใหม่สุดก่อน
+
+    ใช้ query คงที่ 3 ครั้ง (CompanySetting, Employee.department, ShiftAssignment)
+    หลังจากนั้น get(employee_id, date) ไม่แตะ DB
+    """
+
+    def __init__(self, start, end, employee_ids=None, settings=None):
+        settings = settings or CompanySetting.get_solo()
+        self.default_rule = ShiftRule(
+            settings.work_start_time, settings.late_after_minutes, settings.work_end_time,
+        )
+
+        emp_qs = Employee.objects.all()
+        if employee_ids is not None:
+            emp_qs = emp_qs.filter(id__in=employee_ids)
+        departments = dict(emp_qs.values_list('id', 'department'))
+
+        assignments = (
+            ShiftAssignment.objects
+            .filter(effective_from__lte=end)
+            .filter(Q(effective_to__isnull=True) | Q(effective_to__gte=start))
+            .select_related('shift')
+            .order_by('-effective_from', '-id')
+        )
+        if employee_ids is not None:
+            assignments = assignments.filter(
+                Q(employee_id__in=employee_ids)
+                | Q(employee__isnull=True, department__in=set(filter(None, departments.values())))
+            )
+
+        by_emp = defaultdict(list)
+        by_dept = defaultdict(list)
+        for a in assignments:
+            entry = (
+                a.effective_from,
+                a.effective_to,
+                ShiftRule(a.shift.start_time, a.shift.late_after_minutes, a.shift.end_time),
+            )
+            if a.employee_id:
+                by_emp[a.employee_id].append(entry)
+            elif a.department:
+                by_dept[a.department].append(entry)
+
+        self._compiled = {
+            emp_id: by_emp.get(emp_id, []) + by_dept.get(dept, [])
+            for emp_id, dept in departments.items()
+        }
+
+    def get(self, employee_id, work_date):
+        """
+        คืน ShiftRule ที่มีผลกับพนักงานในวันนั้น (ไม่มีกะ = ใช้ CompanySetting)
+        """
+        for eff_from, eff_to, rule in self._compiled.get(employee_id, ()):
+            if eff_from <= work_date and (eff_to is None or work_date <= eff_to):
+                return rule
+        return self.default_rule
@@ -0,0 +1,216 @@
+"""
+บันทึก SQL ที่ช้า แยกตามรูปแบบ (fingerprint) พร้อมแผนการทำงาน (EXPLAIN)
+
+- เปิดด้วย HR_SLOW_QUERY_LOG=1 ; ผูก execute_wrapper ถาวรให้ทุก connection ตอนเปิด (apps.py)
+  -> ครอบทั้งหน้าเว็บ, คำสั่ง manage.py และ writer ของคิว
+- query ที่ใช้เวลาเกิน HR_SLOW_QUERY_MS:
+    fingerprint = SQL ที่แทนค่าคงที่ / parameter ด้วย ? และยุบ IN (...) / VALUES หลายแถว
+    ครั้งแรกของแต่ละ fingerprint: เก็บ SQL ตัวอย่าง, บรรทัดในโค้ดที่เรียก และผล
+      EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (PostgreSQL) ด้วย parameter ชุดเดียวกัน
+    ทุกครั้ง: นับจำนวน + เวลา (เก็บเวลาล่าสุด HR_SLOW_QUERY_SAMPLES ครั้งไว้คิด percentile)
+- เวลา = ช่วง execute อย่างเดียว (ไม่รวม fetch ทีละแถวของ iterator)
+- เก็บใน memory ของ process (เหมือน request metrics) สูงสุด HR_SLOW_QUERY_MAX_FINGERPRINTS รูปแบบ
+
+หน้าดูผล / export JSON: app_hr:slow_queries
+"""
+import hashlib
+import re
+import threading
+import time
+import traceback
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentation import _percentile
+from .metrics import counter
+
+
+SLOW_QUERY_MS = 100
+SLOW_QUERY_SAMPLES = 200
+SLOW_QUERY_MAX_FINGERPRINTS = 500
+SLOW_QUERY_SQL_LENGTH = 2000
+
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_SAVEPOINT_RE = re.compile(r"\bSAVEPOINT\s+\"?\w+\"?", re.IGNORECASE)  # ชื่อ savepoint สุ่มใหม่ทุกครั้ง
+_SPACE_RE = re.compile(r"\s+")
+
+SLOW_QUERIES = counter('hr_db_slow_queries_total', 'จำนวน query ที่ช้ากว่า HR_SLOW_QUERY_MS')
+
+_lock = threading.Lock()
+_stats = {}          # fingerprint -> dict
+_dropped = 0         # query ช้าที่ไม่ได้เก็บเพราะรูปแบบเต็มแล้ว
+_local = threading.local()
+
+
+def slow_query_log_enabled():
+    return getattr(settings, 'HR_SLOW_QUERY_LOG', False)
+
+
+def normalize_sql(sql):
+    """
+    SQL -> รูปแบบที่ไม่ขึ้นกับค่า เช่น
+      ... WHERE "id" IN (%s, %s, %s) AND "code" = 'E001'  ->  ... WHERE "id" IN (...) AND "code" = ?
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _SAVEPOINT_RE.sub('SAVEPOINT ?', sql)
+    sql = _PARAM_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _VALUES_RE.sub(r'\1, ...', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def _app_caller():
+    """
+    บรรทัดในโค้ดของโปรเจกต์ที่ทำให้เกิด query (ข้าม django / ไฟล์นี้)
+    """
+    base = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        if frame.filename.startswith(base) and frame.filename != __file__:
+            return f"{frame.filename[len(base) + 1:]}:{frame.lineno} ({frame.name})"
+    return ''
+
+
+def explain_query(connection, sql, params):
+    """
+    แผนการทำงานของ sql (list ของข้อความ) ; error -> ['error: ...'] ไม่ส่งต่อให้โค้ดที่เรียก query
+    PostgreSQL ใน transaction -> ครอบ savepoint กัน EXPLAIN ที่ล้มทำให้ทั้ง transaction ใช้ไม่ได้
+    (SQLite ไม่ต้อง และเปิด savepoint ไม่ได้ระหว่าง query เดิมยังอ่านผลไม่หมด)
+    """
+    prefix = connection.ops.explain_query_prefix()
+    use_savepoint = connection.vendor == 'postgresql' and connection.in_atomic_block
+    _local.explaining = True
+    try:
+        savepoint = connection.savepoint() if use_savepoint else None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{prefix} {sql}", params)
+                rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                connection.savepoint_rollback(savepoint)
+            raise
+        if savepoint:
+            connection.savepoint_commit(savepoint)
+    except Exception as exc:
+        return [f"error: {exc.__class__.__name__}: {exc}"]
+    finally:
+        _local.explaining = False
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [str(row[-1]) for row in rows]
+    return [str(row[0]) for row in rows]
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    if getattr(_local, 'explaining', False) or not slow_query_log_enabled():
+        return execute(sql, params, many, context)
+
+    # query ที่ error ไม่บันทึก (PostgreSQL: transaction ใช้ต่อไม่ได้แล้ว EXPLAIN ไม่ได้)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= getattr(settings, 'HR_SLOW_QUERY_MS', SLOW_QUERY_MS):
+        _record(context['connection'], sql, params, many, duration_ms)
+    return result
+
+
+def _record(connection, sql, params, many, duration_ms):
+    global _dropped
+    SLOW_QUERIES.inc()
+    normalized = normalize_sql(sql)
+    key = fingerprint(normalized)
+    now = timezone.now()
+
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            if len(_stats) >= getattr(settings, 'HR_SLOW_QUERY_MAX_FINGERPRINTS', SLOW_QUERY_MAX_FINGERPRINTS):
+                _dropped += 1
+                return
+            entry = _stats[key] = {
+                'fingerprint': key,
+                'sql': normalized[:SLOW_QUERY_SQL_LENGTH],
+                'example': sql[:SLOW_QUERY_SQL_LENGTH],
+                'caller': _app_caller(),
+                'vendor': connection.vendor,
+                'explain': None,
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'durations': deque(maxlen=getattr(settings, 'HR_SLOW_QUERY_SAMPLES', SLOW_QUERY_SAMPLES)),
+                'first_seen': now,
+                'last_seen': now,
+            }
+            needs_explain = True
+        else:
+            needs_explain = False
+        entry['count'] += 1
+        entry['total_ms'] += duration_ms
+        entry['max_ms'] = max(entry['max_ms'], duration_ms)
+        entry['durations'].append(duration_ms)
+        entry['last_seen'] = now
+
+    # EXPLAIN นอก lock (ยิง query เพิ่ม) เฉพาะครั้งแรกของรูปแบบนี้
+    if needs_explain:
+        if many or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            entry['explain'] = []
+        else:
+            entry['explain'] = explain_query(connection, sql, params)
+
+
+def install_slow_query_log(sender, connection, **kwargs):
+    """
+    receiver ของ connection_created: ใส่ wrapper ครั้งเดียวต่อ connection
+    ใส่ไว้หน้าสุดของ list: connection อาจถูกเปิดระหว่าง execute_wrapper() อื่นครอบอยู่
+    ซึ่งตอนออกจะ pop() ตัวท้ายสุดทิ้ง
+    """
+    if slow_query_log_enabled() and slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
+
+
+# ===== สรุปผล =====
+
+def slow_query_summary(order_by='total_ms'):
+    """
+    สรุปต่อ fingerprint เรียงจากแย่สุด (order_by = total_ms / p95_ms / max_ms / count)
+    คืน (rows, dropped)
+    """
+    with _lock:
+        entries = [dict(entry, durations=list(entry['durations'])) for entry in _stats.values()]
+        dropped = _dropped
+
+    rows = []
+    for entry in entries:
+        durations = entry.pop('durations')
+        rows.append({
+            **entry,
+            'total_ms': round(entry['total_ms'], 2),
+            'max_ms': round(entry['max_ms'], 2),
+            'avg_ms': round(entry['total_ms'] / entry['count'], 2),
+            'p50_ms': round(_percentile(durations, 50), 2),
+            'p95_ms': round(_percentile(durations, 95), 2),
+            'p99_ms': round(_percentile(durations, 99), 2),
+            'explain': entry['explain'] or [],
+        })
+    rows.sort(key=lambda row: row[order_by], reverse=True)
+    return rows, dropped
+
+
+def clear_slow_queries():
+    global _dropped
+    with _lock:
+        _stats.clear()
+        _dropped = 0
@@ -1,3 +1,1328 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, time
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import metrics
+from .analytics import absence_streaks, lateness_ranking, punctuality_trend
+from .attendance import (
+    AttendanceStatusResolver,
+    get_month_status_counts,
+    rebuild_attendance_rollup,
+    refresh_attendance_rollup,
+)
+from .devices import ingest_device_events
+from .exports import gzip_stream, iter_attendance_export
+from .imports import import_attendance_csv, import_employee_csv
+from .instrumentation import QueryRecorder, clear_request_metrics, endpoint_summary, recent_requests
+from .memtrace import clear_traces, memory_traced, recent_traces
+from .models import (
+    AttendanceDevice,
+    AttendanceMonthlySummary,
+    AttendanceRecord,
+    CompanySetting,
+    EarningType,
+    Employee,
+    Holiday,
+    LeaveRecord,
+    LeaveType,
+    Payslip,
+    PayrollPeriod,
+    PayrollRun,
+    PayslipItem,
+    ShiftAssignment,
+    ShiftSchedule,
+    WriteJob,
+)
+from .pagination import encode_cursor, keyset_paginate, list_paginate
+from .payroll import (
+    OT_ATTENDANCE_CODE,
+    PAYROLL_STAGE_LABELS,
+    UNPAID_REASON_ABSENT,
+    UNPAID_REASON_LEAVE,
+    UNPAID_REASON_NO_RECORD,
+    compute_overtime,
+    compute_unpaid_days,
+    decode_day_breakdown,
+    encode_day_breakdown,
+    run_payroll,
+)
+from .profiling import PROFILE_COOKIE, list_profiles, profile_path, prune_profiles
+from .search import filter_by_employee_search, fts_supported, search_employees
+from .shifts import ShiftLookup
+from .slowqueries import (
+    clear_slow_queries,
+    install_slow_query_log,
+    normalize_sql,
+    slow_query_summary,
+    slow_query_wrapper,
+)
+from .timing import SpanRecorder
+from .writequeue import (
+    claim_next_job,
+    encode_file,
+    enqueue_write,
+    process_write_queue,
+    recover_interrupted_jobs,
+    write_queue_metrics,
+)
+
+
+def explain_query_plan(qs):
+    """
+    EXPLAIN QUERY PLAN ของ queryset (SQLite) -> list ข้อความรายละเอียดของแต่ละขั้น
+    """
+    sql, params = qs.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan, table, allowed_indexes=()):
+    """
+    ขั้นที่อ่าน table ทั้งตาราง
+    - SCAN <table>                  = อ่านทุกแถว
+    - SCAN <table> USING INDEX x    = อ่านทั้ง index (ยังเป็น full scan)
+      ยกเว้น index ใน allowed_indexes (เช่น partial index ที่มีเฉพาะแถวที่ต้องการอยู่แล้ว)
+    """
+    scans = []
+    for step in plan:
+        if not (step == f"SCAN {table}" or step.startswith(f"SCAN {table} ")):
+            continue
+        if any(f"INDEX {name}" in step for name in allowed_indexes):
+            continue
+        scans.append(step)
+    return scans
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN เป็นรูปแบบของ SQLite")
+class HotQueryPlanTests(TestCase):
+    """
+    query หลักใน views / payroll / attendance ต้องใช้ index ไม่ย้อนกลับไปสแกนทั้งตาราง
+    (ถ้า test นี้ล้ม = index หายหรือ query เปลี่ยนรูปจนใช้ index ไม่ได้)
+    """
+
+    start = date(2025, 1, 1)
+    end = date(2025, 1, 31)
+
+    def assertNoFullScan(self, qs, table, allowed_indexes=()):
+        plan = explain_query_plan(qs)
+        self.assertEqual(
+            full_scans(plan, table, allowed_indexes), [],
+            f"{table} ถูกสแกนทั้งตาราง:\n" + "\n".join(plan),
+        )
+
+    def test_attendance_date_range_all_employees(self):
+        # ตารางเข้างานรายวัน / matrix / ปิดวัน / export
+        qs = AttendanceRecord.objects.filter(work_date__range=(self.start, self.end)).values_list(
+            'employee_id', 'work_date', 'status'
+        )
+        self.assertNoFullScan(qs, AttendanceRecord._meta.db_table)
+
+    def test_attendance_status_in_range(self):
+        # อันดับมาสาย / export ตามสถานะ
+        qs = AttendanceRecord.objects.filter(
+            status='late', work_date__range=(self.start, self.end)
+        ).values_list('employee_id')
+        self.assertNoFullScan(qs, AttendanceRecord._meta.db_table)
+
+    def test_leave_overlap_for_employees(self):
+        # payroll.compute_unpaid_days
+        qs = LeaveRecord.objects.filter(
+            status='approved',
+            employee_id__in=[1, 2, 3],
+            start_date__lte=self.end,
+            end_date__gte=self.start,
+        ).values_list('employee_id', 'start_date', 'end_date')
+        self.assertNoFullScan(qs, LeaveRecord._meta.db_table)
+
+    def test_leave_overlap_all_employees(self):
+        # attendance.get_leave_day_set (ทั้งบริษัท)
+        qs = LeaveRecord.objects.filter(
+            status='approved', start_date__lte=self.end, end_date__gte=self.start,
+        ).values_list('employee_id', 'start_date', 'end_date')
+        self.assertNoFullScan(qs, LeaveRecord._meta.db_table)
+
+    def test_leave_summary_year(self):
+        # leave_summary_view
+        qs = (
+            LeaveRecord.objects
+            .filter(status='approved', start_date__year=2025)
+            .values('employee_id', 'leave_type_id')
+            .annotate(total_days=Sum('days'))
+        )
+        self.assertNoFullScan(qs, LeaveRecord._meta.db_table)
+
+    def test_payslip_item_totals(self):
+        # Payslip.recalc_totals / item ประกันสังคม-ภาษี
+        qs = PayslipItem.objects.filter(payslip_id=1, item_type='deduction', deduction_type_id=1)
+        self.assertNoFullScan(qs, PayslipItem._meta.db_table)
+
+    def test_payslips_of_period(self):
+        # export / รายการสลิปตามงวด
+        qs = Payslip.objects.filter(period_id=1).select_related('employee')
+        self.assertNoFullScan(qs, Payslip._meta.db_table)
+
+    def test_period_deduction_sum(self):
+        # payroll_summary: ยอดประกันสังคม / ภาษีทั้งงวด
+        qs = PayslipItem.objects.filter(payslip__period_id=1, deduction_type_id=1).values('amount')
+        self.assertNoFullScan(qs, PayslipItem._meta.db_table)
+
+    def test_active_employees(self):
+        # รันเงินเดือน / ปิดวัน / สรุปการลา
+        qs = Employee.objects.filter(status='active').order_by('code').values_list('id')
+        # partial index มีเฉพาะพนักงาน active อยู่แล้ว อ่านทั้ง index ได้
+        self.assertNoFullScan(qs, Employee._meta.db_table, allowed_indexes=['emp_active_code_idx'])
+
+    def test_employees_of_department(self):
+        qs = Employee.objects.filter(department='IT').order_by('code').values_list('id')
+        self.assertNoFullScan(qs, Employee._meta.db_table)
+
+    def test_employee_keyset_page(self):
+        # employee_list_view หน้าถัดไป (code, id) > (...)
+        from .pagination import _seek_q
+        qs = Employee.objects.filter(_seek_q(['code', 'id'], ['E100', 100], 'gt')).order_by('code', 'id')[:51]
+        self.assertNoFullScan(qs, Employee._meta.db_table)
+
+    def test_period_lookup(self):
+        qs = PayrollPeriod.objects.filter(month=1, year=2025)
+        self.assertNoFullScan(qs, PayrollPeriod._meta.db_table)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    pagination.keyset_paginate / list_paginate: เดินหน้า-ถอยหลังครบทุกแถว ไม่ซ้ำ ไม่ตก
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # key แรก (department) ซ้ำกัน เพื่อทดสอบ key รอง
+        for i in range(7):
+            Employee.objects.create(code=f'K{i}', first_name='A', last_name='B', department=['X', 'Y'][i % 2])
+        cls.keys = ('department', 'code')
+        cls.expected = list(Employee.objects.order_by(*cls.keys).values_list('code', flat=True))
+
+    def page(self, cursor=None, page_size=3, keys=None):
+        return keyset_paginate(Employee.objects.all(), keys or self.keys, cursor, page_size)
+
+    def test_forward_covers_all_rows(self):
+        pages, cursor = [], None
+        while True:
+            page = self.page(cursor)
+            pages.append([e.code for e in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertTrue(page.has_prev)
+
+    def test_prev_cursor_returns_previous_page(self):
+        first = self.page()
+        second = self.page(first.next_cursor)
+        back = self.page(second.prev_cursor)
+
+        self.assertFalse(first.has_prev)
+        self.assertEqual([e.code for e in back], [e.code for e in first])
+        self.assertFalse(back.has_prev)
+        self.assertTrue(back.has_next)
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        self.assertEqual([e.code for e in self.page('not-a-cursor')], self.expected[:3])
+
+    def test_type_crafted_cursor_starts_from_first_page(self):
+        keys = ('code', 'id')
+        first = [e.code for e in self.page(keys=keys)]
+        for values in (['K1', 'abc'], ['K1', {'a': 1}], [None, 1], ['K1', [1]], ['K1']):
+            with self.subTest(values=values):
+                page = self.page(encode_cursor(values), keys=keys)
+                self.assertEqual([e.code for e in page], first)
+                self.assertFalse(page.has_prev)
+
+    def test_list_views_ignore_crafted_cursor(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(user)
+        for name in ('app_hr:employee_list', 'app_hr:payslip_list'):
+            for values in (['E001', 'abc'], ['E001', {'a': 1}], [None, 1]):
+                with self.subTest(view=name, values=values):
+                    response = self.client.get(reverse(name), {'cursor': encode_cursor(values)})
+                    self.assertEqual(response.status_code, 200)
+
+    def test_list_paginate(self):
+        items = list(range(7))
+        first = list_paginate(items, None, 3)
+        second = list_paginate(items, first.next_cursor, 3)
+        third = list_paginate(items, second.next_cursor, 3)
+
+        self.assertEqual((first.items, second.items, third.items), ([0, 1, 2], [3, 4, 5], [6]))
+        self.assertFalse(third.has_next)
+        self.assertEqual(list_paginate(items, second.prev_cursor, 3).items, [0, 1, 2])
+
+
+# ===== พฤติกรรมของงานคำนวณ / นำเข้า (ข้อมูลเล็ก คำตอบคิดมือได้) =====
+
+# งวดสั้น ๆ 1 สัปดาห์: จ. 6 ม.ค. 2025 - อา. 12 ม.ค. 2025
+WEEK_START = date(2025, 1, 6)
+WEEK_END = date(2025, 1, 12)
+
+
+def make_week_period():
+    return PayrollPeriod.objects.create(month=1, year=2025, start_date=WEEK_START, end_date=WEEK_END)
+
+
+class OvertimeTests(TestCase):
+    """
+    payroll.compute_overtime + การเขียน OT ตอนรันเงินเดือน
+    เงินเดือน 24,000 -> ค่าจ้างชั่วโมงละ 24000 / 30 / 8 = 100 บาท
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.period = make_week_period()
+        CompanySetting.get_solo()  # เลิกงาน 18:00, OT 1.5 / 2 / 3 เท่า
+        Holiday.objects.create(date=date(2025, 1, 8), name='วันหยุดบริษัท')
+        cls.emp = Employee.objects.create(code='OT1', first_name='A', last_name='B', base_salary=24000)
+
+        def punch(day, check_in, check_out):
+            AttendanceRecord.objects.create(
+                employee=cls.emp, work_date=date(2025, 1, day),
+                check_in=check_in, check_out=check_out, status='present',
+            )
+
+        punch(6, time(9), time(20))         # จ.: ออกหลังเลิกงาน 2 ชม.
+        punch(7, time(9), time(18, 20))     # อ.: 20 นาที ต่ำกว่าขั้นต่ำ ไม่นับ
+        punch(8, time(9), time(12))         # วันหยุด: 3 ชม.
+        punch(11, time(22), time(2))        # ส.: ข้ามคืน 4 ชม.
+
+    def test_hours_and_amounts_by_kind(self):
+        result = compute_overtime(self.period, [self.emp])
+
+        self.assertEqual(result[self.emp.id], {
+            'weekday': (Decimal('2.00'), Decimal('300.00')),
+            'holiday': (Decimal('3.00'), Decimal('900.00')),
+            'weekend': (Decimal('4.00'), Decimal('800.00')),
+        })
+
+    def test_night_shift_weekday_overtime_counts_from_shift_end(self):
+        night = ShiftSchedule.objects.create(code='N', name='กะดึก', start_time=time(22), end_time=time(6))
+        ShiftAssignment.objects.create(shift=night, employee=self.emp, effective_from=WEEK_START)
+        AttendanceRecord.objects.filter(employee=self.emp, work_date=date(2025, 1, 6)).update(
+            check_in=time(22), check_out=time(7, 30),
+        )
+
+        result = compute_overtime(self.period, [self.emp])
+        self.assertEqual(result[self.emp.id]['weekday'], (Decimal('1.50'), Decimal('225.00')))
+
+    def test_rerun_replaces_generated_items_only(self):
+        run_payroll(self.period)
+        payslip = Payslip.objects.get(employee=self.emp, period=self.period)
+        manual_type = EarningType.objects.create(code='OT', name='ค่าล่วงเวลา (OT)')
+        # OT ที่ HR คีย์เอง แม้ชื่อจะเหมือนที่ระบบสร้าง ก็ต้องไม่ถูกลบ
+        PayslipItem.objects.create(
+            payslip=payslip, item_type='earning', earning_type=manual_type,
+            name='ค่าล่วงเวลา (OT) วันทำงาน 1.00 ชม.', amount=500,
+        )
+
+        run_payroll(self.period)
+
+        self.assertEqual(
+            list(payslip.items.filter(earning_type=manual_type).values_list('name', flat=True)),
+            ['ค่าล่วงเวลา (OT) วันทำงาน 1.00 ชม.'],
+        )
+        generated = sorted(
+            payslip.items.filter(earning_type__code=OT_ATTENDANCE_CODE).values_list('name', flat=True)
+        )
+        self.assertEqual(generated, [
+            'ค่าล่วงเวลา (OT) วันทำงาน 2.00 ชม.',
+            'ค่าล่วงเวลา (OT) วันหยุดนักขัตฤกษ์ 3.00 ชม.',
+            'ค่าล่วงเวลา (OT) เสาร์-อาทิตย์ 4.00 ชม.',
+        ])
+
+    def test_ot_employee_count_only_counts_employees_with_items(self):
+        # มีเวลา OT แต่เงินเดือน 0 -> ไม่มีรายการ OT
+        unpaid = Employee.objects.create(code='OT2', first_name='C', last_name='D', base_salary=0)
+        AttendanceRecord.objects.create(
+            employee=unpaid, work_date=date(2025, 1, 6), check_in=time(9), check_out=time(20), status='present',
+        )
+
+        result = run_payroll(self.period)
+
+        self.assertEqual(result['ot_employee_count'], 1)
+        self.assertEqual(result['ot_total'], Decimal('2000.00'))
+
+
+class AttendanceRollupTests(TestCase):
+    """
+    AttendanceMonthlySummary ต้องตรงกับ AttendanceRecord หลังทุกทางที่เขียน (refresh เอง ไม่ใช้ signal)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.emp = Employee.objects.create(code='R1', first_name='A', last_name='B')
+
+    def counts(self, month):
+        return {k: v for k, v in get_month_status_counts(2025, self.emp)[month].items() if v}
+
+    def test_refresh_replaces_month_counts(self):
+        AttendanceRecord.objects.create(employee=self.emp, work_date=date(2025, 3, 3), status='present')
+        refresh_attendance_rollup([(self.emp.id, 2025, 3)])
+        self.assertEqual(self.counts(3), {'present': 1})
+
+        AttendanceRecord.objects.filter(employee=self.emp).update(status='absent')
+        refresh_attendance_rollup([(self.emp.id, 2025, 3)])
+        self.assertEqual(self.counts(3), {'absent': 1})
+
+        AttendanceRecord.objects.filter(employee=self.emp).delete()
+        refresh_attendance_rollup([(self.emp.id, 2025, 3)])
+        self.assertEqual(self.counts(3), {})
+
+    def test_import_refreshes_touched_months(self):
+        data = (
+            "employee_code,date,check_in,check_out\n"
+            "R1,2025-03-31,08:30,17:30\n"
+            "R1,2025-04-01,08:30,17:30\n"
+        ).encode()
+        import_attendance_csv(data, 'a.csv')
+
+        self.assertEqual(sum(self.counts(3).values()), 1)
+        self.assertEqual(sum(self.counts(4).values()), 1)
+
+    def test_system_reset_clears_rollup(self):
+        AttendanceRecord.objects.create(employee=self.emp, work_date=date(2025, 3, 3), status='present')
+        refresh_attendance_rollup([(self.emp.id, 2025, 3)])
+
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(user)
+        self.client.post(reverse('app_hr:system_reset'), {'confirm': 'yes'})
+
+        self.assertFalse(AttendanceRecord.objects.exists())
+        self.assertFalse(AttendanceMonthlySummary.objects.exists())
+
+
+class DeviceIngestTests(TestCase):
+    """
+    devices.ingest_device_events: รวม punch แบบ min/max, กันซ้ำ, ไม่ทับข้อมูลของ HR
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        CompanySetting.get_solo()
+        cls.device = AttendanceDevice(code='D1')
+        cls.device.set_new_token()
+        cls.device.save()
+        cls.emp = Employee.objects.create(code='D100', first_name='A', last_name='B')
+
+    def event(self, event_id, timestamp, kind, code='D100'):
+        return {'event_id': event_id, 'employee_code': code, 'timestamp': timestamp, 'type': kind}
+
+    def test_punches_merge_to_earliest_in_and_latest_out(self):
+        result = ingest_device_events(self.device, [
+            self.event('1', '2025-03-03T09:20:00', 'in'),
+            self.event('2', '2025-03-03T08:55:00', 'in'),
+            self.event('3', '2025-03-03T18:05:00', 'out'),
+        ])
+        self.assertEqual((result['accepted'], result['created']), (3, 1))
+
+        ingest_device_events(self.device, [self.event('4', '2025-03-03T19:30:00', 'out')])
+
+        att = AttendanceRecord.objects.get(employee=self.emp, work_date=date(2025, 3, 3))
+        self.assertEqual((att.check_in, att.check_out, att.status, att.source),
+                         (time(8, 55), time(19, 30), 'present', 'device'))
+
+    def test_duplicates_and_unknown_employees(self):
+        ingest_device_events(self.device, [self.event('1', '2025-03-03T08:55:00', 'in')])
+
+        result = ingest_device_events(self.device, [
+            self.event('1', '2025-03-03T07:00:00', 'in'),      # เคยรับแล้ว
+            self.event('2', '2025-03-03T18:00:00', 'out'),
+            self.event('2', '2025-03-03T18:00:00', 'out'),     # ซ้ำใน batch
+            self.event('3', '2025-03-03T08:00:00', 'in', code='NOPE'),
+            self.event('4', 'bad', 'in'),
+        ])
+
+        self.assertEqual([r['status'] for r in result['results']],
+                         ['duplicate', 'accepted', 'duplicate', 'rejected', 'rejected'])
+        att = AttendanceRecord.objects.get(employee=self.emp, work_date=date(2025, 3, 3))
+        self.assertEqual((att.check_in, att.check_out), (time(8, 55), time(18)))
+
+    def test_manual_record_keeps_source(self):
+        AttendanceRecord.objects.create(employee=self.emp, work_date=date(2025, 3, 4), check_in=time(8, 30),
+                                        check_out=time(17), source='manual', status='present')
+
+        result = ingest_device_events(self.device, [
+            self.event('1', '2025-03-04T09:10:00', 'in'),
+            self.event('2', '2025-03-04T18:20:00', 'out'),
+        ])
+
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        att = AttendanceRecord.objects.get(employee=self.emp, work_date=date(2025, 3, 4))
+        self.assertEqual((att.check_in, att.check_out, att.source), (time(8, 30), time(18, 20), 'manual'))
+
+    def test_malformed_event_fields_are_rejected(self):
+        result = ingest_device_events(self.device, [
+            self.event('1', '2025-03-03T08:55:00', []),
+            self.event('2', '2025-03-03T08:55:00', {}),
+            self.event({'a': 1}, '2025-03-03T08:55:00', 'in'),
+            self.event(None, '2025-03-03T08:55:00', 'in'),
+            'not-an-object',
+        ])
+
+        self.assertEqual([r['status'] for r in result['results']], ['rejected'] * 5)
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+    def test_zero_event_id_is_accepted(self):
+        result = ingest_device_events(self.device, [self.event(0, '2025-03-03T08:55:00', 'in')])
+
+        self.assertEqual(result['accepted'], 1)
+        self.assertEqual(result['results'][0]['event_id'], '0')
+
+
+
+class AttendanceRestatusTests(TestCase):
+    """
+    สถานะเข้างานต้องคำนวณใหม่เมื่อการลาที่อนุมัติ / วันหยุด ถูกบันทึกผ่านหน้าเว็บ
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        CompanySetting.get_solo()
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.emp = Employee.objects.create(code='S1', first_name='A', last_name='B')
+        cls.leave_type = LeaveType.objects.create(code='SICK', name='ลาป่วย', is_paid=True)
+        for day in (6, 7):
+            AttendanceRecord.objects.create(employee=cls.emp, work_date=date(2025, 1, day), status='absent')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def statuses(self):
+        return dict(AttendanceRecord.objects.filter(employee=self.emp).values_list('work_date', 'status'))
+
+    def post_leave(self, status):
+        return self.client.post(reverse('app_hr:leave_manage'), {
+            'employee': self.emp.pk, 'leave_type': self.leave_type.pk,
+            'start_date': '2025-01-06', 'end_date': '2025-01-06', 'days': '1', 'status': status,
+        })
+
+    def test_approved_leave_restatuses_leave_days(self):
+        self.post_leave('approved')
+        self.assertEqual(self.statuses(), {date(2025, 1, 6): 'leave', date(2025, 1, 7): 'absent'})
+        self.assertEqual(get_month_status_counts(2025, self.emp)[1]['leave'], 1)
+
+    def test_pending_leave_keeps_status(self):
+        self.post_leave('pending')
+        self.assertEqual(self.statuses(), {date(2025, 1, 6): 'absent', date(2025, 1, 7): 'absent'})
+
+    def test_holiday_add_and_delete_restatus(self):
+        url = reverse('app_hr:attendance_settings')
+        self.client.post(url, {'add_holiday': '1', 'date': '2025-01-07', 'name': 'วันหยุดบริษัท'})
+        self.assertEqual(self.statuses()[date(2025, 1, 7)], 'holiday')
+
+        holiday = Holiday.objects.get(date=date(2025, 1, 7))
+        self.client.post(url, {'delete_holiday_id': holiday.pk})
+        self.assertEqual(self.statuses()[date(2025, 1, 7)], 'absent')
+
+
+class ShiftResolutionTests(TestCase):
+    """
+    shifts.ShiftLookup: รายคน > แผนก > ค่าบริษัท และช่วงวันที่มีผล
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        CompanySetting.get_solo()
+        cls.it_emp = Employee.objects.create(code='S1', first_name='A', last_name='B', department='IT')
+        cls.override_emp = Employee.objects.create(code='S2', first_name='C', last_name='D', department='IT')
+        cls.other_emp = Employee.objects.create(code='S3', first_name='E', last_name='F', department='HR')
+
+        cls.morning = ShiftSchedule.objects.create(code='M', name='กะเช้า', start_time=time(7), end_time=time(16))
+        cls.late = ShiftSchedule.objects.create(code='L', name='กะสาย', start_time=time(10), end_time=time(19))
+        cls.night = ShiftSchedule.objects.create(code='N', name='กะดึก', start_time=time(22), end_time=time(6),
+                                                 late_after_minutes=15)
+
+        ShiftAssignment.objects.create(shift=cls.morning, department='IT', effective_from=date(2025, 1, 1),
+                                       effective_to=date(2025, 1, 31))
+        ShiftAssignment.objects.create(shift=cls.late, department='IT', effective_from=date(2025, 2, 1))
+        ShiftAssignment.objects.create(shift=cls.night, employee=cls.override_emp, effective_from=date(2025, 1, 15))
+
+    def lookup(self):
+        return ShiftLookup(date(2025, 1, 1), date(2025, 2, 28))
+
+    def test_department_assignment_by_effective_dates(self):
+        shifts = self.lookup()
+        self.assertEqual(shifts.get(self.it_emp.id, date(2025, 1, 20)).start_time, time(7))
+        self.assertEqual(shifts.get(self.it_emp.id, date(2025, 2, 3)).start_time, time(10))
+
+    def test_employee_assignment_overrides_department(self):
+        shifts = self.lookup()
+        self.assertEqual(shifts.get(self.override_emp.id, date(2025, 1, 14)).start_time, time(7))
+        self.assertEqual(shifts.get(self.override_emp.id, date(2025, 1, 15)).start_time, time(22))
+        self.assertEqual(shifts.get(self.override_emp.id, date(2025, 2, 3)).start_time, time(22))
+
+    def test_no_assignment_uses_company_setting(self):
+        rule = self.lookup().get(self.other_emp.id, date(2025, 1, 20))
+        self.assertEqual((rule.start_time, rule.late_after_minutes, rule.end_time), (time(9), 15, time(18)))
+
+    def test_lookup_limited_to_employees(self):
+        shifts = ShiftLookup(date(2025, 1, 1), date(2025, 2, 28), employee_ids=[self.override_emp.id])
+        self.assertEqual(shifts.get(self.override_emp.id, date(2025, 1, 20)).start_time, time(22))
+        self.assertEqual(shifts.get(self.it_emp.id, date(2025, 1, 20)).start_time, time(9))
+
+    def test_overnight_shift_status(self):
+        resolver = AttendanceStatusResolver(date(2025, 1, 20), date(2025, 1, 20))
+        emp_id, day = self.override_emp.id, date(2025, 1, 20)
+        self.assertEqual(resolver.status_for(emp_id, day, time(22, 10)), 'present')
+        self.assertEqual(resolver.status_for(emp_id, day, time(22, 30)), 'late')
+        # เข้าหลังเที่ยงคืน = เช้าวันถัดไป
+        self.assertEqual(resolver.status_for(emp_id, day, time(0, 30)), 'late')
+
+
+class UnpaidDaysTests(TestCase):
+    """
+    payroll.compute_unpaid_days: วันทำงาน = จ.-ศ. ที่ไม่ใช่วันหยุด แล้วแยกเหตุผลวันไม่จ่าย
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.period = make_week_period()
+        Holiday.objects.create(date=date(2025, 1, 8), name='วันหยุดบริษัท')
+        cls.emp = Employee.objects.create(code='U1', first_name='A', last_name='B', base_salary=30000)
+        cls.no_records = Employee.objects.create(code='U2', first_name='C', last_name='D', base_salary=30000)
+
+        AttendanceRecord.objects.create(employee=cls.emp, work_date=date(2025, 1, 6), check_in=time(8, 50),
+                                        status='present')
+        AttendanceRecord.objects.create(employee=cls.emp, work_date=date(2025, 1, 7), status='absent')
+        paid = LeaveType.objects.create(code='SICK', name='ลาป่วย', is_paid=True)
+        unpaid = LeaveType.objects.create(code='UNP', name='ลาไม่รับเงิน', is_paid=False)
+        LeaveRecord.objects.create(employee=cls.emp, leave_type=paid, start_date=date(2025, 1, 9),
+                                   end_date=date(2025, 1, 9), status='approved')
+        LeaveRecord.objects.create(employee=cls.emp, leave_type=unpaid, start_date=date(2025, 1, 10),
+                                   end_date=date(2025, 1, 12), status='approved')
+        # ยังไม่อนุมัติ -> ไม่มีผล
+        LeaveRecord.objects.create(employee=cls.no_records, leave_type=paid, start_date=date(2025, 1, 6),
+                                   end_date=date(2025, 1, 6), status='pending')
+
+    def test_working_days_skip_weekend_and_holiday(self):
+        working_days, _ = compute_unpaid_days(self.period, [self.emp.id])
+        self.assertEqual(working_days, [date(2025, 1, 6), date(2025, 1, 7), date(2025, 1, 9), date(2025, 1, 10)])
+
+    def test_unpaid_reasons(self):
+        _, result = compute_unpaid_days(self.period, [self.emp.id, self.no_records.id])
+
+        self.assertEqual(result[self.emp.id].unpaid_dates, [
+            (date(2025, 1, 7), UNPAID_REASON_ABSENT),
+            (date(2025, 1, 10), UNPAID_REASON_LEAVE),
+        ])
+        self.assertEqual(result[self.emp.id].unpaid_leave_days, 1)
+        self.assertEqual(result[self.emp.id].absent_days, 1)
+
+        self.assertEqual(result[self.no_records.id].unpaid_days, 4)
+        self.assertEqual(
+            {reason for _, reason in result[self.no_records.id].unpaid_dates}, {UNPAID_REASON_NO_RECORD},
+        )
+
+    def test_day_breakdown_round_trip(self):
+        _, result = compute_unpaid_days(self.period, [self.emp.id])
+        data = encode_day_breakdown(WEEK_START, WEEK_END, result[self.emp.id])
+
+        self.assertEqual(len(data), 7)
+        self.assertEqual(
+            decode_day_breakdown(WEEK_START, WEEK_END, data),
+            (4, result[self.emp.id].unpaid_dates),
+        )
+        # งวดยาวไม่ตรงกับข้อมูล -> ไม่ใช้
+        self.assertIsNone(decode_day_breakdown(WEEK_START, date(2025, 1, 13), data))
+
+
+class ImportRowHashTests(TestCase):
+    """
+    นำเข้า CSV ซ้ำ: ข้ามแถว / ไฟล์ที่ไม่เปลี่ยน แต่ต้องสร้าง record ที่ถูกลบไปแล้วคืน
+    """
+
+    ATTENDANCE_CSV = (
+        "employee_code,date,check_in,check_out\n"
+        "I1,2025-03-03,08:50,18:00\n"
+        "I2,2025-03-03,09:40,18:00\n"
+    ).encode()
+    EMPLOYEE_CSV = (
+        "code,first_name,last_name,base_salary\n"
+        "N1,สมชาย,ใจดี,20000\n"
+        "N2,สมหญิง,ใจงาม,25000\n"
+    ).encode()
+
+    @classmethod
+    def setUpTestData(cls):
+        CompanySetting.get_solo()
+        Employee.objects.create(code='I1', first_name='A', last_name='B')
+        Employee.objects.create(code='I2', first_name='C', last_name='D')
+
+    def test_attendance_reimport_skips_unchanged(self):
+        report = import_attendance_csv(self.ATTENDANCE_CSV, 'a.csv')
+        self.assertEqual((report['created'], report['updated']), (2, 0))
+        self.assertEqual(
+            dict(AttendanceRecord.objects.values_list('employee__code', 'status')), {'I1': 'present', 'I2': 'late'},
+        )
+
+        self.assertTrue(import_attendance_csv(self.ATTENDANCE_CSV, 'a.csv')['file_unchanged'])
+
+        changed = self.ATTENDANCE_CSV.replace(b"I2,2025-03-03,09:40", b"I2,2025-03-03,08:40")
+        report = import_attendance_csv(changed, 'b.csv')
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (0, 1, 1))
+        self.assertEqual(AttendanceRecord.objects.get(employee__code='I2').status, 'present')
+
+    def test_attendance_reimport_recreates_deleted_record(self):
+        import_attendance_csv(self.ATTENDANCE_CSV, 'a.csv')
+        AttendanceRecord.objects.filter(employee__code='I1').delete()
+
+        report = import_attendance_csv(self.ATTENDANCE_CSV, 'a.csv')
+
+        self.assertFalse(report['file_unchanged'])
+        self.assertEqual((report['created'], report['unchanged']), (1, 1))
+        self.assertTrue(AttendanceRecord.objects.filter(employee__code='I1', work_date=date(2025, 3, 3)).exists())
+
+    def test_employee_reimport_updates_changed_rows(self):
+        import_employee_csv(self.EMPLOYEE_CSV, 'e.csv')
+        self.assertTrue(import_employee_csv(self.EMPLOYEE_CSV, 'e.csv')['file_unchanged'])
+
+        report = import_employee_csv(self.EMPLOYEE_CSV.replace(b"25000", b"26000"), 'e2.csv')
+
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (0, 1, 1))
+        self.assertEqual(Employee.objects.get(code='N2').base_salary, Decimal('26000'))
+
+    def test_employee_reimport_recreates_deleted_employee(self):
+        import_employee_csv(self.EMPLOYEE_CSV, 'e.csv')
+        Employee.objects.filter(code='N1').delete()
+
+        report = import_employee_csv(self.EMPLOYEE_CSV, 'e.csv')
+
+        self.assertFalse(report['file_unchanged'])
+        self.assertEqual((report['created'], report['unchanged']), (1, 1))
+        self.assertTrue(Employee.objects.filter(code='N1').exists())
+
+
+class MetricsMergeTests(TestCase):
+    """
+    metrics: รวมค่าจากไฟล์ของหลาย process + ย้ายไฟล์ของ process ที่ตายแล้วเข้า archive
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(HR_METRICS=True, HR_METRICS_DIR=self.tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def process_file(self, pid, counter_value, bucket_counts, gauge=(0, 0.0)):
+        data = {
+            'pid': pid,
+            'counters': [['hr_import_rows_total', ['attendance', 'created'], counter_value]],
+            'histograms': [['hr_export_duration_seconds', ['payroll_csv'], bucket_counts, 1.5]],
+            'gauges': [['hr_memory_peak_bytes', ['payroll_run'], gauge[0], gauge[1]]],
+        }
+        with open(os.path.join(self.tmp.name, f'{pid}-1.json'), 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        return data
+
+    @staticmethod
+    def dead_pid():
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+        return proc.pid
+
+    def test_merge_sums_counters_and_histograms(self):
+        merged = metrics._empty_merged()
+        buckets = [0] * 12
+        metrics._merge(merged, {'counters': [['c', ['x'], 2]], 'histograms': [['h', [], [1] + buckets[1:], 0.5]],
+                                'gauges': [['g', [], 10, 200.0]]})
+        metrics._merge(merged, {'counters': [['c', ['x'], 3]], 'histograms': [['h', [], [2] + buckets[1:], 0.25]],
+                                'gauges': [['g', [], 20, 100.0]]})
+        # จำนวน bucket ไม่ตรง (เปลี่ยน bucket ระหว่าง deploy) -> ไม่รวม
+        metrics._merge(merged, {'histograms': [['h', [], [5, 5], 9.0]]})
+
+        self.assertEqual(merged['counters'][('c', ('x',))], 5)
+        self.assertEqual(merged['histograms'][('h', ())], [[3] + buckets[1:], 0.75])
+        # gauge: ค่าที่ตั้งล่าสุดชนะ ไม่ใช่ค่าที่อ่านทีหลัง
+        self.assertEqual(merged['gauges'][('g', ())], (10, 200.0))
+
+    def test_dead_process_files_are_archived_and_still_counted(self):
+        buckets = [1] + [0] * 11
+        self.process_file(self.dead_pid(), 30, buckets)
+        self.process_file(os.getppid(), 1000, buckets)  # process ที่ยังอยู่
+
+        merged = metrics.collect_metrics()
+
+        self.assertEqual(merged['counters'][('hr_import_rows_total', ('attendance', 'created'))], 1030)
+        self.assertEqual(merged['histograms'][('hr_export_duration_seconds', ('payroll_csv',))][0][0], 2)
+        files = sorted(os.listdir(self.tmp.name))
+        self.assertIn(metrics.METRICS_ARCHIVE_FILE, files)
+        self.assertEqual(len([f for f in files if f.endswith('-1.json')]), 1)
+
+        # scrape รอบถัดไปได้ค่าเท่าเดิม (archive ไม่ถูกรวมซ้ำ)
+        merged = metrics.collect_metrics()
+        self.assertEqual(merged['counters'][('hr_import_rows_total', ('attendance', 'created'))], 1030)
+
+    def test_render_prometheus_cumulative_buckets(self):
+        merged = metrics._empty_merged()
+        counts = [1, 2] + [0] * 10
+        merged['histograms'][('hr_export_duration_seconds', ('payroll_csv',))] = [counts, 0.3]
+
+        text = metrics.render_prometheus(merged)
+
+        self.assertIn('hr_export_duration_seconds_bucket{kind="payroll_csv",le="0.1"} 1', text)
+        self.assertIn('hr_export_duration_seconds_bucket{kind="payroll_csv",le="0.5"} 3', text)
+        self.assertIn('hr_export_duration_seconds_count{kind="payroll_csv"} 3', text)
+
+
+class AttendanceAnalyticsTests(TestCase):
+    """
+    analytics: อันดับมาสาย / ขาดติดต่อกัน / แนวโน้มตรงเวลา + cache ที่เปลี่ยนตาม rollup
+    """
+
+    JAN = (date(2025, 1, 1), date(2025, 1, 31))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a1 = Employee.objects.create(code='A1', first_name='A', last_name='A', department='IT')
+        cls.a2 = Employee.objects.create(code='A2', first_name='B', last_name='B', department='IT')
+        cls.a3 = Employee.objects.create(code='A3', first_name='C', last_name='C', department='HR')
+
+        days = {
+            cls.a1: {(1, 6): 'late', (1, 7): 'late', (1, 8): 'present', (2, 4): 'late'},
+            cls.a2: {(1, 6): 'late', (1, 7): 'absent', (1, 8): 'absent', (1, 9): 'present'},
+            cls.a3: {(1, 6): 'late', (1, 7): 'late', (1, 8): 'late'},
+        }
+        for emp, by_day in days.items():
+            for (month, day), status in by_day.items():
+                AttendanceRecord.objects.create(employee=emp, work_date=date(2025, month, day), status=status)
+        rebuild_attendance_rollup()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lateness_ranking_overall_and_by_department(self):
+        rows = lateness_ranking(*self.JAN)
+
+        self.assertEqual(
+            [(r['code'], r['late_count'], r['overall_rank'], r['dept_rank']) for r in rows],
+            [('A3', 3, 1, 1), ('A1', 2, 2, 1), ('A2', 1, 3, 2)],
+        )
+        self.assertEqual([r['code'] for r in lateness_ranking(*self.JAN, department='IT')], ['A1', 'A2'])
+
+    def test_absence_streaks(self):
+        rows = absence_streaks(*self.JAN)
+
+        self.assertEqual(
+            [(r['code'], r['start_date'], r['end_date'], r['days']) for r in rows],
+            [('A2', date(2025, 1, 7), date(2025, 1, 8), 2)],
+        )
+        self.assertEqual(absence_streaks(*self.JAN, min_days=3), [])
+
+    def test_punctuality_trend_compares_with_previous_month(self):
+        rows = punctuality_trend(date(2025, 1, 1), date(2025, 2, 28), department='IT')
+
+        self.assertEqual(
+            [(r['month'], r['present'], r['late'], r['on_time_rate'], r['change']) for r in rows],
+            [(1, 2, 3, 40.0, None), (2, 0, 1, 0.0, -40.0)],
+        )
+
+    def test_cache_follows_rollup_changes(self):
+        self.assertEqual(lateness_ranking(*self.JAN)[-1]['late_count'], 1)
+
+        AttendanceRecord.objects.filter(employee=self.a2, work_date=date(2025, 1, 9)).update(status='late')
+        refresh_attendance_rollup([(self.a2.id, 2025, 1)])
+
+        self.assertEqual([(r['code'], r['late_count']) for r in lateness_ranking(*self.JAN)][1:],
+                         [('A1', 2), ('A2', 2)])
+
+
+class AttendanceExportTests(TestCase):
+    """
+    exports: stream CSV / JSONL ทีละก้อน + gzip ครอบ generator
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        it = Employee.objects.create(code='X1', first_name='สมชาย', last_name='ใจดี', department='IT')
+        hr = Employee.objects.create(code='X2', first_name='สมหญิง', last_name='ใจงาม', department='HR')
+        AttendanceRecord.objects.create(employee=it, work_date=date(2025, 1, 6), check_in=time(8, 50),
+                                        check_out=time(18), status='present', source='csv')
+        AttendanceRecord.objects.create(employee=hr, work_date=date(2025, 1, 6), status='absent')
+        AttendanceRecord.objects.create(employee=it, work_date=date(2025, 1, 7), check_in=time(9, 40),
+                                        status='late')
+        AttendanceRecord.objects.create(employee=it, work_date=date(2025, 2, 3), status='present')
+
+    def export(self, **kwargs):
+        return ''.join(iter_attendance_export(date(2025, 1, 1), date(2025, 1, 31), **kwargs))
+
+    def test_csv_has_bom_header_and_rows_in_order(self):
+        text = self.export()
+
+        self.assertTrue(text.startswith('\ufeff'))
+        rows = list(csv.reader(text[1:].splitlines()))
+        self.assertEqual(rows[0][:3], ['วันที่', 'รหัสพนักงาน', 'ชื่อ'])
+        self.assertEqual([(r[0], r[1], r[5]) for r in rows[1:]], [
+            ('2025-01-06', 'X1', 'present'),
+            ('2025-01-06', 'X2', 'absent'),
+            ('2025-01-07', 'X1', 'late'),
+        ])
+        self.assertEqual(rows[1][6:8], ['08:50:00', '18:00:00'])
+
+    def test_jsonl_filters_by_department_and_status(self):
+        lines = self.export(department='IT', status='late', fmt='jsonl').splitlines()
+
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(
+            (record['employee_code'], record['work_date'], record['check_in'], record['check_out']),
+            ('X1', '2025-01-07', '09:40:00', None),
+        )
+
+    def test_rows_are_yielded_in_batches(self):
+        with mock.patch('app_hr.exports.EXPORT_BATCH_ROWS', 2):
+            chunks = list(iter_attendance_export(date(2025, 1, 1), date(2025, 1, 31)))
+
+        # header + 2 แถว / แถวที่ 3
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [3, 1])
+
+    def test_gzip_stream_round_trip(self):
+        chunks = ['ก' * 1000, 'ข' * 1000, '']
+        self.assertEqual(gzip.decompress(b''.join(gzip_stream(chunks))).decode(), ''.join(chunks))
+
+    def test_view_streams_gzip_download(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('app_hr:attendance_export'), {
+            'start': '2025-01-01', 'end': '2025-01-31', 'format': 'csv', 'gzip': '1', 'download': '1',
+        })
+
+        self.assertTrue(response.streaming)
+        self.assertIn('attendance_20250101_20250131.csv.gz', response['Content-Disposition'])
+        text = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(len(text.splitlines()), 4)
+
+
+@skipUnless(fts_supported(), "ต้องใช้ SQLite >= 3.34 (FTS5 trigram)")
+class EmployeeSearchTests(TestCase):
+    """
+    search: ดัชนี FTS5 trigram ค้นภาษาไทยแบบ substring + trigger sync ทุกทางที่เขียน Employee
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.somchai = Employee.objects.create(code='F100', first_name='สมชาย', last_name='ใจดี', department='IT')
+        cls.somying = Employee.objects.create(code='F200', first_name='สมหญิง', last_name='ใจงาม', department='HR')
+        cls.wichai = Employee.objects.create(code='F300', first_name='วิชัย', last_name='ใจดี', department='IT',
+                                             status='inactive')
+
+    def codes(self, q, qs=None):
+        return sorted(filter_by_employee_search(qs or Employee.objects.all(), q).values_list('code', flat=True))
+
+    def test_thai_substring_and_case_insensitive(self):
+        self.assertEqual(self.codes('ชาย'), ['F100'])
+        self.assertEqual(self.codes('ใจดี'), ['F100', 'F300'])
+        self.assertEqual(self.codes('f20'), ['F200'])
+
+    def test_every_term_must_match_in_any_field(self):
+        self.assertEqual(self.codes('สมชาย ใจดี'), ['F100'])
+        self.assertEqual(self.codes('ใจดี IT'), ['F100', 'F300'])
+        self.assertEqual(self.codes('สมหญิง IT'), [])
+
+    def test_index_follows_bulk_writes(self):
+        Employee.objects.bulk_create([Employee(code='F400', first_name='มานะ', last_name='ขยัน', department='OPS')])
+        Employee.objects.filter(code='F200').update(department='FINANCE')
+        Employee.objects.filter(code='F300').delete()
+
+        self.assertEqual(self.codes('มานะ'), ['F400'])
+        self.assertEqual(self.codes('FINANCE'), ['F200'])
+        self.assertEqual(self.codes('วิชัย'), [])
+
+    def test_search_employees_ranks_within_queryset(self):
+        qs, rank_of = search_employees(Employee.objects.filter(status='active'), 'ใจดี')
+
+        self.assertEqual(list(qs.values_list('code', flat=True)), ['F100'])
+        self.assertEqual(rank_of, {self.somchai.id: 0})
+
+    def test_short_terms_fall_back_to_icontains(self):
+        qs, rank_of = search_employees(Employee.objects.all(), 'HR')
+
+        self.assertIsNone(rank_of)
+        self.assertEqual(list(qs.values_list('code', flat=True)), ['F200'])
+
+    def test_payslip_filter_with_prefix(self):
+        period = make_week_period()
+        for emp in (self.somchai, self.somying):
+            Payslip.objects.create(employee=emp, period=period)
+
+        payslips = filter_by_employee_search(Payslip.objects.all(), 'สมหญิง', prefix='employee__')
+        self.assertEqual([p.employee_id for p in payslips], [self.somying.id])
+
+
+class WriteQueueTests(TestCase):
+    """
+    writequeue: งานเขียนก้อนใหญ่เข้าคิว แล้ว writer ตัวเดียวทำทีละงานตามลำดับ
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        CompanySetting.get_solo()
+        cls.emp = Employee.objects.create(code='W1', first_name='A', last_name='B')
+
+    def attendance_job(self, day):
+        data = f"employee_code,date,check_in,check_out\nW1,2025-03-{day:02d},08:50,18:00\n".encode()
+        return enqueue_write('attendance_import', {'file': encode_file(data), 'filename': f'{day}.csv'})
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue_write('nope')
+
+    def test_jobs_run_in_order_and_drop_file_payload(self):
+        first, second = self.attendance_job(3), self.attendance_job(4)
+
+        self.assertEqual(process_write_queue(max_jobs=1), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), (WriteJob.STATUS_DONE, WriteJob.STATUS_QUEUED))
+
+        self.assertEqual(process_write_queue(), 1)
+        second.refresh_from_db()
+        self.assertEqual(second.status, WriteJob.STATUS_DONE)
+        self.assertEqual(second.result['created'], 1)
+        self.assertEqual(second.payload, {'filename': '4.csv'})
+        self.assertEqual(AttendanceRecord.objects.filter(employee=self.emp).count(), 2)
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        job = self.attendance_job(3)
+
+        self.assertEqual(claim_next_job().pk, job.pk)
+        self.assertIsNone(claim_next_job())
+
+    def test_failed_and_interrupted_jobs(self):
+        failed = enqueue_write('payroll_run', {'period_id': 0})
+        process_write_queue()
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, WriteJob.STATUS_FAILED)
+        self.assertTrue(failed.error.startswith('DoesNotExist'))
+
+        running = self.attendance_job(3)
+        claim_next_job()
+        self.assertEqual(recover_interrupted_jobs(), 1)
+        running.refresh_from_db()
+        self.assertEqual(running.status, WriteJob.STATUS_FAILED)
+
+        metrics = write_queue_metrics()
+        self.assertEqual((metrics['depth'], metrics['running'], metrics['failed_recent']), (0, 0, 2))
+
+    @override_settings(HR_WRITE_QUEUE_ENABLED=True)
+    def test_view_enqueues_instead_of_writing(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(user)
+        AttendanceRecord.objects.create(employee=self.emp, work_date=date(2025, 1, 6), status='absent')
+        leave_type = LeaveType.objects.create(code='SICK', name='ลาป่วย', is_paid=True)
+
+        self.client.post(reverse('app_hr:leave_manage'), {
+            'employee': self.emp.pk, 'leave_type': leave_type.pk,
+            'start_date': '2025-01-06', 'end_date': '2025-01-06', 'days': '1', 'status': 'approved',
+        })
+        job = WriteJob.objects.get()
+        self.assertEqual((job.kind, job.status), ('attendance_recompute', WriteJob.STATUS_QUEUED))
+        self.assertEqual(AttendanceRecord.objects.get(employee=self.emp).status, 'absent')
+
+        process_write_queue()
+        self.assertEqual(AttendanceRecord.objects.get(employee=self.emp).status, 'leave')
+
+
+class RequestMetricsTests(TestCase):
+    """
+    instrumentation: นับ query / เวลา ต่อ request + สรุปตาม endpoint + header Server-Timing
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+
+    def setUp(self):
+        clear_request_metrics()
+        self.addCleanup(clear_request_metrics)
+        self.client.force_login(self.user)
+
+    def test_query_recorder_keeps_slowest(self):
+        recorder = QueryRecorder(slowest=2)
+        with connection.execute_wrapper(recorder):
+            for _ in range(3):
+                Employee.objects.count()
+
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(len(recorder.slowest), 2)
+        self.assertGreaterEqual(recorder.slowest[0][0], recorder.slowest[1][0])
+        self.assertIn('COUNT(*)', recorder.slowest[0][1])
+
+    def test_endpoint_summary(self):
+        samples = [
+            {'endpoint': 'a', 'wall_ms': ms, 'db_ms': 1.0, 'queries': q, 'path': f'/a/{ms}'}
+            for ms, q in ((10, 2), (30, 4), (20, 3))
+        ] + [{'endpoint': 'b', 'wall_ms': 15, 'db_ms': 1.0, 'queries': 40, 'path': '/b/'}]
+
+        rows = endpoint_summary(samples)
+        self.assertEqual([r['endpoint'] for r in rows], ['a', 'b'])
+        self.assertEqual((rows[0]['hits'], rows[0]['avg_ms'], rows[0]['p95_ms'], rows[0]['max_queries']),
+                         (3, 20.0, 30, 4))
+        self.assertEqual(rows[0]['worst']['path'], '/a/30')
+        self.assertEqual(endpoint_summary(samples, order_by='max_queries')[0]['endpoint'], 'b')
+
+    @override_settings(HR_REQUEST_METRICS=True)
+    def test_middleware_records_request_and_sets_server_timing(self):
+        response = self.client.get(reverse('app_hr:employee_list'))
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        [sample] = recent_requests()
+        self.assertEqual((sample['endpoint'], sample['status']), ('app_hr:employee_list', 200))
+        self.assertGreater(sample['queries'], 0)
+
+        data = self.client.get(reverse('app_hr:request_metrics'), {'format': 'json'}).json()
+        self.assertEqual(data['endpoints'][0]['endpoint'], 'app_hr:employee_list')
+
+    def test_disabled_middleware_adds_nothing(self):
+        response = self.client.get(reverse('app_hr:employee_list'))
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(recent_requests(), [])
+
+
+class ProfilingTests(TestCase):
+    """
+    profiling: cProfile เฉพาะ request ที่ staff ขอ + เก็บไฟล์ลงดิสก์แบบจำกัดจำนวน
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(HR_PROFILING=True, HR_PROFILE_DIR=self.tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_login(self.user)
+
+    def test_profile_only_when_requested(self):
+        response = self.client.get(reverse('app_hr:employee_list'))
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(list_profiles(), [])
+
+        response = self.client.get(reverse('app_hr:employee_list'), {'_profile': '1'})
+
+        profile_id = response['X-Profile-Id']
+        [meta] = list_profiles()
+        self.assertEqual((meta['id'], meta['view'], meta['status']), (profile_id, 'app_hr:employee_list', 200))
+        for ext in ('.prof', '.txt', '.json'):
+            self.assertIsNotNone(profile_path(profile_id, ext))
+        self.assertIn('employee_list_view', profile_path(profile_id, '.txt').read_text(encoding='utf-8'))
+
+        detail = self.client.get(reverse('app_hr:profile_detail', args=[profile_id]))
+        self.assertContains(detail, 'call tree')
+
+    def test_cookie_profiles_every_request(self):
+        self.client.cookies[PROFILE_COOKIE] = '1'
+        self.client.get(reverse('app_hr:employee_list'))
+        self.client.get(reverse('app_hr:payslip_list'))
+
+        self.assertEqual(sorted(m['view'] for m in list_profiles()), ['app_hr:employee_list', 'app_hr:payslip_list'])
+
+    def test_prune_keeps_newest(self):
+        for _ in range(3):
+            self.client.get(reverse('app_hr:employee_list'), {'_profile': '1'})
+        newest = list_profiles()[0]['id']
+
+        self.assertEqual(prune_profiles(max_files=1), 2)
+        self.assertEqual([m['id'] for m in list_profiles()], [newest])
+        self.assertEqual(len(os.listdir(self.tmp.name)), 3)
+
+    def test_profile_path_rejects_traversal(self):
+        self.assertIsNone(profile_path('../../etc/passwd', '.txt'))
+        self.assertEqual(self.client.get(reverse('app_hr:profile_detail', args=['..'])).status_code, 404)
+
+
+class PayrollTimingTests(TestCase):
+    """
+    timing.SpanRecorder + PayrollRun: เวลา / จำนวนแถว / จำนวน query ต่อขั้นตอนของการรันเงินเดือน
+    """
+
+    def test_span_counts_queries_and_survives_errors(self):
+        spans = SpanRecorder()
+        with spans.span('count', rows=2) as span:
+            Employee.objects.count()
+            Employee.objects.exists()
+            span['rows'] = 3
+        with self.assertRaises(ValueError):
+            with spans.span('fails'):
+                Employee.objects.count()
+                raise ValueError
+
+        self.assertEqual([(s['name'], s['rows'], s['queries']) for s in spans.as_list()],
+                         [('count', 3, 2), ('fails', None, 1)])
+        self.assertEqual(spans.total_queries, 3)
+        self.assertTrue(all(s['duration_ms'] >= 0 for s in spans.as_list()))
+
+    def test_run_payroll_records_stage_spans(self):
+        period = make_week_period()
+        Employee.objects.create(code='T1', first_name='A', last_name='B', base_salary=30000)
+
+        result = run_payroll(period)
+
+        run = PayrollRun.objects.get(pk=result['run_id'])
+        names = [s['name'] for s in run.spans]
+        self.assertEqual(names, [n for n in PAYROLL_STAGE_LABELS if n != 'generate_payslips'])
+        self.assertEqual((run.kind, run.employee_count), ('run', 1))
+        self.assertEqual(run.query_count, sum(s['queries'] for s in run.spans))
+        self.assertEqual(result['spans'], run.spans)
+
+    def test_generate_payslips_records_run(self):
+        period = make_week_period()
+        Employee.objects.create(code='T1', first_name='A', last_name='B', base_salary=30000)
+
+        run = period.generate_payslips()
+
+        self.assertEqual(run.kind, 'generate')
+        self.assertEqual([s['name'] for s in run.spans], ['prepare_types', 'load_employees', 'generate_payslips'])
+        self.assertEqual(run.spans[-1]['rows'], 1)
+
+
+class MemoryTraceTests(TestCase):
+    """
+    memtrace: peak / retained ของงานที่ถูกวัด + เตือนเมื่อเกิน budget
+    """
+
+    def setUp(self):
+        clear_traces()
+        self.addCleanup(clear_traces)
+
+    @staticmethod
+    @memory_traced('test_allocate')
+    def allocate(size, keep=True):
+        data = bytearray(size)
+        return data if keep else None
+
+    def test_disabled_runs_without_tracing(self):
+        self.assertEqual(len(self.allocate(1024)), 1024)
+        self.assertEqual(recent_traces(), [])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    @override_settings(HR_MEMTRACE=True)
+    def test_peak_and_retained(self):
+        kept = self.allocate(2 * 1024 * 1024)
+        self.allocate(4 * 1024 * 1024, keep=False)
+
+        first, second = recent_traces()
+        self.assertGreaterEqual(first['peak_bytes'], 2 * 1024 * 1024)
+        self.assertGreaterEqual(first['retained_bytes'], 2 * 1024 * 1024)
+        self.assertTrue(any(site.startswith('app_hr/tests.py:') for site, _, _ in first['top_sites']))
+        self.assertGreaterEqual(second['peak_bytes'], 4 * 1024 * 1024)
+        self.assertLess(second['retained_bytes'], 1024 * 1024)
+        self.assertFalse(tracemalloc.is_tracing())
+        del kept
+
+    @override_settings(HR_MEMTRACE=True)
+    def test_nested_calls_record_outermost_only(self):
+        @memory_traced('test_outer')
+        def outer():
+            return self.allocate(1024)
+
+        outer()
+
+        self.assertEqual([t['operation'] for t in recent_traces()], ['test_outer'])
+
+    @override_settings(HR_MEMTRACE=True, HR_MEMORY_BUDGETS_MB={'test_allocate': 1})
+    def test_over_budget_logs_warning(self):
+        with self.assertLogs('app_hr.memtrace', level='WARNING') as logs:
+            self.allocate(3 * 1024 * 1024, keep=False)
+
+        self.assertTrue(recent_traces()[0]['over_budget'])
+        self.assertIn('test_allocate', logs.output[0])
+
+    @override_settings(HR_MEMTRACE=True)
+    def test_failed_call_is_still_recorded(self):
+        @memory_traced('test_fails')
+        def fails():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            fails()
+
+        self.assertEqual([t['operation'] for t in recent_traces()], ['test_fails'])
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class SlowQueryLogTests(TestCase):
+    """
+    slowqueries: รวม query ช้าตามรูปแบบ (fingerprint) + EXPLAIN ครั้งแรก
+    """
+
+    def setUp(self):
+        clear_slow_queries()
+        self.addCleanup(clear_slow_queries)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND code = 'E''01' AND n > 10"),
+            "SELECT * FROM t WHERE id IN (...) AND code = ? AND n > ?",
+        )
+        self.assertEqual(normalize_sql('INSERT INTO t VALUES (%s, %s), (%s, %s)'), 'INSERT INTO t VALUES (?, ?), ...')
+        self.assertEqual(normalize_sql('SAVEPOINT "s123_x1"'), 'SAVEPOINT ?')
+        self.assertEqual(normalize_sql('SELECT "t1"."col2" FROM "t1"'), 'SELECT "t1"."col2" FROM "t1"')
+
+    @override_settings(HR_SLOW_QUERY_LOG=True, HR_SLOW_QUERY_MS=0)
+    def test_same_shape_is_grouped_and_explained_once(self):
+        with connection.execute_wrapper(slow_query_wrapper):
+            Employee.objects.filter(code='A1').count()
+            Employee.objects.filter(code='B2').count()
+
+        rows, dropped = slow_query_summary()
+        [row] = [r for r in rows if 'COUNT' in r['sql']]
+        self.assertEqual((row['count'], dropped), (2, 0))
+        self.assertIn('?', row['sql'])
+        self.assertNotIn('A1', row['sql'])
+        self.assertTrue(row['explain'])
+        self.assertFalse(row['explain'][0].startswith('error'))
+        self.assertTrue(row['caller'].startswith('app_hr/tests.py:'))
+
+    @override_settings(HR_SLOW_QUERY_LOG=True, HR_SLOW_QUERY_MS=0, HR_SLOW_QUERY_MAX_FINGERPRINTS=1)
+    def test_fingerprint_limit_counts_dropped(self):
+        with connection.execute_wrapper(slow_query_wrapper):
+            Employee.objects.count()
+            Employee.objects.filter(code='A1').exists()
+
+        rows, dropped = slow_query_summary()
+        self.assertEqual((len(rows), dropped), (1, 1))
+
+    @override_settings(HR_SLOW_QUERY_MS=0)
+    def test_disabled_records_nothing(self):
+        with connection.execute_wrapper(slow_query_wrapper):
+            Employee.objects.count()
+
+        self.assertEqual(slow_query_summary(), ([], 0))
+
+        conn = type('Conn', (), {'execute_wrappers': []})()
+        install_slow_query_log(None, conn)
+        self.assertEqual(conn.execute_wrappers, [])
+        with override_settings(HR_SLOW_QUERY_LOG=True):
+            install_slow_query_log(None, conn)
+            install_slow_query_log(None, conn)
+        self.assertEqual(conn.execute_wrappers, [slow_query_wrapper])
 
-# Create your tests here.
@@ -0,0 +1,51 @@
+"""
+จับเวลาเป็นช่วง (span) ภายในงานใหญ่ เช่น รันเงินเดือน
+ต่อ span เก็บ: ชื่อขั้นตอน, เวลา (ms), จำนวนแถวที่ทำ, จำนวน query
+
+    spans = SpanRecorder()
+    with spans.span('payslip_writes') as span:
+        ...
+        span['rows'] = len(payslips)
+    spans.as_list()  -> [{'name', 'duration_ms', 'rows', 'queries'}, ...]
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.utils import timezone
+
+
+class SpanRecorder:
+    def __init__(self):
+        self.spans = []
+        self.started_at = timezone.now()
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, rows=None):
+        item = {'name': name, 'rows': rows}
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_queries):
+                yield item
+        finally:
+            item['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            item['queries'] = queries[0]
+            self.spans.append(item)
+
+    @property
+    def total_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    @property
+    def total_queries(self):
+        return sum(s['queries'] for s in self.spans)
+
+    def as_list(self):
+        return [dict(s) for s in self.spans]
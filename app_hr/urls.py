@@ -11,6 +11,7 @@ urlpatterns = [
     path('employees/<int:pk>/', views.employee_detail_view, name='employee_detail'), 
     path('employees/<int:pk>/year-summary/', views.employee_year_summary_view, name='employee_year_summary'),
     path('employees/upload/', views.employee_upload_view, name='employee_upload'),
+    path('employees/upload/errors/', views.employee_upload_errors_view, name='employee_upload_errors'),
     path('employees/<int:pk>/year-summary/tax-pdf/', views.employee_year_tax_pdf_view, name='employee_year_tax_pdf'),
     path('hr/employees/<int:pk>/', views.employee_edit_view, name='employee_edit'),
     path('hr/payslips/', views.payslip_list_view, name='payslip_list'),
@@ -22,6 +23,10 @@ urlpatterns = [
     path('hr/attendance/settings/', views.attendance_settings_view, name='attendance_settings'),
     path('attendance/employee-month/', views.attendance_employee_month_view, name='attendance_employee_month'),
     path('attendance/employee-year/', views.attendance_employee_year_view, name='attendance_employee_year'),
+    path('hr/attendance/matrix/', views.attendance_month_matrix_view, name='attendance_month_matrix'),
+    path('hr/attendance/analytics/', views.attendance_analytics_view, name='attendance_analytics'),
+    path('hr/attendance/export/', views.attendance_export_view, name='attendance_export'),
+    path('api/attendance/device-push/', views.device_attendance_push_view, name='device_attendance_push'),
     path('hr/leave/settings/', views.leave_settings_view, name='leave_settings'),
     path('hr/leave/manage/', views.leave_manage_view, name='leave_manage'),
     path('hr/leave/summary/', views.leave_summary_view, name='leave_summary'),
@@ -29,6 +34,14 @@ urlpatterns = [
     path('hr/payroll/periods/', views.payroll_period_list_view, name='payroll_periods'),
     path('hr/payroll/export-csv/', views.payroll_export_csv_view, name='payroll_export_csv'),
     path('hr/payroll/export-bank/', views.payroll_export_bank_view, name='payroll_export_bank'),
+    path('hr/system/write-queue/', views.write_queue_view, name='write_queue'),
+    path('hr/system/write-queue/<int:pk>/', views.write_job_detail_view, name='write_job_detail'),
+    path('hr/system/request-metrics/', views.request_metrics_view, name='request_metrics'),
+    path('hr/system/profiles/', views.profiles_view, name='profiles'),
+    path('hr/system/profiles/<str:profile_id>/', views.profile_detail_view, name='profile_detail'),
+    path('hr/system/metrics/', views.metrics_view, name='metrics'),
+    path('hr/system/memory/', views.memory_traces_view, name='memory_traces'),
+    path('hr/system/slow-queries/', views.slow_queries_view, name='slow_queries'),
     path('hr/system/reset/', views.system_reset_view, name='system_reset'),
     path('tax/profile/', views.tax_profile_view, name='tax_profile'),
     path('dashboard/', views.payroll_dashboard_view, name='payroll_dashboard'),
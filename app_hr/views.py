@@ -1,21 +1,26 @@
 import csv
 import calendar
-from io import TextIOWrapper
+import json
+import time
 from datetime import datetime, date, timedelta
-from django.contrib.auth import authenticate, login, logout
+from django.conf import settings
+from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.template.loader import get_template, render_to_string
 from xhtml2pdf import pisa
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.urls import reverse
-from django.db import transaction
-from django.http import HttpResponseForbidden, HttpResponse
+from django.http import FileResponse, Http404, HttpResponseForbidden, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import RequestDataTooBig
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from decimal import Decimal
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count
 from django.contrib import messages 
+from django.core.paginator import Paginator
 from .forms import (    
     AttendanceUploadForm,
     CompanySettingForm,
@@ -26,7 +31,6 @@ from .forms import (
     PayrollPeriodForm,
     EmployeeForm,
     EmployeeTaxProfileForm,
-    EmployeeImportForm,
 )
 from .models import (
     Employee,
@@ -41,6 +45,68 @@ from .models import (
     LeaveRecord,
     AttendanceRecord,
     EmployeeTaxProfile,
+    AttendanceMonthlySummary,
+    ImportFile,
+    ImportRowHash,
+    WriteJob,
+    PayrollRun,
+)
+from .analytics import (
+    absence_streaks,
+    lateness_ranking,
+    punctuality_trend,
+)
+from .devices import (
+    DEVICE_MAX_EVENTS_PER_REQUEST,
+    authenticate_device,
+    ingest_device_events,
+)
+from .exports import EXPORT_FORMATS, gzip_stream, iter_attendance_export, record_export
+from .imports import (
+    EMPLOYEE_IMPORT_REQUIRED,
+    IMPORT_ERROR_REPORT_LIMIT,
+    import_attendance_csv,
+    import_employee_csv,
+    write_import_error_report,
+)
+from .pagination import approximate_count, get_page_size, keyset_paginate, list_paginate
+from .search import filter_by_employee_search, search_employees
+from .slowqueries import clear_slow_queries, slow_query_log_enabled, slow_query_summary
+from .instrumentation import (
+    clear_request_metrics,
+    endpoint_summary,
+    recent_requests,
+    request_metrics_enabled,
+)
+from .memtrace import clear_traces, memory_budget_bytes, memtrace_enabled, memory_traced, recent_traces
+from .metrics import METRICS_CONTENT_TYPE, PDF_RENDER_SECONDS, metrics_enabled, render_prometheus
+from .profiling import (
+    PROFILE_COOKIE,
+    PROFILE_QUERY_FLAG,
+    delete_profile,
+    list_profiles,
+    profile_path,
+    profiling_enabled,
+)
+from .writequeue import encode_file, enqueue_write, write_queue_enabled, write_queue_metrics
+from .payroll import (
+    UNPAID_REASON_LABELS,
+    compute_unpaid_days,
+    decode_day_breakdown,
+    PAYROLL_STAGE_LABELS,
+    run_payroll,
+)
+from .attendance import (
+    CODE_LABELS,
+    MAX_BOARD_DAYS,
+    STATUS_KEYS,
+    build_attendance_board,
+    build_month_matrix,
+    get_dirty_periods,
+    get_month_status_counts,
+    get_open_period_range,
+    iter_dates,
+    recompute_attendance_statuses,
 )
 
 def hr_required(view_func):
@@ -78,6 +144,16 @@ def hr_logout_view(request):
     logout(request)
     return redirect('app_hr:hr_login')
 
+def _page_query(request):
+    """
+    query string เดิม (ตัวกรอง) ไม่รวม cursor สำหรับลิงก์หน้าถัดไป / ก่อนหน้า
+    """
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('format', None)
+    return params.urlencode()
+
+
 @hr_required
 def employee_list_view(request):
     """
@@ -91,13 +167,43 @@ def employee_list_view(request):
     if status:
         employees = employees.filter(status=status)
 
+    cursor = request.GET.get('cursor')
+    page_size = get_page_size(request.GET.get('size'))
+
+    rank_of = None
     if q:
-        employees = employees.filter(
-            Q(code__icontains=q) |
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q) |
-            Q(department__icontains=q)
-        )
+        # ค้นผ่านดัชนี full-text แล้วเรียงตามความเกี่ยวข้อง
+        employees, rank_of = search_employees(employees, q)
+
+    if rank_of is not None:
+        # ผลค้นหามีเพดาน (EMPLOYEE_SEARCH_LIMIT) -> เรียงใน memory แล้วแบ่งหน้าตามตำแหน่ง
+        ranked = sorted(employees, key=lambda e: rank_of[e.id])
+        page = list_paginate(ranked, cursor, page_size)
+        total_count, total_capped = len(ranked), False
+    else:
+        page = keyset_paginate(employees, ('code', 'id'), cursor, page_size)
+        total_count, total_capped = approximate_count(employees)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {
+                    'id': e.id,
+                    'code': e.code,
+                    'first_name': e.first_name,
+                    'last_name': e.last_name,
+                    'department': e.department,
+                    'position': e.position,
+                    'status': e.status,
+                    'base_salary': str(e.base_salary),
+                }
+                for e in page
+            ],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+            'approx_count': total_count,
+            'count_capped': total_capped,
+        })
 
     # ดึง list สถานะจาก model (ค่า distinct)
     statuses = (
@@ -110,7 +216,11 @@ def employee_list_view(request):
     )
 
     context = {
-        'employees': employees,
+        'employees': page,
+        'page': page,
+        'page_query': _page_query(request),
+        'total_count': total_count,
+        'total_capped': total_capped,
         'q': q,
         'statuses': statuses,
         'selected_status': status,
@@ -156,22 +266,13 @@ def employee_detail_view(request, pk):
         .order_by('-period__year', '-period__month')[:6]
     )
 
-    att_qs = AttendanceRecord.objects.filter(
-        employee=emp,
-        work_date__year=year,
-    )
+    # อ่านจาก rollup รายเดือน (AttendanceMonthlySummary) แทนการนับ AttendanceRecord ทั้งปี
+    status_counts = {key: 0 for key in STATUS_KEYS}
+    for month_counts in get_month_status_counts(year, employee=emp).values():
+        for key, c in month_counts.items():
+            status_counts[key] += c
 
-    status_counts = {
-        'present': 0,
-        'late': 0,
-        'absent': 0,
-        'leave': 0,
-        'holiday': 0,
-    }
-    for row in att_qs.values('status').annotate(c=Count('id')):
-        status_counts[row['status']] = row['c']
-
-    total_days = att_qs.count()
+    total_days = sum(status_counts.values())
 
     leaves_qs = LeaveRecord.objects.filter(
         employee=emp,
@@ -281,6 +382,7 @@ def employee_year_tax_pdf_view(request, pk):
         "generated_at": timezone.now(),
     }
 
+    started = time.perf_counter()
     try:
         # พยายามสร้าง PDF ด้วย weasyprint ก่อน
         from weasyprint import HTML
@@ -291,6 +393,7 @@ def employee_year_tax_pdf_view(request, pk):
         response["Content-Disposition"] = f'inline; filename="{filename}"'
 
         HTML(string=html, base_url=request.build_absolute_uri()).write_pdf(response)
+        PDF_RENDER_SECONDS.observe(time.perf_counter() - started, document='tax_certificate', output='pdf')
         return response
 
     except Exception:
@@ -301,7 +404,9 @@ def employee_year_tax_pdf_view(request, pk):
             "และเมื่อติดตั้ง dependency ของ WeasyPrint ครบแล้ว "
             "หน้านี้จะดาวน์โหลด PDF ให้อัตโนมัติ"
         )
-        return render(request, "app_hr/employee_year_tax_pdf.html", context)
+        response = render(request, "app_hr/employee_year_tax_pdf.html", context)
+        PDF_RENDER_SECONDS.observe(time.perf_counter() - started, document='tax_certificate', output='html')
+        return response
 
 @hr_required
 def employee_year_summary_view(request, pk):
@@ -414,131 +519,110 @@ def employee_edit_view(request, pk):
     }
     return render(request, 'app_hr/employee_form.html', context)
 
+EMPLOYEE_UPLOAD_ERROR_DISPLAY = 200
+
+
 @hr_required
+@memory_traced("employee_upload")
 def employee_upload_view(request):
     """
     นำเข้าพนักงานหลาย ๆ คนจากไฟล์ CSV
     - matching จาก field "code" (รหัสพนักงาน)
-    - ถ้ามี code เดิม -> update
+    - ถ้ามี code เดิม -> update เฉพาะคนที่มีค่าเปลี่ยน
     - ถ้ายังไม่มี -> create ใหม่
+    - เขียนเป็นก้อนด้วย bulk_create / bulk_update (ดู imports.import_employee_rows)
+    - แถวที่มีปัญหาดาวน์โหลดเป็น CSV ได้ (employee_upload_errors)
     """
     created = 0
     updated = 0
+    unchanged = 0
     errors = []
+    has_error_report = False
 
     if request.method == "POST" and request.FILES.get("file"):
         file = request.FILES["file"]
+        data = file.read()  # อ่านครั้งเดียว (อ่านซ้ำจะได้ bytes ว่าง)
+
+        if write_queue_enabled():
+            job = enqueue_write(
+                "employee_import",
+                {"file": encode_file(data), "filename": file.name},
+                label=f"นำเข้าพนักงาน {file.name}",
+                user=request.user,
+            )
+            messages.info(request, f"ส่งไฟล์ {file.name} เข้าคิวนำเข้าแล้ว (งาน #{job.pk})")
+            return redirect("app_hr:write_job_detail", pk=job.pk)
 
-        try:
-            # รองรับไฟล์ที่ save จาก Excel เป็น UTF-8 (มี BOM)
-            decoded = file.read().decode("utf-8-sig")
-        except UnicodeDecodeError:
-            decoded = file.read().decode("utf-8", errors="ignore")
-
-        reader = csv.DictReader(decoded.splitlines())
-
-        # คอลัมน์ที่รองรับ (ไม่ต้องมีครบทุกคอลัมน์ก็ได้ แต่ต้องมีอย่างน้อย code, first_name, last_name)
-        required_cols = ["code", "first_name", "last_name"]
-        missing_cols = [c for c in required_cols if c not in reader.fieldnames]
+        report = import_employee_csv(data, file.name)
+        created, updated, unchanged = report["created"], report["updated"], report["unchanged"]
 
-        if missing_cols:
+        if report["file_unchanged"]:
+            messages.info(request, "ไฟล์นี้เคยนำเข้าครบแล้ว (เนื้อหาเหมือนเดิมทุกแถว) ไม่มีข้อมูลเปลี่ยน")
+        elif report["missing_cols"]:
             messages.error(
                 request,
-                f"ไฟล์ CSV ต้องมีหัวคอลัมน์อย่างน้อย: {', '.join(required_cols)} "
-                f"(ขาด: {', '.join(missing_cols)})"
+                f"ไฟล์ CSV ต้องมีหัวคอลัมน์อย่างน้อย: {', '.join(EMPLOYEE_IMPORT_REQUIRED)} "
+                f"(ขาด: {', '.join(report['missing_cols'])})"
             )
         else:
-            row_number = 1  # นับเริ่มจาก 1 = header
-            for row in reader:
-                row_number += 1
-
-                try:
-                    code = (row.get("code") or "").strip()
-                    first_name = (row.get("first_name") or "").strip()
-                    last_name = (row.get("last_name") or "").strip()
-
-                    if not code or not first_name or not last_name:
-                        raise ValueError("ต้องมี code, first_name, last_name ครบ")
-
-                    # ฟิลด์อื่น ๆ (optional)
-                    position = (row.get("position") or "").strip() or None
-                    department = (row.get("department") or "").strip() or None
-                    phone_number = (row.get("phone_number") or "").strip() or None
-                    address = (row.get("address") or "").strip() or None
-                    citizen_id = (row.get("citizen_id") or "").strip() or None
-                    bank_name = (row.get("bank_name") or "").strip() or None
-                    bank_account_no = (row.get("bank_account_no") or "").strip() or None
-
-                    # status (active / inactive)
-                    status_val = (row.get("status") or "").strip().lower()
-                    if status_val not in ["active", "inactive", ""]:
-                        raise ValueError("status ต้องเป็น active หรือ inactive หรือเว้นว่าง")
-                    if not status_val:
-                        status_val = "active"
-
-                    # hire_date รูปแบบ YYYY-MM-DD
-                    hire_date_raw = (row.get("hire_date") or "").strip()
-                    hire_date = None
-                    if hire_date_raw:
-                        try:
-                            hire_date = datetime.strptime(hire_date_raw, "%Y-%m-%d").date()
-                        except ValueError:
-                            raise ValueError("รูปแบบวันที่ hire_date ต้องเป็น YYYY-MM-DD")
-
-                    # base_salary
-                    base_salary_raw = (row.get("base_salary") or "").replace(",", "").strip()
-                    base_salary = Decimal("0")
-                    if base_salary_raw:
-                        try:
-                            base_salary = Decimal(base_salary_raw)
-                        except Exception:
-                            raise ValueError("base_salary ต้องเป็นตัวเลข เช่น 35000 หรือ 35000.00")
-
-                    # สร้างหรืออัปเดต
-                    obj, is_created = Employee.objects.update_or_create(
-                        code=code,
-                        defaults={
-                            "first_name": first_name,
-                            "last_name": last_name,
-                            "position": position,
-                            "department": department,
-                            "phone_number": phone_number,
-                            "address": address,
-                            "citizen_id": citizen_id,
-                            "bank_name": bank_name,
-                            "bank_account_no": bank_account_no,
-                            "status": status_val,
-                            "hire_date": hire_date,
-                            "base_salary": base_salary,
-                        }
-                    )
-
-                    if is_created:
-                        created += 1
-                    else:
-                        updated += 1
-
-                except Exception as e:
-                    errors.append(f"แถวที่ {row_number}: {e}")
-
-            if errors:
+            if not report["errors"]:
+                request.session.pop("employee_import_errors", None)
+            else:
+                # เก็บไว้ให้ดาวน์โหลดเป็น CSV (จำกัดจำนวนแถว กัน session ใหญ่เกิน)
+                request.session["employee_import_errors"] = {
+                    "fieldnames": report["fieldnames"],
+                    "errors": report["errors"][:IMPORT_ERROR_REPORT_LIMIT],
+                }
+                has_error_report = True
+
+            errors = [
+                f"แถวที่ {row_number}: {message}"
+                for row_number, _, message in report["errors"][:EMPLOYEE_UPLOAD_ERROR_DISPLAY]
+            ]
+            if len(report["errors"]) > EMPLOYEE_UPLOAD_ERROR_DISPLAY:
+                errors.append(
+                    f"... และอีก {len(report['errors']) - EMPLOYEE_UPLOAD_ERROR_DISPLAY} แถว "
+                    f"(ดาวน์โหลดรายงาน error เพื่อดูทั้งหมด)"
+                )
+
+            if report["errors"]:
                 messages.warning(
                     request,
-                    f"นำเข้าสำเร็จบางส่วน: เพิ่มใหม่ {created} คน, อัปเดต {updated} คน, มี error {len(errors)} แถว"
+                    f"นำเข้าสำเร็จบางส่วน: เพิ่มใหม่ {created} คน, อัปเดต {updated} คน, "
+                    f"ไม่เปลี่ยน {unchanged} คน, มี error {len(report['errors'])} แถว"
                 )
             else:
                 messages.success(
                     request,
-                    f"นำเข้าพนักงานสำเร็จ: เพิ่มใหม่ {created} คน, อัปเดต {updated} คน"
+                    f"นำเข้าพนักงานสำเร็จ: เพิ่มใหม่ {created} คน, อัปเดต {updated} คน, ไม่เปลี่ยน {unchanged} คน"
                 )
 
     context = {
         "created": created,
         "updated": updated,
+        "unchanged": unchanged,
         "errors": errors,
+        "has_error_report": has_error_report,
     }
     return render(request, "app_hr/employee_upload.html", context)
 
+
+@hr_required
+def employee_upload_errors_view(request):
+    """
+    ดาวน์โหลด CSV แถวที่นำเข้าไม่ผ่านจากการอัปโหลดล่าสุด (row_number, error + คอลัมน์เดิม)
+    """
+    report = request.session.get("employee_import_errors")
+    if not report:
+        messages.info(request, "ไม่มีรายงาน error จากการนำเข้าล่าสุด")
+        return redirect("app_hr:employee_upload")
+
+    response = HttpResponse(content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = 'attachment; filename="employee_import_errors.csv"'
+    response.write("\ufeff")
+    write_import_error_report(response, report["fieldnames"], report["errors"])
+    return response
+
 @login_required
 def my_payslips_view(request):
     """
@@ -591,16 +675,42 @@ def payslip_list_view(request):
         payslips = payslips.filter(employee__department=dept)
 
     if q:
-        payslips = payslips.filter(
-            Q(employee__first_name__icontains=q) |
-            Q(employee__last_name__icontains=q) |
-            Q(employee__code__icontains=q)
-        )
+        payslips = filter_by_employee_search(payslips, q, prefix='employee__')
 
-    payslips = payslips.order_by('employee__code')
+    page = keyset_paginate(
+        payslips,
+        ('employee__code', 'id'),
+        request.GET.get('cursor'),
+        get_page_size(request.GET.get('size')),
+    )
+    total_count, total_capped = approximate_count(payslips)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {
+                    'id': p.id,
+                    'employee_code': p.employee.code,
+                    'employee_name': f"{p.employee.first_name} {p.employee.last_name}",
+                    'period': f"{p.period.month}/{p.period.year}",
+                    'gross_income': str(p.gross_income),
+                    'total_deduction': str(p.total_deduction),
+                    'net_income': str(p.net_income),
+                }
+                for p in page
+            ],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+            'approx_count': total_count,
+            'count_capped': total_capped,
+        })
 
     context = {
-        'payslips': payslips,
+        'payslips': page,
+        'page': page,
+        'page_query': _page_query(request),
+        'total_count': total_count,
+        'total_capped': total_capped,
         'periods': periods,
         'selected_period_id': period_id,
         'q': q,
@@ -610,6 +720,7 @@ def payslip_list_view(request):
     return render(request, 'app_hr/payslip_list.html', context)
 
 @hr_required
+@memory_traced('payroll_export_csv')
 def payroll_export_csv_view(request):
     """
     Export CSV รายการสลิปเงินเดือนในงวดที่เลือก
@@ -649,6 +760,8 @@ def payroll_export_csv_view(request):
         "รับสุทธิ (NET)",
     ])
 
+    started = time.perf_counter()
+    row_count = 0
     for ps in payslips:
         emp = ps.employee
 
@@ -676,10 +789,13 @@ def payroll_export_csv_view(request):
             float(total_deduct),
             float(net),
         ])
+        row_count += 1
 
+    record_export('payroll_csv', row_count, time.perf_counter() - started)
     return response 
 
 @hr_required
+@memory_traced('payroll_export_bank')
 def payroll_export_bank_view(request):
     """
     Export CSV สำหรับจ่ายเงินเดือนผ่านธนาคาร
@@ -721,6 +837,8 @@ def payroll_export_bank_view(request):
         "หมายเหตุ",
     ])
 
+    started = time.perf_counter()
+    row_count = 0
     for ps in payslips:
         emp = ps.employee
 
@@ -747,7 +865,9 @@ def payroll_export_bank_view(request):
             float(net),
             f"งวด {period.month}/{period.year}",
         ])
+        row_count += 1
 
+    record_export('bank_transfer', row_count, time.perf_counter() - started)
     return response
 
 @hr_required
@@ -774,69 +894,28 @@ def payslip_detail_view(request, pk):
     emp = payslip.employee
     period = payslip.period
 
-    # ===== 1) หาวันทำงาน (จันทร์–ศุกร์, ไม่ใช่วันหยุด) =====
-    working_days = []
-    current = period.start_date
-    while current <= period.end_date:
-        if current.weekday() < 5 and not Holiday.objects.filter(date=current).exists():
-            working_days.append(current)
-        current += timedelta(days=1)
-
-    # ===== 2) Attendance ของพนักงานคนนี้ในงวดนี้ =====
-    att_qs = AttendanceRecord.objects.filter(
-        employee=emp,
-        work_date__gte=period.start_date,
-        work_date__lte=period.end_date,
-    )
-    att_map = {a.work_date: a for a in att_qs}
-
-    # ===== 3) Leave ของพนักงานในงวดนี้ (เฉพาะที่อนุมัติแล้ว) =====
-    leave_qs = LeaveRecord.objects.filter(
-        employee=emp,
-        status='approved',
-        start_date__lte=period.end_date,
-        end_date__gte=period.start_date,
-    ).select_related('leave_type')
+    # ===== วันทำงาน + วันไม่จ่าย =====
+    # ใช้ข้อมูลที่บันทึกไว้ตอนรันเงินเดือน (ตรงกับยอดที่จ่ายจริง ไม่ต้อง query เพิ่ม)
+    decoded = decode_day_breakdown(period.start_date, period.end_date, payslip.day_breakdown)
+    if decoded:
+        working_day_count, unpaid_dates = decoded
+    else:
+        # สลิปเก่าที่ยังไม่มีข้อมูลรายวัน -> คำนวณจาก Attendance & Leave ปัจจุบัน
+        working_days, unpaid_map = compute_unpaid_days(period, [emp.id])
+        working_day_count = len(working_days)
+        unpaid_dates = unpaid_map[emp.id].unpaid_dates
 
-    # สร้าง set "วันลาที่ไม่จ่าย"
-    unpaid_leave_days = set()
-    for lr in leave_qs:
-        if lr.leave_type and not lr.leave_type.is_paid:
-            start = max(lr.start_date, period.start_date)
-            end = min(lr.end_date, period.end_date)
-            cur = start
-            while cur <= end:
-                if cur in working_days:
-                    unpaid_leave_days.add(cur)
-                cur += timedelta(days=1)
-
-    # ===== 4) สร้าง list รายละเอียดวันหักไม่จ่าย =====
-    unpaid_details = []
-    unpaid_days_count = 0
-
-    for d in working_days:
-        reason = None
-        if d in unpaid_leave_days:
-            reason = 'ลา (ไม่จ่ายเงิน)'
-        else:
-            att = att_map.get(d)
-            if not att:
-                reason = 'ไม่มีบันทึกเข้างาน (ขาด)'
-            elif att.status == 'absent':
-                reason = 'ขาดงาน'
-
-        if reason:
-            unpaid_days_count += 1
-            unpaid_details.append({
-                'date': d,
-                'reason': reason,
-            })
+    unpaid_details = [
+        {'date': d, 'reason': UNPAID_REASON_LABELS[reason]}
+        for d, reason in unpaid_dates
+    ]
+    unpaid_days_count = len(unpaid_dates)
 
     context = {
         'payslip': payslip,
         'items': items,
         'unpaid_item': unpaid_item,
-        'working_day_count': len(working_days),
+        'working_day_count': working_day_count,
         'unpaid_days_count': unpaid_days_count,
         'unpaid_details': unpaid_details,
     }
@@ -846,6 +925,7 @@ def render_to_pdf(template_src, context_dict):
     """
     helper ใช้ xhtml2pdf แปลง HTML -> PDF
     """
+    started = time.perf_counter()
     template = get_template(template_src)
     html = template.render(context_dict)
 
@@ -853,6 +933,12 @@ def render_to_pdf(template_src, context_dict):
     response['Content-Disposition'] = 'inline; filename="payslip.pdf"'
 
     pisa_status = pisa.CreatePDF(html, dest=response)
+    # สร้างไม่สำเร็จแยก output='error' ไม่ปนกับเวลาของ PDF ที่ได้จริง
+    PDF_RENDER_SECONDS.observe(
+        time.perf_counter() - started,
+        document=template_src.rsplit('/', 1)[-1],
+        output='error' if pisa_status.err else 'pdf',
+    )
     if pisa_status.err:
         return HttpResponse("เกิดข้อผิดพลาดในการสร้าง PDF", status=500)
     return response
@@ -900,7 +986,8 @@ def payslip_pdf_view(request, pk):
         'company': company,
     }
     # ตรงนี้ยังเป็น HTML ปกติ ให้ browser print เป็น PDF เอา
-    return render(request, 'app_hr/payslip_pdf.html', context)
+    with PDF_RENDER_SECONDS.time(document='payslip', output='html'):
+        return render(request, 'app_hr/payslip_pdf.html', context)
 
 @login_required
 def payroll_dashboard_view(request):
@@ -983,68 +1070,87 @@ def payroll_dashboard_view(request):
 @hr_required
 def attendance_daily_view(request):
     """
-    ดูสรุปการเข้างานว่า ใคร ขาด / ลา / สาย / ปกติ ในวันหนึ่ง
+    ดูสรุปการเข้างานว่า ใคร ขาด / ลา / สาย / ปกติ ในวันหนึ่ง หรือช่วงวันที่
     ?date=YYYY-MM-DD (ถ้าไม่ส่งมา ใช้วันนี้)
+    ?end=YYYY-MM-DD  (ถ้าส่งมา จะแสดงเป็นกระดานช่วง date..end เช่น ทั้งสัปดาห์)
+    ?dept=แผนก       (กรองตามแผนก)
     """
     date_str = request.GET.get('date')
-    if date_str:
-        target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-    else:
+    end_str = request.GET.get('end')
+    dept = request.GET.get('dept', '').strip()
+
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d").date() if date_str else date.today()
+    except ValueError:
         target_date = date.today()
 
-    employees = Employee.objects.filter(status='active').order_by('code')
+    try:
+        end_date = datetime.strptime(end_str, "%Y-%m-%d").date() if end_str else target_date
+    except ValueError:
+        end_date = target_date
 
-    # preload attendance ของวันนั้น
-    attendance_map = {
-        (a.employee_id): a
-        for a in AttendanceRecord.objects.filter(work_date=target_date).select_related('employee')
-    }
+    if end_date < target_date:
+        end_date = target_date
+    # จำกัดช่วงไม่ให้ยาวเกิน MAX_BOARD_DAYS วัน
+    max_end = target_date + timedelta(days=MAX_BOARD_DAYS - 1)
+    if end_date > max_end:
+        end_date = max_end
+        messages.warning(request, f"แสดงได้สูงสุด {MAX_BOARD_DAYS} วันต่อครั้ง")
 
-    rows = []
-    for emp in employees:
-        att = attendance_map.get(emp.id)
-
-        # เดี๋ยวคำนวณสถานะให้ ถ้าไม่มี record ก็ลองประเมินจากวันหยุด/ลา
-        status = 'absent'
-        check_in = None
-        check_out = None
-        remark = ''
-
-        # วันหยุด?
-        if Holiday.objects.filter(date=target_date).exists():
-            status = 'holiday'
-        else:
-            # ลา?
-            leave_qs = LeaveRecord.objects.filter(
-                employee=emp,
-                status='approved',
-                start_date__lte=target_date,
-                end_date__gte=target_date,
-            )
-            if leave_qs.exists():
-                status = 'leave'
-
-        if att:
-            # ใช้สถานะจาก AttendanceRecord (ซึ่งคำนวนไว้แล้ว)
-            status = att.status
-            check_in = att.check_in
-            check_out = att.check_out
-            remark = att.remark or ''
-
-        rows.append({
-            'employee': emp,
-            'status': status,
-            'check_in': check_in,
-            'check_out': check_out,
-            'remark': remark,
-        })
+    rows, status_counts = build_attendance_board(target_date, end_date, department=dept or None)
+
+    departments = (
+        Employee.objects
+        .exclude(department__isnull=True)
+        .exclude(department__exact='')
+        .values_list('department', flat=True)
+        .distinct()
+        .order_by('department')
+    )
 
     context = {
         'target_date': target_date,
+        'end_date': end_date,
+        'is_range': end_date != target_date,
         'rows': rows,
+        'status_counts': status_counts,
+        'departments': departments,
+        'selected_dept': dept,
     }
     return render(request, 'app_hr/attendance_daily.html', context)
 
+def _report_attendance_restatus(request, changed_count, changed_dates):
+    """
+    แจ้งผลการคำนวณสถานะเข้างานใหม่: จำนวน record ที่เปลี่ยน + งวดเงินเดือนที่ต้องรันใหม่
+    """
+    if not changed_count:
+        messages.info(request, "คำนวณสถานะเข้างานใหม่แล้ว: ไม่มี record ที่สถานะเปลี่ยน")
+        return
+
+    dirty_periods = get_dirty_periods(changed_dates)
+    msg = f"คำนวณสถานะเข้างานใหม่แล้ว: เปลี่ยน {changed_count} record"
+    if dirty_periods:
+        labels = ", ".join(f"{p.month:02d}/{p.year}" for p in dirty_periods)
+        msg += f" | งวดที่ควรรันเงินเดือนใหม่: {labels}"
+    messages.warning(request, msg)
+
+
+def _restatus_attendance(request, start, end):
+    """
+    คำนวณสถานะเข้างานช่วง start..end ใหม่ (เปิดคิวงานเขียนอยู่ -> ส่งเข้าคิวแทน)
+    """
+    if write_queue_enabled():
+        job = enqueue_write(
+            'attendance_recompute',
+            {'start': start.isoformat(), 'end': end.isoformat()},
+            label=f"คำนวณสถานะเข้างานใหม่ {start} ถึง {end}",
+            user=request.user,
+        )
+        messages.info(request, f"ส่งงานคำนวณสถานะเข้างานใหม่เข้าคิวแล้ว (งาน #{job.pk})")
+        return
+    _report_attendance_restatus(request, *recompute_attendance_statuses(start, end))
+
+
 @hr_required
 def attendance_settings_view(request):
     """
@@ -1060,6 +1166,13 @@ def attendance_settings_view(request):
             if settings_form.is_valid():
                 settings_form.save()
                 messages.success(request, "บันทึกการตั้งค่าเวลาเข้างานเรียบร้อยแล้ว")
+
+                # เวลาเข้า/เลิกงาน/นาทีสายเปลี่ยน -> คำนวณสถานะใหม่เฉพาะงวดที่ยังไม่ปิด
+                status_fields = {'work_start_time', 'late_after_minutes', 'work_end_time'}
+                if status_fields & set(settings_form.changed_data):
+                    open_range = get_open_period_range()
+                    if open_range:
+                        _restatus_attendance(request, *open_range)
                 return redirect('app_hr:attendance_settings')
 
         # เพิ่มวันหยุดใหม่
@@ -1067,8 +1180,9 @@ def attendance_settings_view(request):
             settings_form = CompanySettingForm(instance=settings_obj)
             holiday_form = HolidayForm(request.POST)
             if holiday_form.is_valid():
-                holiday_form.save()
+                holiday = holiday_form.save()
                 messages.success(request, "เพิ่มวันหยุดใหม่เรียบร้อยแล้ว")
+                _restatus_attendance(request, holiday.date, holiday.date)
                 return redirect('app_hr:attendance_settings')
 
         # ลบวันหยุด
@@ -1077,8 +1191,13 @@ def attendance_settings_view(request):
             holiday_form = HolidayForm()
             holiday_id = request.POST.get('delete_holiday_id')
             if holiday_id:
+                holiday_dates = list(
+                    Holiday.objects.filter(id=holiday_id).values_list('date', flat=True)
+                )
                 Holiday.objects.filter(id=holiday_id).delete()
                 messages.success(request, "ลบวันหยุดเรียบร้อยแล้ว")
+                for d in holiday_dates:
+                    _restatus_attendance(request, d, d)
                 return redirect('app_hr:attendance_settings')
     else:
         settings_form = CompanySettingForm(instance=settings_obj)
@@ -1094,6 +1213,7 @@ def attendance_settings_view(request):
     return render(request, 'app_hr/attendance_settings.html', context)
 
 @hr_required
+@memory_traced('attendance_upload')
 def attendance_upload_view(request):
     """
     หน้าอัปโหลด CSV ลงเวลาเข้า–ออกงาน
@@ -1103,78 +1223,22 @@ def attendance_upload_view(request):
 
     if request.method == 'POST' and form.is_valid():
         f = form.cleaned_data['file']
-        decoded = TextIOWrapper(f.file, encoding='utf-8')
-        reader = csv.DictReader(decoded)
-
-        created = 0
-        updated = 0
-        skipped = 0
-        errors = []
-
-        with transaction.atomic():
-            for i, row in enumerate(reader, start=2):  # เริ่มนับบรรทัดที่ 2 (ข้าม header)
-                code = (row.get('employee_code') or '').strip()
-                date_str = (row.get('date') or '').strip()
-                ci_str = (row.get('check_in') or '').strip()
-                co_str = (row.get('check_out') or '').strip()
-
-                if not code or not date_str:
-                    skipped += 1
-                    errors.append(f"แถว {i}: ไม่มี employee_code หรือ date")
-                    continue
-
-                try:
-                    work_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except ValueError:
-                    skipped += 1
-                    errors.append(f"แถว {i}: รูปแบบวันที่ไม่ถูกต้อง (ควรเป็น YYYY-MM-DD)")
-                    continue
-
-                try:
-                    emp = Employee.objects.get(code=code)
-                except Employee.DoesNotExist:
-                    skipped += 1
-                    errors.append(f"แถว {i}: ไม่พบพนักงาน code={code}")
-                    continue
-
-                def parse_time(t_str):
-                    if not t_str:
-                        return None
-                    try:
-                        return datetime.strptime(t_str, "%H:%M").time()
-                    except ValueError:
-                        return None
-
-                ci = parse_time(ci_str)
-                co = parse_time(co_str)
-
-                att, is_created = AttendanceRecord.objects.get_or_create(
-                    employee=emp,
-                    work_date=work_date,
-                    defaults={
-                        'check_in': ci,
-                        'check_out': co,
-                        'source': 'csv',
-                    }
-                )
-                if not is_created:
-                    att.check_in = ci
-                    att.check_out = co
-                    att.source = 'csv'
-                    updated += 1
-                else:
-                    created += 1
-
-                # คำนวณสถานะจากกฎ
-                att.auto_calculate_status()
-                att.save()
-
-        report = {
-            'created': created,
-            'updated': updated,
-            'skipped': skipped,
-            'errors': errors,
-        }
+        data = f.read()
+
+        if write_queue_enabled():
+            job = enqueue_write(
+                'attendance_import',
+                {'file': encode_file(data), 'filename': f.name},
+                label=f"นำเข้าเวลาเข้างาน {f.name}",
+                user=request.user,
+            )
+            messages.info(request, f"ส่งไฟล์ {f.name} เข้าคิวนำเข้าแล้ว (งาน #{job.pk})")
+            return redirect('app_hr:write_job_detail', pk=job.pk)
+
+        report = import_attendance_csv(data, f.name)
+        # ไฟล์เดิมที่เคยนำเข้าครบแล้ว -> ไม่ต้องอ่านซ้ำ
+        if report['file_unchanged']:
+            messages.info(request, "ไฟล์นี้เคยนำเข้าครบแล้ว (เนื้อหาเหมือนเดิมทุกแถว) ไม่มีข้อมูลเปลี่ยน")
 
     context = {
         'form': form,
@@ -1291,30 +1355,9 @@ def attendance_employee_year_view(request):
     else:
         employee = employees.first()
 
-    # ดึง attendance ทั้งปีของพนักงานคนนี้
-    qs = AttendanceRecord.objects.filter(
-        employee=employee,
-        work_date__year=year,
-    ).order_by('work_date')
-
-    # เตรียมโครง summary 12 เดือน
+    # อ่านสรุปทั้ง 12 เดือนจาก rollup (AttendanceMonthlySummary)
     months_data = []
-    # สร้าง map เดือน -> dict สถานะ
-    month_status_map = {
-        m: {
-            "present": 0,
-            "late": 0,
-            "absent": 0,
-            "leave": 0,
-            "holiday": 0,
-        }
-        for m in range(1, 13)
-    }
-
-    for rec in qs:
-        m = rec.work_date.month
-        if rec.status in month_status_map[m]:
-            month_status_map[m][rec.status] += 1
+    month_status_map = get_month_status_counts(year, employee=employee)
 
     # แปลงเป็น list สำหรับ template
     for m in range(1, 13):
@@ -1360,6 +1403,206 @@ def attendance_employee_year_view(request):
     }
     return render(request, "app_hr/attendance_employee_year.html", context)
 
+MATRIX_PAGE_SIZE = 100
+MATRIX_EXPORT_CHUNK = 1000
+
+
+@hr_required
+def attendance_month_matrix_view(request):
+    """
+    ตารางการเข้างานรายเดือนแบบ 'ทั้งแผนก / ทั้งบริษัท' (พนักงาน × วันในเดือน)
+    - ?month=&year=&dept=
+    - แบ่งหน้าตามกลุ่มพนักงาน (?page=) ทีละ MATRIX_PAGE_SIZE คน
+    - ?export=csv ส่งออก CSV จากโครงสร้างเดียวกัน
+    """
+    today = timezone.localdate()
+    try:
+        month = int(request.GET.get("month", today.month))
+        year = int(request.GET.get("year", today.year))
+        if not 1 <= month <= 12 or not 1 <= year <= 9999:
+            raise ValueError
+    except ValueError:
+        month = today.month
+        year = today.year
+
+    dept = request.GET.get("dept", "").strip()
+
+    first_day = date(year, month, 1)
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    days = list(iter_dates(first_day, last_day))
+
+    employees = Employee.objects.order_by("code")
+    if dept:
+        employees = employees.filter(department=dept)
+
+    # ===== ส่งออก CSV (เติมตารางทีละก้อนพนักงาน) =====
+    if request.GET.get("export") == "csv":
+        filename = f"attendance_matrix_{year}_{month:02d}.csv"
+        response = HttpResponse(content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        # ใส่ BOM ครั้งเดียวให้ Excel อ่านภาษาไทยได้
+        # (ถ้าใช้ charset=utf-8-sig จะได้ BOM ทุกครั้งที่ writer.writerow)
+        response.write("\ufeff")
+
+        writer = csv.writer(response)
+        writer.writerow(["รหัสพนักงาน", "ชื่อ", "นามสกุล", "แผนก"] + [d.day for d in days])
+
+        emp_rows = list(employees.values_list("id", "code", "first_name", "last_name", "department"))
+        for i in range(0, len(emp_rows), MATRIX_EXPORT_CHUNK):
+            chunk = emp_rows[i:i + MATRIX_EXPORT_CHUNK]
+            matrix = build_month_matrix([r[0] for r in chunk], first_day, last_day)
+            for emp_id, code, first_name, last_name, department in chunk:
+                writer.writerow(
+                    [code, first_name, last_name, department or ""]
+                    + list(matrix[emp_id].decode("ascii"))
+                )
+        return response
+
+    # ===== แสดงผลทีละหน้า =====
+    paginator = Paginator(employees, MATRIX_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get("page"))
+    page_employees = list(page_obj.object_list)
+
+    matrix = build_month_matrix([e.id for e in page_employees], first_day, last_day)
+    rows = [
+        {"employee": emp, "codes": matrix[emp.id].decode("ascii")}
+        for emp in page_employees
+    ]
+
+    departments = (
+        Employee.objects
+        .exclude(department__isnull=True)
+        .exclude(department__exact="")
+        .values_list("department", flat=True)
+        .distinct()
+        .order_by("department")
+    )
+
+    context = {
+        "month": month,
+        "year": year,
+        "months": list(range(1, 13)),
+        "years": [today.year - 1, today.year, today.year + 1],
+        "days": days,
+        "rows": rows,
+        "page_obj": page_obj,
+        "departments": departments,
+        "selected_dept": dept,
+        "code_labels": CODE_LABELS,
+    }
+    return render(request, "app_hr/attendance_month_matrix.html", context)
+
+@hr_required
+def attendance_export_view(request):
+    """
+    ส่งออกข้อมูลการเข้างานดิบตามช่วงวันที่ (สำหรับผู้ตรวจสอบ / ดึงทั้งปี)
+    - ?start=&end=&dept=&status=&format=csv|jsonl&gzip=1
+    - ไม่มี ?download= -> แสดงฟอร์มเลือกเงื่อนไข
+    - stream ทีละก้อนด้วย StreamingHttpResponse (ไม่โหลดทั้งช่วงเข้า memory)
+    """
+    today = timezone.localdate()
+    try:
+        start = datetime.strptime(request.GET.get("start", ""), "%Y-%m-%d").date()
+    except ValueError:
+        start = date(today.year, 1, 1)
+    try:
+        end = datetime.strptime(request.GET.get("end", ""), "%Y-%m-%d").date()
+    except ValueError:
+        end = today
+    if end < start:
+        start, end = end, start
+
+    dept = request.GET.get("dept", "").strip()
+    status = request.GET.get("status", "").strip()
+    if status not in dict(AttendanceRecord.STATUS_CHOICES):
+        status = ""
+    fmt = request.GET.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        fmt = "csv"
+    use_gzip = request.GET.get("gzip") == "1"
+
+    if request.GET.get("download"):
+        chunks = iter_attendance_export(start, end, department=dept or None, status=status or None, fmt=fmt)
+        filename = f"attendance_{start:%Y%m%d}_{end:%Y%m%d}.{fmt}"
+        if fmt == "jsonl":
+            content_type = "application/x-ndjson; charset=utf-8"
+        else:
+            content_type = "text/csv; charset=utf-8"
+
+        if use_gzip:
+            response = StreamingHttpResponse(gzip_stream(chunks), content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(chunks, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    departments = (
+        Employee.objects
+        .exclude(department__isnull=True)
+        .exclude(department__exact="")
+        .values_list("department", flat=True)
+        .distinct()
+        .order_by("department")
+    )
+
+    context = {
+        "start": start,
+        "end": end,
+        "departments": departments,
+        "selected_dept": dept,
+        "status_choices": AttendanceRecord.STATUS_CHOICES,
+        "selected_status": status,
+        "formats": EXPORT_FORMATS,
+        "selected_format": fmt,
+        "use_gzip": use_gzip,
+    }
+    return render(request, "app_hr/attendance_export.html", context)
+
+
+@hr_required
+def attendance_analytics_view(request):
+    """
+    สถิติการเข้างานเชิงวิเคราะห์
+    - อันดับมาสาย (ทั้งบริษัท / ในแผนก)
+    - ขาดงานติดต่อกัน
+    - แนวโน้มการมาตรงเวลารายเดือนตามแผนก
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&dept= (ค่าเริ่มต้น = ต้นปีถึงวันนี้)
+    """
+    today = timezone.localdate()
+    try:
+        start = datetime.strptime(request.GET.get("start", ""), "%Y-%m-%d").date()
+    except ValueError:
+        start = date(today.year, 1, 1)
+    try:
+        end = datetime.strptime(request.GET.get("end", ""), "%Y-%m-%d").date()
+    except ValueError:
+        end = today
+    if end < start:
+        start, end = end, start
+
+    dept = request.GET.get("dept", "").strip()
+
+    departments = (
+        Employee.objects
+        .exclude(department__isnull=True)
+        .exclude(department__exact="")
+        .values_list("department", flat=True)
+        .distinct()
+        .order_by("department")
+    )
+
+    context = {
+        "start": start,
+        "end": end,
+        "departments": departments,
+        "selected_dept": dept,
+        "lateness": lateness_ranking(start, end, department=dept or None),
+        "streaks": absence_streaks(start, end, department=dept or None),
+        "trend": punctuality_trend(start, end, department=dept or None),
+    }
+    return render(request, "app_hr/attendance_analytics.html", context)
+
 @hr_required
 def leave_settings_view(request):
     """
@@ -1400,6 +1643,9 @@ def leave_manage_view(request):
         if form.is_valid():
             obj = form.save()
             messages.success(request, f"บันทึกการลาของ {obj.employee} เรียบร้อยแล้ว")
+            # การลาที่อนุมัติแล้วเปลี่ยนสถานะเข้างานของวันที่ลา (absent -> leave)
+            if obj.status == 'approved':
+                _restatus_attendance(request, obj.start_date, obj.end_date)
             return redirect('app_hr:leave_manage')
     else:
         # default: สถานะเป็น approved
@@ -1456,92 +1702,8 @@ def leave_summary_view(request):
     }
     return render(request, 'app_hr/leave_summary.html', context)
 
-def _get_working_days_and_unpaid_days(employee, period):
-    """
-    คำนวณจำนวนวันทำงานในงวด และจำนวนวัน 'ไม่จ่าย'
-    - วันทำงาน = วันธรรมดา (จ.-ศ.) ที่ไม่ใช่วันหยุดนักขัต (Holiday)
-    - ถ้ามี LeaveRecord ที่ครอบวันนั้นและเป็น leave แบบจ่ายเงิน -> ไม่นับเป็นไม่จ่าย
-    - ถ้ามี LeaveRecord แบบไม่จ่าย -> นับเป็นวันไม่จ่าย
-    - ถ้ามี AttendanceRecord ในวันนั้น -> ถือว่ามาทำงาน
-    - ถ้าไม่มี AttendanceRecord และไม่มีลาจ่าย -> นับเป็นไม่จ่าย
-    """
-    from .models import Holiday, AttendanceRecord, LeaveRecord  # กันชื่อซ้ำ
-
-    start = period.start_date
-    end = period.end_date
+PAYROLL_RECENT_RUNS = 10
 
-    # เตรียม set วันหยุด เพื่อ lookup เร็ว ๆ
-    holiday_dates = set(
-        Holiday.objects.filter(date__range=(start, end))
-        .values_list('date', flat=True)
-    )
-
-    working_days = 0
-    unpaid_days = 0
-
-    current = start
-    while current <= end:
-        # ข้ามเสาร์-อาทิตย์
-        if current.weekday() >= 5:
-            current += timedelta(days=1)
-            continue
-
-        # ข้ามวันหยุดนักขัต
-        if current in holiday_dates:
-            current += timedelta(days=1)
-            continue
-
-        working_days += 1
-
-        # เช็คว่ามีการลาไหม
-        leave_qs = LeaveRecord.objects.filter(
-            employee=employee,
-            start_date__lte=current,
-            end_date__gte=current,
-        ).select_related('leave_type')
-
-        if leave_qs.exists():
-            # สมมติว่า leave_type มี field is_paid (ถ้าไม่มี ให้ถือว่าจ่าย)
-            leave = leave_qs.first()
-            is_paid = getattr(leave.leave_type, 'is_paid', True)
-            if not is_paid:
-                unpaid_days += 1
-            # ถ้าลาแบบจ่ายเงิน -> ไม่ถือว่าไม่จ่าย
-            current += timedelta(days=1)
-            continue
-
-        # ไม่มีลา → เช็คการเข้างาน
-        att = AttendanceRecord.objects.filter(
-            employee=employee,
-            date=current,
-        ).first()
-
-        if att is None:
-            # ไม่มีบันทึกเข้างานเลย -> ขาดงาน (ไม่จ่าย)
-            unpaid_days += 1
-        else:
-            # ถ้า model คุณมี status เช่น 'absent' ให้เพิ่ม logic ตรงนี้ได้
-            if getattr(att, 'status', 'present') == 'absent':
-                unpaid_days += 1
-
-        current += timedelta(days=1)
-
-    return working_days, unpaid_days
-
-
-def _get_unpaid_deduction_type():
-    """
-    คืน DeductionType สำหรับ 'หักวันไม่จ่าย'
-    ถ้าไม่มีก็สร้างให้เลย (code = UNPAID)
-    """
-    from .models import DeductionType
-    dt, created = DeductionType.objects.get_or_create(
-        code='UNPAID',
-        defaults={
-            'name': 'หักวันไม่จ่าย',
-        }
-    )
-    return dt
 
 @hr_required
 def payroll_run_view(request):
@@ -1556,166 +1718,20 @@ def payroll_run_view(request):
     if request.method == 'POST' and form.is_valid():
         period = form.cleaned_data['period']
 
-        # ===== 1) ประเภท BASE / UNPAID =====
-        base_type, _ = EarningType.objects.get_or_create(
-            code='BASE_SALARY',
-            defaults={
-                'name': 'เงินเดือนพื้นฐาน',
-                'is_taxable': True,
-                'is_ssf': True,
-            }
-        )
-        unpaid_type, _ = DeductionType.objects.get_or_create(
-            code='UNPAID',
-            defaults={
-                'name': 'หักวันไม่จ่าย',
-                'is_tax': False,
-                'is_ssf': False,
-            }
-        )
-
-        employees = Employee.objects.filter(status='active').order_by('code')
-
-        # ===== 2) list วันทำงานจริงในงวดนี้ (จันทร์–ศุกร์ + ไม่ใช่วันหยุด) =====
-        working_days = []
-        current = period.start_date
-        while current <= period.end_date:
-            if current.weekday() < 5 and not Holiday.objects.filter(date=current).exists():
-                working_days.append(current)
-            current += timedelta(days=1)
-
-        working_day_count = len(working_days) or 1  # กันหาร 0
-
-        # ===== 3) preload Attendance & Leave =====
-        att_qs = AttendanceRecord.objects.filter(
-            work_date__gte=period.start_date,
-            work_date__lte=period.end_date,
-            employee__in=employees,
-        ).select_related('employee')
-        att_map = {(a.employee_id, a.work_date): a for a in att_qs}
-
-        leave_qs = LeaveRecord.objects.filter(
-            status='approved',
-            employee__in=employees,
-            start_date__lte=period.end_date,
-            end_date__gte=period.start_date,
-        ).select_related('employee', 'leave_type')
-
-        # set สำหรับ “วันลาที่ไม่จ่าย” -> (emp_id, date)
-        unpaid_leave_days = set()
-        for lr in leave_qs:
-            if lr.leave_type and not lr.leave_type.is_paid:
-                start = max(lr.start_date, period.start_date)
-                end = min(lr.end_date, period.end_date)
-                cur = start
-                while cur <= end:
-                    if cur in working_days:
-                        unpaid_leave_days.add((lr.employee_id, cur))
-                    cur += timedelta(days=1)
-
-        created = 0
-        updated = 0
-        skipped = 0
-
-        # ===== 4) loop ทีละพนักงาน =====
-        for emp in employees:
-            if not emp.base_salary:
-                skipped += 1
-                continue
-
-            base_salary = Decimal(emp.base_salary)
-
-            # --- 4.1 นับจำนวน "unpaid days" ---
-            unpaid_days = 0
-
-            for d in working_days:
-                # ลาแบบไม่จ่าย
-                if (emp.id, d) in unpaid_leave_days:
-                    unpaid_days += 1
-                    continue
-
-                att = att_map.get((emp.id, d))
-
-                if not att:
-                    # ไม่มี attendance, ไม่ลา, ไม่หยุด -> ขาด
-                    unpaid_days += 1
-                    continue
-
-                if att.status == 'absent':
-                    unpaid_days += 1
-                elif att.status == 'leave':
-                    # เคสนี่ส่วนใหญ่ถูกจัดการใน unpaid_leave_days แล้ว
-                    pass
-                else:
-                    # present / late / holiday -> ไม่หัก
-                    pass
-
-            # --- 4.2 คำนวณเงินหักจากวันไม่จ่าย ---
-            daily_rate = (base_salary / Decimal(working_day_count)).quantize(Decimal("0.01"))
-            unpaid_deduction = (daily_rate * Decimal(unpaid_days)).quantize(Decimal("0.01"))
-
-            # ===== 5) สร้าง/อัปเดต Payslip =====
-            payslip, is_created = Payslip.objects.get_or_create(
-                employee=emp,
-                period=period,
-            )
-
-            # 5.1 รายรับ: ฐานเงินเดือน
-            base_item, base_created = PayslipItem.objects.get_or_create(
-                payslip=payslip,
-                item_type='earning',
-                earning_type=base_type,
-                deduction_type=None,
-                defaults={
-                    'name': 'ฐานเงินเดือน',
-                    'amount': base_salary,
-                },
-            )
-            if not base_created:
-                base_item.name = 'ฐานเงินเดือน'
-                base_item.amount = base_salary
-                base_item.earning_type = base_type
-                base_item.deduction_type = None
-                base_item.save(update_fields=['name', 'amount', 'earning_type', 'deduction_type'])
-
-            # 5.2 รายหัก: หักวันไม่จ่าย
-            unpaid_item, unpaid_created = PayslipItem.objects.get_or_create(
-                payslip=payslip,
-                item_type='deduction',
-                earning_type=None,
-                deduction_type=unpaid_type,
-                defaults={
-                    'name': f'หักวันไม่จ่าย {unpaid_days} วัน',
-                    'amount': unpaid_deduction,
-                },
+        if write_queue_enabled():
+            job = enqueue_write(
+                'payroll_run',
+                {'period_id': period.pk, 'user_id': request.user.pk},
+                label=f"รันเงินเดือนงวด {period.month}/{period.year}",
+                user=request.user,
             )
-            if not unpaid_created:
-                unpaid_item.name = f'หักวันไม่จ่าย {unpaid_days} วัน'
-                unpaid_item.amount = unpaid_deduction
-                unpaid_item.deduction_type = unpaid_type
-                unpaid_item.earning_type = None
-                unpaid_item.save(update_fields=['name', 'amount', 'deduction_type', 'earning_type'])
-
-            # ===== 6) คำนวณประกันสังคม + ภาษีหัก ณ ที่จ่าย =====
-            # เมธอดนี้จะ:
-            #   - recalc_totals() เพื่อให้ gross_income เป็นยอดรายรับล่าสุด
-            #   - สร้าง/อัปเดต PayslipItem สำหรับ SOCIAL_SEC และ WHT
-            #   - recalc_totals() อีกครั้งเพื่ออัปเดต net_income
-            payslip.update_social_security_and_tax()
-
-            if is_created:
-                created += 1
-            else:
-                updated += 1
+            messages.info(request, f"ส่งงานรันเงินเดือนงวด {period.month}/{period.year} เข้าคิวแล้ว (งาน #{job.pk})")
+            return redirect('app_hr:write_job_detail', pk=job.pk)
 
-        result = {
-            'created': created,
-            'updated': updated,
-            'skipped': skipped,
-            'period': period,
-            'employee_count': employees.count(),
-            'working_days': working_day_count,
-        }
+        result = run_payroll(period, user=request.user)
+        working_day_count = result['working_days']
+        for span in result['spans']:
+            span['label'] = PAYROLL_STAGE_LABELS.get(span['name'], span['name'])
 
         messages.success(
             request,
@@ -1723,9 +1739,21 @@ def payroll_run_view(request):
             f"(วันทำงาน {working_day_count} วัน) เรียบร้อยแล้ว"
         )
 
+    # เวลาแต่ละขั้นตอนของการรันล่าสุด (เทียบกันว่าขั้นไหนช้าลง)
+    recent_runs = list(PayrollRun.objects.select_related('period', 'run_by')[:PAYROLL_RECENT_RUNS])
+    stage_names = [
+        name for name in PAYROLL_STAGE_LABELS
+        if any(span['name'] == name for run in recent_runs for span in run.spans)
+    ]
+    for run in recent_runs:
+        by_name = {span['name']: span for span in run.spans}
+        run.stage_cells = [by_name.get(name) for name in stage_names]
+
     context = {
         'form': form,
         'result': result,
+        'recent_runs': recent_runs,
+        'stage_headers': [(name, PAYROLL_STAGE_LABELS[name]) for name in stage_names],
     }
     return render(request, 'app_hr/payroll_run.html', context)
 
@@ -1777,6 +1805,8 @@ def system_reset_view(request):
         Holiday
         LeaveType
         CompanySetting
+        ประวัติการนำเข้า CSV (ImportFile / ImportRowHash)
+        คิวงานเขียน (WriteJob)
 
     เหลือ:
         เฉพาะ Django User / สิ่งนอก app_hr
@@ -1812,7 +1842,11 @@ def system_reset_view(request):
             Payslip.objects.all().delete()
 
             # 2) ข้อมูลเข้างาน + การลา + งวดเงินเดือน
+            AttendanceMonthlySummary.objects.all().delete()
             AttendanceRecord.objects.all().delete()
+            ImportRowHash.objects.all().delete()
+            ImportFile.objects.all().delete()
+            WriteJob.objects.all().delete()
             LeaveRecord.objects.all().delete()
             PayrollPeriod.objects.all().delete()
 
@@ -1882,3 +1916,337 @@ def tax_profile_view(request):
         "form": form,
     }
     return render(request, "app_hr/tax_profile.html", context)
+
+
+def _device_token(request):
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        return auth[len("Bearer "):].strip()
+    return request.headers.get("X-Device-Token", "").strip()
+
+
+@csrf_exempt
+@require_POST
+def device_attendance_push_view(request):
+    """
+    API ให้เครื่องลงเวลาส่ง event เข้ามาเป็น batch
+    - ยืนยันตัวตนด้วย header Authorization: Bearer <token> (หรือ X-Device-Token)
+    - body = JSON array, {"events": [...]} หรือ NDJSON (1 event ต่อบรรทัด)
+    - ตอบกลับผลราย event (accepted / duplicate / rejected)
+    """
+    device = authenticate_device(_device_token(request))
+    if device is None:
+        return JsonResponse({"error": "token ไม่ถูกต้องหรือเครื่องถูกปิดใช้งาน"}, status=401)
+
+    try:
+        body = request.body.decode("utf-8")
+    except RequestDataTooBig:
+        return JsonResponse({"error": "ข้อมูลใหญ่เกินกำหนด แบ่งส่งเป็นหลาย batch"}, status=413)
+    except UnicodeDecodeError:
+        return JsonResponse({"error": "body ต้องเป็น UTF-8"}, status=400)
+
+    try:
+        if request.content_type in ("application/x-ndjson", "application/jsonl"):
+            events = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            payload = json.loads(body)
+            events = payload.get("events") if isinstance(payload, dict) else payload
+    except ValueError:
+        return JsonResponse({"error": "JSON ไม่ถูกต้อง"}, status=400)
+
+    if not isinstance(events, list):
+        return JsonResponse({"error": "ต้องส่ง events เป็น list"}, status=400)
+    if len(events) > DEVICE_MAX_EVENTS_PER_REQUEST:
+        return JsonResponse(
+            {"error": f"ส่งได้ไม่เกิน {DEVICE_MAX_EVENTS_PER_REQUEST} event ต่อครั้ง"},
+            status=413,
+        )
+
+    return JsonResponse(ingest_device_events(device, events))
+
+
+WRITE_JOB_LIST_LIMIT = 50
+WRITE_JOB_ERROR_DISPLAY = 200
+WRITE_JOB_RESULT_LABELS = {
+    'created': 'สร้างใหม่',
+    'updated': 'อัปเดต',
+    'unchanged': 'ไม่เปลี่ยน',
+    'skipped': 'ข้าม',
+    'employee_count': 'จำนวนพนักงาน',
+    'working_days': 'วันทำงาน',
+    'ot_employee_count': 'พนักงานที่มี OT',
+    'ot_total': 'ยอด OT รวม',
+    'period': 'งวดเงินเดือน',
+    'start': 'ตั้งแต่วันที่',
+    'end': 'ถึงวันที่',
+    'changed_count': 'record ที่สถานะเปลี่ยน',
+    'dirty_periods': 'งวดที่ควรรันเงินเดือนใหม่',
+    'file_unchanged': 'ไฟล์เคยนำเข้าครบแล้ว',
+    'missing_cols': 'คอลัมน์ที่ขาด',
+    'error_count': 'จำนวนแถวที่มี error',
+    'duration_ms': 'เวลาที่ใช้ (ms)',
+}
+
+
+def _write_job_result_display(result):
+    """
+    แปลงผลของงาน (dict จาก JSON) เป็น [(ชื่อ, ค่า)] + รายการ error สำหรับแสดงผล
+    """
+    rows = []
+    errors = []
+    for key, value in (result or {}).items():
+        if key == 'errors':
+            for item in value[:WRITE_JOB_ERROR_DISPLAY]:
+                # employee_import: [row_number, raw_row, message]
+                errors.append(f"แถวที่ {item[0]}: {item[2]}" if isinstance(item, list) else str(item))
+            if len(value) > WRITE_JOB_ERROR_DISPLAY:
+                errors.append(f"... และอีก {len(value) - WRITE_JOB_ERROR_DISPLAY} แถว")
+            continue
+        if key in ('fieldnames', 'spans', 'run_id'):
+            continue
+        if isinstance(value, dict) and 'month' in value:
+            value = f"{value['month']}/{value['year']}"
+        elif isinstance(value, list):
+            value = ", ".join(str(v) for v in value) or "-"
+        rows.append((WRITE_JOB_RESULT_LABELS.get(key, key), value))
+    return rows, errors
+
+
+@hr_required
+def write_queue_view(request):
+    """
+    สถานะคิวงานเขียน: ความยาวคิว / เวลารอ / เวลาทำงาน + งานล่าสุด
+    ?format=json -> เฉพาะตัวเลข metrics (ใช้กับระบบ monitor)
+    """
+    metrics = write_queue_metrics()
+    if request.GET.get("format") == "json":
+        return JsonResponse(metrics)
+
+    jobs = WriteJob.objects.select_related("requested_by")[:WRITE_JOB_LIST_LIMIT]
+    return render(request, "app_hr/write_queue.html", {"metrics": metrics, "jobs": jobs})
+
+
+@hr_required
+def write_job_detail_view(request, pk):
+    """
+    สถานะ/ผลของงานในคิว 1 งาน (หน้าจะรีเฟรชเองจนกว่างานจะเสร็จ)
+    """
+    job = get_object_or_404(WriteJob.objects.defer("payload"), pk=pk)
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "id": job.pk,
+            "kind": job.kind,
+            "status": job.status,
+            "result": job.result,
+            "error": job.error,
+            "wait_seconds": job.wait_seconds,
+            "run_seconds": job.run_seconds,
+        })
+
+    result_rows, result_errors = _write_job_result_display(job.result)
+    context = {
+        "job": job,
+        "result_rows": result_rows,
+        "result_errors": result_errors,
+        "queue_position": (
+            WriteJob.objects.filter(status=WriteJob.STATUS_QUEUED, id__lt=job.pk).count() + 1
+            if job.status == WriteJob.STATUS_QUEUED else None
+        ),
+    }
+    return render(request, "app_hr/write_job_detail.html", context)
+
+
+REQUEST_METRICS_ORDERINGS = {
+    'p95_ms': 'เวลา p95',
+    'max_ms': 'เวลาสูงสุด',
+    'total_ms': 'เวลารวม',
+    'avg_queries': 'query เฉลี่ย',
+    'max_queries': 'query สูงสุด',
+    'hits': 'จำนวนครั้ง',
+}
+
+
+@hr_required
+def request_metrics_view(request):
+    """
+    endpoint ที่ช้า / query เยอะ จาก ring buffer ของ QueryMetricsMiddleware (process นี้)
+    - ?order=p95_ms|max_ms|total_ms|avg_queries|max_queries|hits
+    - ?format=json -> ตารางสรุปเป็น JSON
+    - POST clear=1 -> ล้าง buffer
+    """
+    if request.method == "POST" and request.POST.get("clear"):
+        clear_request_metrics()
+        messages.success(request, "ล้างข้อมูลการวัดแล้ว")
+        return redirect("app_hr:request_metrics")
+
+    order = request.GET.get("order", "p95_ms")
+    if order not in REQUEST_METRICS_ORDERINGS:
+        order = "p95_ms"
+    rows = endpoint_summary(order_by=order)
+
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "enabled": request_metrics_enabled(),
+            "order": order,
+            "endpoints": [
+                {**{k: v for k, v in row.items() if k != "worst"},
+                 "worst_path": row["worst"]["path"],
+                 "worst_slowest_queries": row["worst"]["slowest"]}
+                for row in rows
+            ],
+        })
+
+    context = {
+        "enabled": request_metrics_enabled(),
+        "rows": rows,
+        "order": order,
+        "orderings": REQUEST_METRICS_ORDERINGS,
+        "sample_count": len(recent_requests()),
+    }
+    return render(request, "app_hr/request_metrics.html", context)
+
+
+@hr_required
+def profiles_view(request):
+    """
+    profile ล่าสุดจาก ProfilingMiddleware + ปุ่มเปิด/ปิด profile ทุกหน้า (cookie) ของผู้ใช้คนนี้
+    """
+    if request.method == "POST":
+        action = request.POST.get("action")
+        response = redirect("app_hr:profiles")
+        if action == "enable":
+            response.set_cookie(PROFILE_COOKIE, "1", max_age=60 * 60, httponly=True, samesite="Lax")
+            messages.success(request, "เปิด profile ทุกหน้าแล้ว (1 ชั่วโมง หรือจนกว่าจะกดปิด)")
+        elif action == "disable":
+            response.delete_cookie(PROFILE_COOKIE)
+            messages.success(request, "ปิด profile ทุกหน้าแล้ว")
+        elif action == "delete":
+            delete_profile(request.POST.get("profile_id", ""))
+            messages.success(request, "ลบ profile แล้ว")
+        return response
+
+    context = {
+        "enabled": profiling_enabled(),
+        "cookie_on": request.COOKIES.get(PROFILE_COOKIE) == "1",
+        "query_flag": PROFILE_QUERY_FLAG,
+        "profiles": list_profiles(),
+    }
+    return render(request, "app_hr/profiles.html", context)
+
+
+@hr_required
+def profile_detail_view(request, profile_id):
+    """
+    call tree + ตาราง cumulative ของ profile (ข้อความ) หรือ ?download=1 -> ไฟล์ .prof
+    """
+    if request.GET.get("download"):
+        path = profile_path(profile_id, ".prof")
+        if path is None:
+            raise Http404("ไม่พบ profile")
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name)
+
+    path = profile_path(profile_id, ".txt")
+    if path is None:
+        raise Http404("ไม่พบ profile")
+    meta = next((p for p in list_profiles() if p["id"] == profile_id), {"id": profile_id})
+    context = {
+        "meta": meta,
+        "summary": path.read_text(encoding="utf-8"),
+    }
+    return render(request, "app_hr/profile_detail.html", context)
+
+
+@hr_required
+def memory_traces_view(request):
+    """
+    memory สูงสุดของงานก้อนใหญ่ล่าสุด (tracemalloc, process นี้) ใหม่สุดก่อน
+    - ?format=json -> JSON
+    - POST clear=1 -> ล้างรายการ
+    """
+    if request.method == "POST" and request.POST.get("clear"):
+        clear_traces()
+        messages.success(request, "ล้างผลการวัด memory แล้ว")
+        return redirect("app_hr:memory_traces")
+
+    traces = recent_traces()[::-1]
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "enabled": memtrace_enabled(),
+            "traces": [{**t, "at": t["at"].isoformat()} for t in traces],
+        })
+
+    context = {
+        "enabled": memtrace_enabled(),
+        "traces": traces,
+        "default_budget": memory_budget_bytes(""),
+    }
+    return render(request, "app_hr/memory_traces.html", context)
+
+SLOW_QUERY_ORDERINGS = {
+    'total_ms': 'เวลารวม',
+    'p95_ms': 'เวลา p95',
+    'max_ms': 'เวลาสูงสุด',
+    'count': 'จำนวนครั้ง',
+}
+
+
+@hr_required
+def slow_queries_view(request):
+    """
+    SQL ที่ช้ากว่า HR_SLOW_QUERY_MS แยกตาม fingerprint + EXPLAIN ของครั้งแรก (process นี้)
+    - ?order=total_ms|p95_ms|max_ms|count
+    - ?format=json -> JSON (&download=1 -> ดาวน์โหลดเป็นไฟล์)
+    - POST clear=1 -> ล้างข้อมูล
+    """
+    if request.method == "POST" and request.POST.get("clear"):
+        clear_slow_queries()
+        messages.success(request, "ล้างบันทึก query ที่ช้าแล้ว")
+        return redirect("app_hr:slow_queries")
+
+    order = request.GET.get("order", "total_ms")
+    if order not in SLOW_QUERY_ORDERINGS:
+        order = "total_ms"
+    rows, dropped = slow_query_summary(order_by=order)
+
+    if request.GET.get("format") == "json":
+        response = JsonResponse({
+            "enabled": slow_query_log_enabled(),
+            "threshold_ms": getattr(settings, "HR_SLOW_QUERY_MS", None),
+            "order": order,
+            "dropped": dropped,
+            "queries": [
+                {**row, "first_seen": row["first_seen"].isoformat(), "last_seen": row["last_seen"].isoformat()}
+                for row in rows
+            ],
+        }, json_dumps_params={"ensure_ascii": False})
+        if request.GET.get("download"):
+            response["Content-Disposition"] = f'attachment; filename="slow_queries_{timezone.now():%Y%m%d_%H%M%S}.json"'
+        return response
+
+    context = {
+        "enabled": slow_query_log_enabled(),
+        "threshold_ms": getattr(settings, "HR_SLOW_QUERY_MS", None),
+        "rows": rows,
+        "dropped": dropped,
+        "order": order,
+        "orderings": SLOW_QUERY_ORDERINGS,
+    }
+    return render(request, "app_hr/slow_queries.html", context)
+
+def metrics_view(request):
+    """
+    metrics ของทุก process ในรูปแบบ Prometheus text (ให้ Prometheus scrape)
+    - ยืนยันตัวตนด้วย Authorization: Bearer <HR_METRICS_TOKEN>
+      หรือเปิดจาก browser ในฐานะ staff ที่ล็อกอินอยู่
+    - HR_METRICS ปิด -> 404
+    """
+    if not metrics_enabled():
+        raise Http404("ยังไม่ได้เปิด HR_METRICS")
+
+    token = getattr(settings, "HR_METRICS_TOKEN", "")
+    auth = request.headers.get("Authorization", "")
+    token_ok = bool(token) and auth.startswith("Bearer ") and constant_time_compare(auth[7:].strip(), token)
+    if not token_ok and not request.user.is_staff:
+        return HttpResponse("ต้องใช้ token หรือล็อกอินเป็น staff", status=401, content_type="text/plain; charset=utf-8")
+
+    return HttpResponse(render_prometheus(), content_type=METRICS_CONTENT_TYPE)
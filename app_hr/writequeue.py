@@ -0,0 +1,263 @@
+"""
+คิวงานเขียนข้อมูลก้อนใหญ่ (single writer) สำหรับ SQLite
+
+ปัญหา: SQLite เขียนได้ทีละ connection -> รันเงินเดือน + นำเข้า CSV + HR แก้ข้อมูลพร้อมกัน
+จะรอ lock กันจนเจอ "database is locked"
+
+เมื่อเปิด settings.HR_WRITE_QUEUE_ENABLED:
+  - หน้าเว็บไม่ทำงานก้อนใหญ่เอง แต่บันทึก WriteJob (1 INSERT สั้น ๆ) แล้วตอบกลับทันที
+  - writer process ตัวเดียว (manage.py run_write_queue) ดึงงานทีละงานตามลำดับ
+    งานแต่ละแบบเขียนเป็น transaction สั้น ๆ ทีละก้อน (ดู run_payroll / import_*_csv)
+    ระหว่างก้อนผู้ใช้คนอื่นเขียนแทรกได้ ส่วนการอ่านใช้ snapshot ของ WAL ไม่ต้องรอ
+  - ถ้าปิด (ค่าเริ่มต้น) ทุกอย่างทำใน request เหมือนเดิม
+
+เพิ่มงานชนิดใหม่: ใช้ @write_job_handler('kind') กับฟังก์ชันที่รับ payload แล้วคืน dict (JSON ได้)
+"""
+import base64
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .attendance import get_dirty_periods, recompute_attendance_statuses
+from .imports import IMPORT_ERROR_REPORT_LIMIT, import_attendance_csv, import_employee_csv
+from .memtrace import memory_traced
+from .metrics import register_collector
+from .models import PayrollPeriod, WriteJob
+from .payroll import run_payroll
+
+
+WRITE_QUEUE_POLL_SECONDS = 1.0
+WRITE_QUEUE_METRICS_WINDOW = 100  # จำนวนงานล่าสุดที่ใช้คิดเวลารอ / เวลาทำงาน
+
+WRITE_JOB_HANDLERS = {}
+
+
+def write_queue_enabled():
+    return getattr(settings, 'HR_WRITE_QUEUE_ENABLED', False)
+
+
+def write_job_handler(kind):
+    def register(func):
+        WRITE_JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue_write(kind, payload=None, label='', user=None):
+    if kind not in WRITE_JOB_HANDLERS:
+        raise ValueError(f"ไม่รู้จักงานชนิด {kind}")
+    return WriteJob.objects.create(
+        kind=kind,
+        label=label[:200],
+        payload=payload or {},
+        requested_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def encode_file(data):
+    """
+    bytes ของไฟล์ที่อัปโหลด -> string สำหรับเก็บใน payload (JSON)
+    """
+    return base64.b64encode(data).decode('ascii')
+
+
+def decode_file(text):
+    return base64.b64decode(text.encode('ascii'))
+
+
+def _json_safe(value):
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, (date, Decimal)):
+        return str(value)
+    if isinstance(value, PayrollPeriod):
+        return {'id': value.pk, 'month': value.month, 'year': value.year}
+    return value
+
+
+# ===== writer =====
+
+def claim_next_job():
+    """
+    เปลี่ยนงานที่รอนานที่สุดเป็น running แล้วคืนงานนั้น (None = คิวว่าง)
+    UPDATE มีเงื่อนไข status=queued กันสอง writer หยิบงานเดียวกัน
+    """
+    while True:
+        job = (
+            WriteJob.objects
+            .filter(status=WriteJob.STATUS_QUEUED)
+            .order_by('id')
+            .first()
+        )
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = WriteJob.objects.filter(pk=job.pk, status=WriteJob.STATUS_QUEUED).update(
+            status=WriteJob.STATUS_RUNNING, started_at=now,
+        )
+        if claimed:
+            job.status = WriteJob.STATUS_RUNNING
+            job.started_at = now
+            return job
+
+
+def run_write_job(job):
+    """
+    ทำงาน 1 งาน แล้วบันทึกผล (done + result / failed + error)
+    """
+    handler = WRITE_JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"ไม่รู้จักงานชนิด {job.kind}")
+        job.result = _json_safe(handler(job.payload))
+        job.status = WriteJob.STATUS_DONE
+    except Exception as exc:
+        job.status = WriteJob.STATUS_FAILED
+        job.error = f"{exc.__class__.__name__}: {exc}"
+    job.finished_at = timezone.now()
+    # ไม่ต้องเก็บไฟล์ไว้ในคิวหลังทำเสร็จ
+    job.payload = {k: v for k, v in job.payload.items() if k != 'file'}
+    job.save(update_fields=['status', 'result', 'error', 'finished_at', 'payload'])
+    return job
+
+
+def recover_interrupted_jobs():
+    """
+    งานที่ค้าง running ตอน writer เริ่ม = writer ตัวก่อนหยุดกลางทาง -> ถือว่าล้มเหลว
+    (งานทุกแบบรันซ้ำได้ HR ส่งใหม่ได้เลย)
+    """
+    return WriteJob.objects.filter(status=WriteJob.STATUS_RUNNING).update(
+        status=WriteJob.STATUS_FAILED,
+        error='writer หยุดทำงานระหว่างทำงานนี้ กรุณาส่งใหม่',
+        finished_at=timezone.now(),
+    )
+
+
+def process_write_queue(max_jobs=None):
+    """
+    ทำงานในคิวจนคิวว่าง (หรือครบ max_jobs) คืนจำนวนงานที่ทำ
+    """
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_write_job(job)
+        done += 1
+    return done
+
+
+def run_writer(poll_seconds=WRITE_QUEUE_POLL_SECONDS, stop=None):
+    """
+    loop ของ writer process: ทำงานในคิว แล้วหลับ poll_seconds เมื่อคิวว่าง
+    stop = callable คืน True เมื่อต้องการหยุด (ใช้ตอนทดสอบ)
+    """
+    recover_interrupted_jobs()
+    while not (stop and stop()):
+        if not process_write_queue():
+            time.sleep(poll_seconds)
+
+
+# ===== metrics =====
+
+def write_queue_metrics(window=WRITE_QUEUE_METRICS_WINDOW):
+    """
+    สถานะคิว:
+      depth              = งานที่รอคิว
+      running            = งานที่กำลังทำ
+      oldest_wait_seconds = งานที่รอนานที่สุดรอมาแล้วกี่วินาที
+      avg/max_wait_seconds, avg/max_run_seconds = จากงานที่เสร็จล่าสุด window งาน
+      failed_recent      = จำนวนงานล้มเหลวในช่วงเดียวกัน
+    """
+    now = timezone.now()
+    depth = WriteJob.objects.filter(status=WriteJob.STATUS_QUEUED).count()
+    running = WriteJob.objects.filter(status=WriteJob.STATUS_RUNNING).count()
+    oldest = (
+        WriteJob.objects
+        .filter(status=WriteJob.STATUS_QUEUED)
+        .order_by('id')
+        .values_list('enqueued_at', flat=True)
+        .first()
+    )
+
+    recent = list(
+        WriteJob.objects
+        .filter(status__in=(WriteJob.STATUS_DONE, WriteJob.STATUS_FAILED))
+        .order_by('-id')
+        .values_list('status', 'enqueued_at', 'started_at', 'finished_at')[:window]
+    )
+    waits = [(s - e).total_seconds() for _, e, s, _ in recent if s]
+    runs = [(f - s).total_seconds() for _, _, s, f in recent if s and f]
+
+    return {
+        'enabled': write_queue_enabled(),
+        'depth': depth,
+        'running': running,
+        'oldest_wait_seconds': round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+        'window': len(recent),
+        'avg_wait_seconds': round(sum(waits) / len(waits), 3) if waits else 0.0,
+        'max_wait_seconds': round(max(waits), 3) if waits else 0.0,
+        'avg_run_seconds': round(sum(runs) / len(runs), 3) if runs else 0.0,
+        'max_run_seconds': round(max(runs), 3) if runs else 0.0,
+        'failed_recent': sum(1 for status, *_ in recent if status == WriteJob.STATUS_FAILED),
+    }
+
+
+@register_collector
+def _write_queue_collector():
+    """
+    ความยาวคิว ณ ตอน scrape (อ่านจาก DB จึงตรงกันทุก process)
+    """
+    if not write_queue_enabled():
+        return []
+    metrics = write_queue_metrics()
+    return [
+        ('hr_write_queue_depth', 'gauge', 'งานที่รอคิว', [({}, metrics['depth'])]),
+        ('hr_write_queue_running', 'gauge', 'งานที่กำลังทำ', [({}, metrics['running'])]),
+        ('hr_write_queue_oldest_wait_seconds', 'gauge', 'งานที่รอนานที่สุดรอมาแล้วกี่วินาที',
+         [({}, metrics['oldest_wait_seconds'])]),
+    ]
+
+
+# ===== งานที่รองรับ =====
+
+@write_job_handler('payroll_run')
+def _payroll_run_job(payload):
+    period = PayrollPeriod.objects.get(pk=payload['period_id'])
+    user = User.objects.filter(pk=payload.get('user_id')).first() if payload.get('user_id') else None
+    return run_payroll(period, user=user)
+
+
+@write_job_handler('attendance_import')
+@memory_traced('attendance_import_job')
+def _attendance_import_job(payload):
+    return import_attendance_csv(decode_file(payload['file']), payload.get('filename', ''))
+
+
+@write_job_handler('employee_import')
+@memory_traced('employee_import_job')
+def _employee_import_job(payload):
+    report = import_employee_csv(decode_file(payload['file']), payload.get('filename', ''))
+    report['error_count'] = len(report['errors'])
+    report['errors'] = report['errors'][:IMPORT_ERROR_REPORT_LIMIT]
+    return report
+
+
+@write_job_handler('attendance_recompute')
+def _attendance_recompute_job(payload):
+    start = date.fromisoformat(payload['start'])
+    end = date.fromisoformat(payload['end'])
+    dates = {date.fromisoformat(d) for d in payload['dates']} if payload.get('dates') else None
+    changed_count, changed_dates = recompute_attendance_statuses(start, end, dates=dates)
+    return {
+        'start': start,
+        'end': end,
+        'changed_count': changed_count,
+        'dirty_periods': [f"{p.month:02d}/{p.year}" for p in get_dirty_periods(changed_dates)],
+    }
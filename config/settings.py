@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,12 +49,18 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # วัดเวลา/จำนวน query ต่อ request (ทำงานเฉพาะตอน HR_REQUEST_METRICS=1)
+    'app_hr.instrumentation.QueryMetricsMiddleware',
+    # metrics ของ Prometheus: เวลาตอบแยกตาม view (ทำงานเฉพาะตอน HR_METRICS=1)
+    'app_hr.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # cProfile เฉพาะ staff ที่ขอ (?_profile=1 / cookie) ทำงานเฉพาะตอน HR_PROFILING=1
+    'app_hr.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -78,11 +87,107 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# เลือกฐานข้อมูลผ่าน environment
+#   HR_DB_ENGINE=sqlite (ค่าเริ่มต้น) | postgres
+#   HR_DB_CONN_MAX_AGE = วินาทีที่เก็บ connection ไว้ใช้ซ้ำ (0 = เปิด/ปิดทุก request)
+#
+# SQLite: PRAGMA (synchronous, mmap, busy_timeout) ตั้งตอนเปิด connection
+#         WAL เปิดเฉพาะเมื่อตั้ง HR_SQLITE_WAL=1 (ค่านี้ถูกเขียนลงไฟล์ DB ถาวร)
+#         ดู app_hr.db.configure_sqlite_connection / HR_SQLITE_PRAGMAS ด้านล่าง
+# PostgreSQL: ต้องติดตั้ง psycopg เพิ่ม (pip install -r requirements-postgres.txt)
+#   HR_DB_NAME, HR_DB_USER, HR_DB_PASSWORD, HR_DB_HOST, HR_DB_PORT
+
+HR_DB_ENGINE = os.environ.get('HR_DB_ENGINE', 'sqlite').lower()
+HR_DB_CONN_MAX_AGE = int(os.environ.get('HR_DB_CONN_MAX_AGE', '60'))
+
+if HR_DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('HR_DB_NAME', 'hrmanage'),
+            'USER': os.environ.get('HR_DB_USER', 'hrmanage'),
+            'PASSWORD': os.environ.get('HR_DB_PASSWORD', ''),
+            'HOST': os.environ.get('HR_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('HR_DB_PORT', '5432'),
+            'CONN_MAX_AGE': HR_DB_CONN_MAX_AGE,
+            # ตรวจ connection ที่เก็บไว้ก่อนใช้ซ้ำ (กัน connection ที่ server ตัดทิ้งไปแล้ว)
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('HR_DB_CONNECT_TIMEOUT', '5')),
+            },
+        }
+    }
+elif HR_DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('HR_DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': HR_DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # รอ lock (วินาที) ก่อนขึ้น "database is locked"
+                'timeout': int(os.environ.get('HR_SQLITE_BUSY_TIMEOUT', '20')),
+            },
+        }
     }
+else:
+    raise ImproperlyConfigured(f"HR_DB_ENGINE ไม่รู้จัก: {HR_DB_ENGINE!r} (ใช้ sqlite หรือ postgres)")
+
+# คิวงานเขียนก้อนใหญ่ (รันเงินเดือน / นำเข้า CSV / คำนวณสถานะใหม่) ให้ writer ตัวเดียวทำ
+# เปิดแล้วต้องรัน writer process ไว้ด้วย: python manage.py run_write_queue
+HR_WRITE_QUEUE_ENABLED = os.environ.get('HR_WRITE_QUEUE', '0').lower() in ('1', 'true', 'yes')
+
+# วัดเวลา + จำนวน query ต่อ request -> หน้า "endpoint ที่ช้า" + header Server-Timing
+HR_REQUEST_METRICS = os.environ.get('HR_REQUEST_METRICS', '0').lower() in ('1', 'true', 'yes')
+HR_REQUEST_METRICS_BUFFER = int(os.environ.get('HR_REQUEST_METRICS_BUFFER', '500'))
+HR_REQUEST_METRICS_SLOWEST = 5
+
+# profile หน้าเว็บด้วย cProfile ตามคำขอของ staff -> หน้า "profile ล่าสุด"
+HR_PROFILING = os.environ.get('HR_PROFILING', '0').lower() in ('1', 'true', 'yes')
+HR_PROFILE_DIR = Path(os.environ.get('HR_PROFILE_DIR') or BASE_DIR / 'var' / 'profiles')
+HR_PROFILE_MAX_FILES = int(os.environ.get('HR_PROFILE_MAX_FILES', '50'))
+HR_PROFILE_MAX_BYTES = int(os.environ.get('HR_PROFILE_MAX_MB', '200')) * 1024 * 1024
+
+# metrics แบบ Prometheus (รันเงินเดือน / นำเข้า / ส่งออก / PDF / เวลาตอบ) -> app_hr:metrics
+# แต่ละ process เขียนค่าลง HR_METRICS_DIR (ทุก gunicorn worker ต้องใช้โฟลเดอร์เดียวกัน)
+# Prometheus scrape ด้วย header Authorization: Bearer <HR_METRICS_TOKEN>
+HR_METRICS = os.environ.get('HR_METRICS', '0').lower() in ('1', 'true', 'yes')
+HR_METRICS_DIR = Path(os.environ.get('HR_METRICS_DIR') or BASE_DIR / 'var' / 'metrics')
+HR_METRICS_TOKEN = os.environ.get('HR_METRICS_TOKEN', '')
+HR_METRICS_FLUSH_SECONDS = 1.0
+
+# วัด memory สูงสุดของงานใหญ่ด้วย tracemalloc (ช้าลงระหว่างวัด เปิดเฉพาะตอนไล่ปัญหา OOM)
+# งานที่วัด: attendance_upload, employee_upload, payroll_export_csv, payroll_export_bank,
+#           payroll_run, payroll_generate, attendance_import_job, employee_import_job
+# budget (MB) เกิน -> log warning ; ตั้งรายงานได้ เช่น HR_MEMORY_BUDGETS_MB=payroll_run=512,attendance_upload=128
+HR_MEMTRACE = os.environ.get('HR_MEMTRACE', '0').lower() in ('1', 'true', 'yes')
+HR_MEMORY_BUDGET_MB = int(os.environ.get('HR_MEMORY_BUDGET_MB', '256'))
+HR_MEMORY_BUDGETS_MB = {
+    name.strip(): int(mb)
+    for name, mb in (
+        item.split('=', 1) for item in os.environ.get('HR_MEMORY_BUDGETS_MB', '').split(',') if '=' in item
+    )
+}
+HR_MEMTRACE_TOP_SITES = 10
+
+# บันทึก SQL ที่ช้ากว่า HR_SLOW_QUERY_MS (แยกตามรูปแบบ + EXPLAIN ครั้งแรก) -> หน้า "Query ที่ช้า"
+HR_SLOW_QUERY_LOG = os.environ.get('HR_SLOW_QUERY_LOG', '0').lower() in ('1', 'true', 'yes')
+HR_SLOW_QUERY_MS = float(os.environ.get('HR_SLOW_QUERY_MS', '100'))
+HR_SLOW_QUERY_SAMPLES = 200
+HR_SLOW_QUERY_MAX_FINGERPRINTS = 500
+
+# WAL: อ่านได้ระหว่างมีคนเขียน แต่เปลี่ยน header ของไฟล์ DB ถาวร + สร้างไฟล์ -wal / -shm ข้าง ๆ
+# -> เปิดเฉพาะเครื่อง deploy (HR_SQLITE_WAL=1) ไม่ตั้งเองกับไฟล์ DB ที่ commit ไว้
+HR_SQLITE_WAL = os.environ.get('HR_SQLITE_WAL', '0').lower() in ('1', 'true', 'yes')
+
+# PRAGMA ที่ตั้งทุกครั้งที่เปิด connection SQLite ใหม่
+HR_SQLITE_PRAGMAS = {
+    **({'journal_mode': 'WAL'} if HR_SQLITE_WAL else {}),
+    'synchronous': 'NORMAL' if HR_SQLITE_WAL else 'FULL',  # NORMAL ปลอดภัยเฉพาะเมื่อใช้ WAL
+    'busy_timeout': int(os.environ.get('HR_SQLITE_BUSY_TIMEOUT', '20')) * 1000,
+    'mmap_size': int(os.environ.get('HR_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,             # ~64MB page cache ต่อ connection
 }
 
 
@@ -130,3 +235,18 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# log ของ app_hr (เช่น memory เกิน budget) ออก stderr -> journald / log ของ gunicorn
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'app_hr': {
+            'handlers': ['console'],
+            'level': os.environ.get('HR_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}